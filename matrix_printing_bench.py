@@ -0,0 +1,365 @@
+"""Headless benchmarks for the layout and rendering hot paths.
+
+Runs every preset in ``config/`` against the sample backgrounds in
+``uploads/`` and writes the timings as JSON, so two runs can be compared::
+
+    python -m matrix_printing_bench --output output/bench_new.json \
+        --compare output/bench_old.json
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy
+import PIL
+from PIL import Image, ImageFont
+
+from matrix_printing_cli import load_preset, parse_output_size
+from matrix_printing_encode import ENCODINGS
+from matrix_printing_fonts import FontRegistry
+from matrix_printing_logic import layout_pages, split_text_paragraphs
+from matrix_printing_render import (
+    GlyphCache,
+    draw_pages,
+    fit_page,
+    fit_to_canvas,
+)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+DEFAULT_LENGTHS = (100, 400, 2000)
+DEFAULT_SIZES = ("original", "A4")
+PREVIEW_CANVAS = (800, 1000)
+SAMPLE_TEXT = (
+    "春眠不觉晓，处处闻啼鸟。夜来风雨声，花落知多少。"
+    "床前明月光，疑是地上霜。举头望明月，低头思故乡。"
+    "白日依山尽，黄河入海流。欲穷千里目，更上一层楼。"
+)
+
+
+def sample_text(length, paragraph_length=80):
+    """Deterministic Chinese text of ``length`` characters in paragraphs."""
+    body = (SAMPLE_TEXT * (length // len(SAMPLE_TEXT) + 1))[:length]
+    return "\n".join(body[i:i + paragraph_length]
+                     for i in range(0, len(body), paragraph_length))
+
+
+def time_call(func, repeat):
+    """Run ``func`` ``repeat`` times; return its last result and the timings."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, timings
+
+
+def list_backgrounds(folder):
+    """Sorted image files in ``folder``, skipping byte-identical copies."""
+    if not os.path.isdir(folder):
+        return []
+    seen = set()
+    backgrounds = []
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, filename)
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest not in seen:
+            seen.add(digest)
+            backgrounds.append(path)
+    return backgrounds
+
+
+def list_presets(folder):
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, filename)
+            for filename in sorted(os.listdir(folder))
+            if filename.endswith(".json")]
+
+
+def load_font(font_path, size):
+    """The font at ``font_path``, else Pillow's built-in scalable font."""
+    if font_path:
+        registry = FontRegistry(os.path.dirname(font_path) or ".")
+        return registry.get(os.path.basename(font_path), size)
+    return ImageFont.load_default(size=size)
+
+
+def find_font(folder="fonts"):
+    """The first font in ``folder``, or None to use the built-in font."""
+    names = FontRegistry(folder).list_fonts()
+    return os.path.join(folder, names[0]) if names else None
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 在新的解释器中导入界面模块：窗口显示之前必须完成的导入
+GUI_IMPORT_SCRIPT = ("import time; start = time.perf_counter(); "
+                     "import matrix_printing_gui; "
+                     "print(time.perf_counter() - start)")
+
+
+def time_gui_import(repeat):
+    """Seconds a fresh interpreter spends importing the GUI module.
+
+    That import runs before the window can appear; PIL, numpy and the
+    rendering modules are imported after the first frame and are not
+    included.
+    """
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", GUI_IMPORT_SCRIPT], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        timings.append(float(output))
+    return timings
+
+
+def run_benchmarks(presets, backgrounds, font_path=None,
+                   lengths=DEFAULT_LENGTHS, sizes=DEFAULT_SIZES, repeat=3,
+                   progress=None, encodings=tuple(ENCODINGS), startup=True):
+    """Time every stage; return a list of result dicts.
+
+    Splitting, layout and glyph rasterization depend only on the preset and
+    text, so they run once per preset; resizing, preview downscale, drawing
+    and PNG encoding run for every background and output size. PNG save
+    times encoding the first page into memory, so disk speed is excluded;
+    ``encode`` does the same for each of ``encodings`` (names from
+    ``ENCODINGS``), including the colour conversion, and records the
+    encoded size in ``bytes``. With ``startup``, ``gui_import`` times the
+    imports that run before the GUI shows its first frame.
+    """
+    results = []
+
+    def record(stage, timings, **case):
+        entry = {"stage": stage, **case, "repeat": len(timings),
+                 "min_s": min(timings),
+                 "median_s": statistics.median(timings),
+                 "mean_s": statistics.fmean(timings)}
+        results.append(entry)
+        if progress:
+            progress(entry)
+
+    if startup:
+        record("gui_import", time_gui_import(repeat))
+
+    for preset_path in presets:
+        preset = os.path.basename(preset_path)
+        settings = load_preset(preset_path)
+        font = load_font(font_path, settings.font_size)
+        texts = {length: sample_text(length) for length in lengths}
+        caches = {}
+        layouts = {}
+
+        for length, text in texts.items():
+            case = {"preset": preset, "text_length": length}
+            _, timings = time_call(lambda: split_text_paragraphs(text), repeat)
+            record("split", timings, **case)
+
+            def rasterize():
+                cache = GlyphCache()
+                for char in set(text):
+                    cache.glyph(font, char)
+                return cache
+            caches[length], timings = time_call(rasterize, repeat)
+            record("rasterize", timings, **case)
+
+            measure = caches[length].measure(font)
+            layouts[length], timings = time_call(
+                lambda: list(layout_pages(text, settings, measure)), repeat)
+            record("layout", timings, pages=len(layouts[length]), **case)
+
+        for background_path in backgrounds:
+            background = os.path.basename(background_path)
+            with Image.open(background_path) as image:
+                image.load()
+                for size in sizes:
+                    target = parse_output_size(size)
+                    label = target if target == "original" else list(target)
+                    case = {"preset": preset, "background": background,
+                            "size": label}
+                    page, timings = time_call(
+                        lambda: fit_page(image, target), repeat)
+                    record("resize", timings, **case)
+                    _, timings = time_call(
+                        lambda: fit_to_canvas(page, PREVIEW_CANVAS), repeat)
+                    record("preview_downscale", timings, **case)
+
+                    for length in lengths:
+                        pages = layouts[length]
+
+                        def draw():
+                            # 逐页绘制所有页，只保留第一页用于测保存
+                            first = None
+                            for drawn in draw_pages(page, pages, font,
+                                                    glyph_cache=caches[length]):
+                                if first is None:
+                                    first = drawn
+                            return first
+                        first, timings = time_call(draw, repeat)
+                        record("draw", timings, text_length=length,
+                               pages=len(pages), **case)
+
+                        def save_png():
+                            buffer = io.BytesIO()
+                            first.save(buffer, "PNG", dpi=(300, 300))
+                            return buffer.tell()
+                        _, timings = time_call(save_png, repeat)
+                        record("png_save", timings, text_length=length, **case)
+
+                        for name in encodings:
+                            encoding = ENCODINGS[name]
+
+                            def encode():
+                                buffer = io.BytesIO()
+                                encoding.convert(first).save(
+                                    buffer, **encoding.save_options())
+                                return buffer.tell()
+                            size_bytes, timings = time_call(encode, repeat)
+                            record("encode", timings, text_length=length,
+                                   encoding=name, bytes=size_bytes, **case)
+    return results
+
+
+def build_report(results, font_path=None):
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "font": os.path.basename(font_path) if font_path else None,
+        "results": results,
+    }
+
+
+def result_key(entry):
+    size = entry.get("size")
+    return (entry["stage"], entry.get("preset"), entry.get("background"),
+            tuple(size) if isinstance(size, list) else size,
+            entry.get("text_length"), entry.get("encoding"))
+
+
+def compare(previous, current, threshold=1.2):
+    """Return ``(entry, ratio)`` for stages whose median slowed past ``threshold``."""
+    before = {result_key(entry): entry for entry in previous["results"]}
+    regressions = []
+    for entry in current["results"]:
+        old = before.get(result_key(entry))
+        if old and old["median_s"] > 0:
+            ratio = entry["median_s"] / old["median_s"]
+            if ratio > threshold:
+                regressions.append((entry, ratio))
+    return regressions
+
+
+def describe(entry):
+    parts = [entry["stage"]]
+    if "preset" in entry:
+        parts.append(entry["preset"])
+    if "background" in entry:
+        size = entry["size"]
+        parts.append(entry["background"])
+        parts.append(size if size == "original" else "x".join(map(str, size)))
+    if "text_length" in entry:
+        parts.append(f"{entry['text_length']} 字")
+    if "encoding" in entry:
+        parts.append(f"{entry['encoding']} {entry['bytes'] / 1024:.0f} KB")
+    return " / ".join(parts)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m matrix_printing_bench",
+        description="测量排版和渲染各环节的耗时，结果保存为 JSON",
+    )
+    parser.add_argument("--config", default="config", help="参数预设文件夹")
+    parser.add_argument("--uploads", default="uploads", help="底图文件夹")
+    parser.add_argument("--font", default=None,
+                        help="字体文件，默认取 fonts 文件夹中的第一个，没有则用内置字体")
+    parser.add_argument("--lengths", type=int, nargs="+",
+                        default=list(DEFAULT_LENGTHS), help="测试文本字数")
+    parser.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES),
+                        help="输出尺寸：original、A4、A3、4K、高清 或 宽x高")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--encodings", nargs="+", choices=tuple(ENCODINGS),
+                        default=list(ENCODINGS), help="要比较的图片编码")
+    parser.add_argument("--output", default=None,
+                        help="结果文件，默认 output/bench_时间戳.json")
+    parser.add_argument("--compare", default=None,
+                        help="与之前的结果文件比较，变慢超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="判定变慢的中位数倍数")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for size in args.sizes:
+        try:
+            parse_output_size(size)
+        except argparse.ArgumentTypeError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    presets = list_presets(args.config)
+    backgrounds = list_backgrounds(args.uploads)
+    if not presets or not backgrounds:
+        print(f"没有找到参数预设或底图: {args.config}, {args.uploads}",
+              file=sys.stderr)
+        return 1
+    font_path = args.font or find_font()
+
+    def progress(entry):
+        print(f"{describe(entry)}: {entry['median_s'] * 1000:.1f} ms")
+
+    results = run_benchmarks(presets, backgrounds, font_path,
+                             lengths=args.lengths, sizes=args.sizes,
+                             repeat=args.repeat, progress=progress,
+                             encodings=args.encodings)
+    report = build_report(results, font_path)
+
+    output = args.output or os.path.join(
+        "output", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        regressions = compare(previous, report, args.threshold)
+        for entry, ratio in regressions:
+            print(f"变慢 {ratio:.2f} 倍: {describe(entry)}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Content-addressed on-disk cache of rendered pages.
+
+A render is fully determined by its text, grid parameters, font file,
+background file, output size and format, so the cache key is a SHA-256
+over exactly those inputs (files by content, not by name). Each entry is a
+folder of page files; a repeated export copies them to the requested path
+instead of drawing and re-encoding the pages. Entries are evicted least
+recently used first once the cache exceeds ``max_bytes``. The folder is
+indexed on first use, or earlier by calling ``load`` from a background
+thread, so creating a cache costs the same however many entries it holds.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import astuple
+
+from matrix_printing_logic import split_text_paragraphs
+from matrix_printing_render import page_path, record_pages
+
+# 渲染结果的格式变化时加一，使旧缓存全部失效
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+MANIFEST = "manifest.json"
+_TEMPORARY_PREFIX = ".tmp-"
+
+
+class FileDigests:
+    """SHA-256 of files, recomputed only when size or mtime changes."""
+
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        stat = os.stat(path)
+        key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+
+class RenderCache:
+    """Size-bounded LRU cache of rendered outputs in ``folder``.
+
+    Safe to share between threads; several processes may share a folder
+    too, since entries are written to a temporary folder and renamed into
+    place, and an entry evicted by another process is just a miss.
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.digest = FileDigests()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # 键 -> 字节数，最久未用的在前
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Index the folder once; later calls return immediately."""
+        with self._lock:
+            if not self._loaded:
+                os.makedirs(self.folder, exist_ok=True)
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        """Index existing entries, oldest use first, and drop leftovers."""
+        found = []
+        for entry in os.scandir(self.folder):
+            if entry.name.startswith(_TEMPORARY_PREFIX):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif entry.is_dir():
+                try:
+                    with open(os.path.join(entry.path, MANIFEST), "r",
+                              encoding="utf-8") as f:
+                        size = json.load(f)["bytes"]
+                except (OSError, ValueError, KeyError):
+                    # 没有清单的条目不完整
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    continue
+                found.append((entry.stat().st_mtime_ns, entry.name, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+        self._evict()
+
+    def key(self, text, settings, font_path, background_path, output_size,
+            output_format="png", overlay_mode=None):
+        """Hash every input that decides the rendered pages.
+
+        ``background_path`` may be None when the background is not drawn
+        (text-only output at an explicit size).
+        """
+        inputs = {
+            "version": CACHE_VERSION,
+            # 排版只取决于段落，行尾空白和空行不影响结果
+            "text": split_text_paragraphs(text),
+            "settings": list(astuple(settings)),
+            "font": self.digest(font_path),
+            "background": (self.digest(background_path)
+                           if background_path else None),
+            "size": output_size if output_size == "original" else list(output_size),
+            "format": output_format,
+            "overlay": overlay_mode,
+        }
+        encoded = json.dumps(inputs, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key)
+
+    def get(self, key):
+        """Return the cached files of ``key``, one path per page, or None.
+
+        A multi-page PDF is one file, repeated once per page.
+        """
+        self.load()
+        folder = self._path(key)
+        with self._lock:
+            try:
+                with open(os.path.join(folder, MANIFEST), "r",
+                          encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+            if manifest is None:
+                self.misses += 1
+                if key in self._entries:
+                    # 没有清单的条目不完整，直接删除
+                    self._bytes -= self._entries.pop(key)
+                    shutil.rmtree(folder, ignore_errors=True)
+                return None
+            self.hits += 1
+            if key not in self._entries:
+                # 其他进程写入的条目
+                self._entries[key] = manifest["bytes"]
+                self._bytes += manifest["bytes"]
+            self._entries.move_to_end(key)
+        try:
+            os.utime(folder)  # 记录使用时间，重启后仍按最近使用排序
+        except OSError:
+            pass
+        files = [os.path.join(folder, name) for name in manifest["files"]]
+        if len(files) == 1:
+            return files * manifest["pages"]
+        return files
+
+    def restore(self, key, path):
+        """Copy a cached render to ``path``; return the written paths or None.
+
+        PNG pages are named like ``save_pages`` names them; a PDF is copied
+        once and returned once per page, like the batch renderer does.
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None
+        try:
+            if len(set(cached)) == 1:
+                shutil.copyfile(cached[0], path)
+                if len(cached) == 1 and not path.lower().endswith(".pdf"):
+                    record_pages(path, [path])
+                return [path] * len(cached)
+            written = []
+            for number, source in enumerate(cached, 1):
+                target = page_path(path, number)
+                shutil.copyfile(source, target)
+                written.append(target)
+            record_pages(path, written)
+            return written
+        except FileNotFoundError:
+            # 刚被其他进程淘汰
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, key, paths):
+        """Store a render as ``key``; ``paths`` has one entry per page.
+
+        A PDF is passed as its path repeated once per page.
+        """
+        self.load()
+        paths = list(paths)
+        temporary = self._path(_TEMPORARY_PREFIX + uuid.uuid4().hex)
+        os.makedirs(temporary)
+        size = 0
+        names = []
+        try:
+            for number, source in enumerate(dict.fromkeys(paths), 1):
+                names.append(f"{number}{os.path.splitext(source)[1]}")
+                target = os.path.join(temporary, names[-1])
+                # 复制而不是硬链接：之后覆盖导出文件时不能改动缓存
+                shutil.copyfile(source, target)
+                size += os.path.getsize(target)
+            with open(os.path.join(temporary, MANIFEST), "w",
+                      encoding="utf-8") as f:
+                json.dump({"files": names, "pages": len(paths), "bytes": size}, f)
+            os.rename(temporary, self._path(key))
+        except OSError:
+            # 同一条目已被其他线程或进程写入
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def stats(self):
+        self.load()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,275 @@
+"""Search glyph parameters that best centre the text in the sheet's cells.
+
+The background's real cell interiors are measured once into a
+``CellMap``. A candidate ``(cell_width, cell_height, font_size, offset_x,
+offset_y)`` is scored by laying out a page of sample text and comparing
+every glyph's ink box with the cell it lands in, which needs only glyph
+boxes and arithmetic. A pattern search evaluates each round's unseen
+neighbours on a process pool and memoizes every score, so no candidate
+is ever evaluated twice.
+"""
+
+import os
+from dataclasses import replace
+from datetime import datetime
+
+import numpy as np
+
+from matrix_printing_detect import darkness_profiles, find_lines
+from matrix_printing_fonts import FontRegistry
+from matrix_printing_logic import layout_text
+from matrix_printing_pool import worker_pool
+from matrix_printing_presets import write_preset
+from matrix_printing_render import GlyphCache, page_placement
+
+PARAMETERS = ("cell_width", "cell_height", "font_size", "offset_x", "offset_y")
+STEPS = {"cell_width": 0.5, "cell_height": 0.5, "font_size": 1,
+         "offset_x": 1, "offset_y": 1}
+MOVES = (-8, -4, -2, -1, 1, 2, 4, 8)
+SAMPLE_CHARS = "永和九年岁在癸丑暮春之初会于会稽山阴之兰亭修禊事也群贤毕至少长咸集"
+
+# 评分权重：字形超出格子比偏离中心严重得多
+OVERFLOW_WEIGHT = 10.0
+MISS_PENALTY = 4.0
+FILL_WEIGHT = 1.0
+
+_worker = {}
+
+
+class CellMap:
+    """The sheet's cell interiors along each axis, in page pixels.
+
+    Grids are separable, so the cell mask is stored as two sorted lists of
+    ``(low, high)`` intervals: a page pixel lies inside a cell when its x
+    falls in a column interval and its y in a row interval. Gaps between
+    exercise-book rows and page margins are not cells.
+    """
+
+    def __init__(self, columns, rows):
+        self.columns = np.asarray(columns, dtype=np.float64).reshape(-1, 2)
+        self.rows = np.asarray(rows, dtype=np.float64).reshape(-1, 2)
+
+    @classmethod
+    def from_image(cls, image, output_size="original"):
+        columns_profile, rows_profile = darkness_profiles(image)
+        x, y, width, height = page_placement(image.size, output_size)
+        return cls(
+            _interiors(columns_profile, x, width / image.width),
+            _interiors(rows_profile, y, height / image.height),
+        )
+
+    def __bool__(self):
+        return bool(len(self.columns) and len(self.rows))
+
+
+def _interiors(profile, origin, scale):
+    """Intervals between neighbouring lines that are about one pitch wide."""
+    found = find_lines(profile)
+    if found is None:
+        return []
+    pitch, lines = found
+    intervals = []
+    for (left, left_width), (right, right_width) in zip(lines, lines[1:]):
+        # 像素 i 的中心在 i + 0.5
+        low = left + 0.5 + left_width / 2
+        high = right + 0.5 - right_width / 2
+        if 0.5 * pitch <= high - low <= 1.5 * pitch:
+            intervals.append((origin + low * scale, origin + high * scale))
+    return intervals
+
+
+def _locate(intervals, values):
+    """Index of the interval containing each value, or -1."""
+    index = np.searchsorted(intervals[:, 0], values, side="right") - 1
+    inside = (index >= 0) & (values <= intervals[np.maximum(index, 0), 1])
+    return np.where(inside, index, -1)
+
+
+def _axis_errors(intervals, low, high):
+    """Centring error, overflow and fill of ink spans along one axis."""
+    centre = (low + high) / 2
+    index = _locate(intervals, centre)
+    found = index >= 0
+    cell = intervals[np.maximum(index, 0)]
+    half = (cell[:, 1] - cell[:, 0]) / 2
+    offset = (centre - (cell[:, 0] + cell[:, 1]) / 2) / half
+    overflow = (np.maximum(cell[:, 0] - low, 0)
+                + np.maximum(high - cell[:, 1], 0)) / half
+    fill = (high - low) / (2 * half)
+    return found, offset, overflow, fill
+
+
+def score_placements(placements, glyph_bbox, cells, fill=0.75):
+    """Score a placement table against ``cells``; lower is better.
+
+    Each glyph adds its squared centring error (relative to the cell's
+    half size) and a heavier squared overflow past the cell edges; glyphs
+    whose centre misses every cell add a fixed penalty. The squared gap
+    between the median fill (ink size over cell size) and ``fill`` keeps
+    the search from shrinking the font to nothing.
+    """
+    boxes = []
+    for _, char, x, y in placements:
+        left, top, right, bottom = glyph_bbox(char)
+        if right > left and bottom > top:
+            boxes.append((x + left, y + top, x + right, y + bottom))
+    if not boxes or not cells:
+        return float("inf")
+    boxes = np.asarray(boxes, dtype=np.float64)
+
+    found_x, offset_x, overflow_x, fill_x = _axis_errors(
+        cells.columns, boxes[:, 0], boxes[:, 2])
+    found_y, offset_y, overflow_y, fill_y = _axis_errors(
+        cells.rows, boxes[:, 1], boxes[:, 3])
+    found = found_x & found_y
+
+    errors = np.full(len(boxes), MISS_PENALTY)
+    errors[found] = (offset_x[found] ** 2 + offset_y[found] ** 2
+                     + OVERFLOW_WEIGHT * (overflow_x[found] ** 2
+                                          + overflow_y[found] ** 2))
+    fill_error = 1.0
+    if found.any():
+        glyph_fill = np.maximum(fill_x[found], fill_y[found])
+        fill_error = (float(np.median(glyph_fill)) - fill) ** 2
+    return float(errors.mean()) + FILL_WEIGHT * fill_error
+
+
+def sample_page(settings, text=None):
+    """Text for one full page, every cell used, for scoring."""
+    text = "".join((text or "").split()) or SAMPLE_CHARS
+    count = settings.cells_per_page
+    return (text * (count // len(text) + 1))[:count]
+
+
+def candidate_settings(settings, key):
+    return replace(settings, **dict(zip(PARAMETERS, key)))
+
+
+def settings_key(settings):
+    return (round(settings.cell_width * 2) / 2, round(settings.cell_height * 2) / 2,
+            int(settings.font_size), int(settings.offset_x),
+            int(settings.offset_y))
+
+
+def neighbours(key):
+    """Keys one pattern-search move away from ``key`` along each parameter."""
+    for position, name in enumerate(PARAMETERS):
+        for move in MOVES:
+            value = key[position] + move * STEPS[name]
+            if name != "offset_x" and name != "offset_y" and value < 1:
+                continue
+            yield key[:position] + (value,) + key[position + 1:]
+
+
+def _init_worker(cells, font_path, settings, text, fill):
+    _worker["cells"] = cells
+    _worker["registry"] = FontRegistry(os.path.dirname(font_path) or ".")
+    _worker["font_name"] = os.path.basename(font_path)
+    _worker["glyph_cache"] = GlyphCache()
+    # 不缩进、不空行，让样张正好排满一页
+    _worker["settings"] = replace(settings, first_line_indent=False,
+                                  first_line_newline=False)
+    _worker["text"] = sample_page(settings, text)
+    _worker["fill"] = fill
+
+
+def _evaluate(key):
+    settings = candidate_settings(_worker["settings"], key)
+    font = _worker["registry"].get(_worker["font_name"], settings.font_size)
+    measure = _worker["glyph_cache"].measure(font)
+    placements = layout_text(_worker["text"], settings, measure)
+    return score_placements(placements, measure, _worker["cells"],
+                            _worker["fill"])
+
+
+class Calibrator:
+    """Memoized, parallel pattern search over the glyph parameters.
+
+    ``scores`` maps every evaluated key to its score and persists across
+    ``search`` calls; ``hits`` counts candidates answered from it.
+    """
+
+    def __init__(self, cells, font_path, settings, text=None, workers=None,
+                 fill=0.75):
+        self.settings = settings
+        self.scores = {}
+        self.hits = 0
+        initargs = (cells, font_path, settings, text, fill)
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = None
+        if self.workers > 1:
+            self._pool = worker_pool(_init_worker, initargs, self.workers)
+        else:
+            _init_worker(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def evaluate(self, keys):
+        """Score every key, computing only those not already memoized."""
+        pending = []
+        for key in keys:
+            if key in self.scores or key in pending:
+                self.hits += 1
+            else:
+                pending.append(key)
+        if self._pool is not None:
+            chunk = max(1, len(pending) // (self.workers * 2))
+            results = self._pool.map(_evaluate, pending, chunksize=chunk)
+        else:
+            results = map(_evaluate, pending)
+        self.scores.update(zip(pending, results))
+        return [self.scores[key] for key in keys]
+
+    def search(self, max_rounds=30):
+        """Return ``(settings, score)`` of the best candidate found."""
+        best = settings_key(self.settings)
+        (best_score,) = self.evaluate([best])
+        for _ in range(max_rounds):
+            candidates = list(neighbours(best))
+            scores = self.evaluate(candidates)
+            score, key = min(zip(scores, candidates))
+            if score >= best_score:
+                break
+            best, best_score = key, score
+        return candidate_settings(self.settings, best), best_score
+
+
+def calibrate(image, settings, font_path, output_size="original", text=None,
+              workers=None, max_rounds=30):
+    """Calibrate ``settings`` against the grid on ``image``.
+
+    Returns ``(settings, score, evaluations)``. Raises ValueError when no
+    cells can be measured on the sheet.
+    """
+    cells = CellMap.from_image(image, output_size)
+    if not cells:
+        raise ValueError("未能识别出格子，无法自动校准")
+    with Calibrator(cells, font_path, settings, text, workers) as calibrator:
+        best, score = calibrator.search(max_rounds)
+        return best, score, len(calibrator.scores)
+
+
+def preset_path(folder="config"):
+    """A new, unused preset path such as ``config/校准_20241102_131037.json``."""
+    stem = os.path.join(folder, f"校准_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    path = f"{stem}.json"
+    number = 2
+    while os.path.exists(path):
+        path = f"{stem}_{number}.json"
+        number += 1
+    return path
+
+
+def save_calibrated(settings, folder="config"):
+    """Write calibrated ``settings`` as a new preset in ``folder``."""
+    os.makedirs(folder, exist_ok=True)
+    return write_preset(preset_path(folder), settings.to_values())
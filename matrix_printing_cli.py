@@ -0,0 +1,380 @@
+"""Command-line batch rendering without Tk.
+
+Example::
+
+    python -m matrix_printing_cli render --preset config/作文本.json \
+        --background uploads/Z.png --font fonts/LXGWWenKai-Regular.ttf \
+        --texts essays/ --output output/batch
+
+    python -m matrix_printing_cli calibrate --background uploads/Z.png \
+        --font fonts/LXGWWenKai-Regular.ttf --preset config/作文本.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_calibrate import calibrate, save_calibrated
+from matrix_printing_detect import detect_grid
+from matrix_printing_encode import ENCODINGS, parse_encoding, save_encoded
+from matrix_printing_fonts import FontRegistry
+from matrix_printing_logic import GridSettings
+from matrix_printing_pdf import save_pdf
+from matrix_printing_pool import worker_pool
+from matrix_printing_presets import PresetLibrary
+from matrix_printing_render import (
+    OUTPUT_SIZES,
+    GlyphCache,
+    LazyPage,
+    glyph_overlay,
+    iter_glyph_layers,
+    iter_text_pages,
+)
+
+_worker = {}
+
+
+def parse_output_size(value):
+    """Accept a GUI size label, its short name (``A4``), ``WxH`` or ``original``."""
+    if value in ("original", *OUTPUT_SIZES):
+        return OUTPUT_SIZES.get(value, value)
+    for label, size in OUTPUT_SIZES.items():
+        if label.split(" ")[0].lower() == value.lower():
+            return size
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无法识别的输出尺寸: {value}") from None
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"无法识别的输出尺寸: {value}")
+    return (width, height)
+
+
+def load_preset(path, first_line_indent=True, first_line_newline=False):
+    """Read a ``config/*.json`` preset into ``GridSettings``."""
+    with open(path, "r", encoding="utf-8") as f:
+        values = json.load(f)
+    values["first_line_indent"] = first_line_indent
+    values["first_line_newline"] = first_line_newline
+    return GridSettings.from_values(values)
+
+
+def iter_texts(source):
+    """Yield ``(name, text)`` from a folder of ``.txt`` files or a JSONL file.
+
+    JSONL lines are either strings or objects with a ``text`` field and an
+    optional ``name``; unnamed entries are numbered by line. Objects with a
+    ``preset`` field yield ``(name, text, preset)`` instead, to be rendered
+    with that template. Raises ValueError for a JSONL object without
+    ``text``, and when two entries' output files would overwrite each
+    other (see ``OutputNames``).
+    """
+    names = OutputNames(source)
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if filename.lower().endswith(".txt"):
+                name = os.path.splitext(filename)[0]
+                names.add(name, filename)
+                with open(os.path.join(source, filename), "r",
+                          encoding="utf-8") as f:
+                    yield name, f.read()
+        return
+
+    with open(source, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if isinstance(entry, str):
+                entry = {"text": entry}
+            if not isinstance(entry, dict) or "text" not in entry:
+                raise ValueError(f"{source} 第 {number} 行缺少 text 字段")
+            name = str(entry.get("name") or f"{number:05d}")
+            names.add(name, f"第 {number} 行")
+            if entry.get("preset"):
+                yield name, entry["text"], entry["preset"]
+            else:
+                yield name, entry["text"]
+
+
+class OutputNames:
+    """Reject batch entries whose output files would overwrite each other.
+
+    Outputs are named by the last segment of the entry name, and a
+    multi-page text continues on ``name_2``, ``name_3``..., so ``a``
+    clashes with another ``a`` and with ``a_2``.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.names = {}  # 输出名称 -> 条目位置
+        self.followers = {}  # 形如 a_2 的名称中的 a -> 条目位置
+
+    def add(self, name, where):
+        output_name = os.path.basename(name)
+        stem, _, number = output_name.rpartition("_")
+        clash = self.names.get(output_name) or self.followers.get(output_name)
+        if clash is None and stem and number.isdigit():
+            clash = self.names.get(stem)
+        if clash is not None:
+            raise ValueError(f"{self.source} 中 {where} 的名称 {name} "
+                             f"与 {clash} 的输出文件冲突")
+        self.names[output_name] = where
+        if stem and number.isdigit():
+            self.followers.setdefault(stem, where)
+
+
+def _init_worker(background_path, output_size, font_path, settings,
+                 text_only=False):
+    if text_only and output_size != "original":
+        # 套打只需要页面尺寸，不必打开底图
+        _worker["page"] = None
+        _worker["size"] = tuple(output_size)
+    else:
+        # 套打按原始尺寸输出时只读取底图文件头
+        background = LazyPage(background_path, output_size)
+        _worker["page"] = None if text_only else background.materialize()
+        _worker["size"] = background.size
+    # 各篇可用不同模板，字体按字号缓存在进程内
+    _worker["fonts"] = FontRegistry(os.path.dirname(font_path) or ".")
+    _worker["font_name"] = os.path.basename(font_path)
+    _worker["fonts"].get(_worker["font_name"], settings.font_size)
+    _worker["glyph_cache"] = GlyphCache()
+
+
+def _output_path(name, output_dir, output_format, encoding):
+    extension = ".pdf" if output_format == "pdf" else encoding.extension
+    return os.path.join(output_dir, os.path.basename(name) + extension)
+
+
+def _render_one(job):
+    name, text, settings, output_dir, output_format, overlay_mode, encoding = job
+    page, size = _worker["page"], _worker["size"]
+    font = _worker["fonts"].get(_worker["font_name"], settings.font_size)
+    path = _output_path(name, output_dir, output_format, encoding)
+    if output_format == "pdf" or overlay_mode:
+        layers = iter_glyph_layers(size, settings, text, font,
+                                   _worker["glyph_cache"])
+
+    if output_format == "pdf":
+        background = None if overlay_mode else page
+        return [path] * save_pdf(path, layers, size, background=background)
+
+    if overlay_mode:
+        pages = (glyph_overlay(layer, overlay_mode) for layer in layers)
+    else:
+        pages = iter_text_pages(page, settings, text, font,
+                                _worker["glyph_cache"])
+    return save_encoded(pages, path, encoding)
+
+
+def render_batch(texts, preset_path, background_path, font_path, output_dir,
+                 output_size="original", workers=None,
+                 first_line_indent=True, first_line_newline=False,
+                 output_format="png", overlay_mode=None, presets=None,
+                 cache=None, encoding=None):
+    """Render every ``(name, text)`` to ``output_dir`` on a process pool.
+
+    As PNG, texts longer than one sheet continue on ``name_2.png`` and so
+    on; as PDF, each text becomes one multi-page ``name.pdf``. With an
+    ``overlay_mode`` (``"1"`` or ``"P"``) only the text is written, for
+    printing onto pre-printed grid paper. Images are written with
+    ``encoding`` (an ``OutputEncoding``, full-colour PNG by default).
+    Returns ``(paths, seconds)`` with one path per written page.
+
+    ``preset_path`` is a preset file or a name in ``presets`` (a
+    ``PresetLibrary``). Entries of the form ``(name, text, preset)`` use
+    their own template; all templates are resolved here, once, so the
+    workers never read preset files.
+
+    With a ``RenderCache`` as ``cache``, texts rendered before with the
+    same inputs are copied from it and only the rest go to the pool.
+    """
+    presets = presets or PresetLibrary(os.path.dirname(preset_path) or ".")
+    resolved = {}
+
+    def settings_for(preset):
+        if preset not in resolved:
+            resolved[preset] = presets.resolve(preset).settings(
+                first_line_indent, first_line_newline)
+        return resolved[preset]
+
+    settings = settings_for(preset_path)
+    encoding = encoding or ENCODINGS["png"]
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(entry[0], entry[1], settings_for(entry[2]) if len(entry) > 2
+             else settings, output_dir, output_format, overlay_mode, encoding)
+            for entry in texts]
+
+    start = time.perf_counter()
+    results = [None] * len(jobs)
+    keys = [None] * len(jobs)
+    if cache is not None:
+        # 套打且指定了尺寸时不读取底图，结果与底图内容无关
+        drawn_background = (None if overlay_mode and output_size != "original"
+                            else background_path)
+        cached_format = ("pdf" if output_format == "pdf"
+                         else encoding.cache_label)
+        for index, (name, text, job_settings, *_) in enumerate(jobs):
+            keys[index] = cache.key(text, job_settings, font_path,
+                                    drawn_background, output_size,
+                                    cached_format, overlay_mode)
+            results[index] = cache.restore(
+                keys[index],
+                _output_path(name, output_dir, output_format, encoding))
+
+    missing = [index for index, pages in enumerate(results) if pages is None]
+    if missing:
+        with worker_pool(
+            _init_worker,
+            (background_path, output_size, font_path, settings,
+             overlay_mode is not None),
+            workers,
+        ) as pool:
+            rendered = pool.map(_render_one, [jobs[index] for index in missing])
+            for index, pages in zip(missing, rendered):
+                results[index] = pages
+                if cache is not None:
+                    cache.put(keys[index], pages)
+    paths = [path for pages in results for path in pages]
+    return paths, time.perf_counter() - start
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m matrix_printing_cli",
+        description="在格子纸上批量排版文字，无需图形界面",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="按同一模板批量生成图片")
+    render.add_argument("--preset", required=True,
+                        help="参数预设文件，或 --config 文件夹中的预设名")
+    render.add_argument("--config", default=None,
+                        help="预设文件夹，JSONL 里的 preset 字段按名称在其中查找，"
+                             "默认为 --preset 所在的文件夹")
+    render.add_argument("--background", required=True, help="格子纸底图")
+    render.add_argument("--font", required=True, help="字体文件 (.ttf/.otf)")
+    render.add_argument("--texts", required=True,
+                        help="包含 .txt 文件的文件夹，或 JSONL 文件")
+    render.add_argument("--output", default="output", help="输出文件夹")
+    render.add_argument("--size", type=parse_output_size, default="original",
+                        help="输出尺寸：original、A4、A3、4K、高清 或 宽x高")
+    render.add_argument("--format", choices=("png", "pdf"), default="png",
+                        help="输出格式：每页一张图片（编码见 --encoding），或每篇一个多页 PDF")
+    render.add_argument("--text-only", dest="overlay_mode", nargs="?",
+                        const="1", choices=("1", "P"), default=None,
+                        help="仅输出文字用于套打：1 为黑白，P 为保留抗锯齿的调色板图")
+    render.add_argument("--encoding", choices=tuple(ENCODINGS), default="png",
+                        help="图片编码：png 彩色、png-fast 快速压缩、png-palette 调色板、"
+                             "png-gray 灰度、jpeg、webp，或 tiff-g4 黑白 G4 压缩")
+    render.add_argument("--quality", type=int, default=None,
+                        help="JPEG/WebP 质量（1-100），默认 90")
+    render.add_argument("--compress-level", type=int, default=None,
+                        help="PNG 压缩级别（0-9），越小越快、文件越大")
+    render.add_argument("--workers", type=int, default=None,
+                        help="进程数，默认等于 CPU 核数")
+    render.add_argument("--cache", default=os.path.join("output", "cache"),
+                        help="渲染缓存文件夹，相同输入的作文直接复制上次的结果")
+    render.add_argument("--cache-size", type=int, default=512,
+                        help="渲染缓存上限（MB），超出时淘汰最久未用的结果")
+    render.add_argument("--no-cache", dest="cache", action="store_const",
+                        const=None, help="不使用渲染缓存")
+    render.add_argument("--no-indent", dest="indent", action="store_false",
+                        help="首段不缩进")
+    render.add_argument("--first-line-newline", action="store_true",
+                        help="首行换行")
+
+    calibrate = commands.add_parser(
+        "calibrate", help="自动搜索字号和偏移，让文字居中于格子，并另存为新预设")
+    calibrate.add_argument("--background", required=True, help="格子纸底图")
+    calibrate.add_argument("--font", required=True, help="字体文件 (.ttf/.otf)")
+    calibrate.add_argument("--preset", default=None,
+                           help="作为起点的参数预设，默认从底图自动识别网格")
+    calibrate.add_argument("--size", type=parse_output_size, default="original",
+                           help="输出尺寸：original、A4、A3、4K、高清 或 宽x高")
+    calibrate.add_argument("--text", default=None,
+                           help="用来评估的样张文字，默认使用内置字符")
+    calibrate.add_argument("--output", default="config",
+                           help="新预设保存到的文件夹")
+    calibrate.add_argument("--workers", type=int, default=None,
+                           help="进程数，默认等于 CPU 核数")
+    return parser
+
+
+def run_calibrate(args):
+    with Image.open(args.background) as image:
+        image.load()
+    start = time.perf_counter()
+    try:
+        if args.preset:
+            settings = load_preset(args.preset)
+        else:
+            settings = GridSettings.from_values(
+                detect_grid(image, args.size), strict=False)
+        best, score, evaluations = calibrate(
+            image, settings, args.font, output_size=args.size,
+            text=args.text, workers=args.workers)
+    except ValueError as e:
+        print(f"无法校准 {args.background}: {e}（可用 --preset 指定起始参数）",
+              file=sys.stderr)
+        return 1
+    path = save_calibrated(best, args.output)
+    print(f"评估 {evaluations} 组参数，用时 {time.perf_counter() - start:.2f} 秒，"
+          f"得分 {score:.4f}")
+    print(f"字号 {best.font_size}，偏移 ({best.offset_x}, {best.offset_y})，"
+          f"格子 {best.cell_width:g}x{best.cell_height:g}，已保存到 {path}")
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "calibrate":
+        return run_calibrate(args)
+
+    try:
+        encoding = parse_encoding(args.encoding, args.quality,
+                                  args.compress_level)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        texts = list(iter_texts(args.texts))
+    except ValueError as e:
+        print(f"无法读取文本: {e}", file=sys.stderr)
+        return 1
+    if not texts:
+        print(f"没有找到要排版的文本: {args.texts}", file=sys.stderr)
+        return 1
+
+    presets = PresetLibrary(args.config) if args.config else None
+    cache = (RenderCache(args.cache, args.cache_size * 1024 * 1024)
+             if args.cache else None)
+    paths, seconds = render_batch(
+        texts, args.preset, args.background, args.font, args.output,
+        output_size=args.size, workers=args.workers,
+        first_line_indent=args.indent,
+        first_line_newline=args.first_line_newline,
+        output_format=args.format,
+        overlay_mode=args.overlay_mode,
+        presets=presets,
+        cache=cache,
+        encoding=encoding,
+    )
+    rate = len(paths) / seconds if seconds else float("inf")
+    print(f"已生成 {len(paths)} 页，用时 {seconds:.2f} 秒（{rate:.1f} 页/秒）")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"缓存命中 {stats['hits']}/{stats['hits'] + stats['misses']} 篇"
+              f"（{stats['hit_rate']:.0%}），缓存占用 {stats['bytes'] / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
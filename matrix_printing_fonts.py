@@ -0,0 +1,82 @@
+"""Font discovery and a shared cache of loaded ``ImageFont`` instances."""
+
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+
+class FontRegistry:
+    """Enumerate a fonts folder and hand out cached ``FreeTypeFont`` objects.
+
+    Fonts are keyed by ``(path, size, mtime)``: asking for the same font at
+    the same size again costs one ``os.stat`` instead of parsing a 10-20 MB
+    CJK font file, and replacing the file on disk invalidates the entry.
+    """
+
+    def __init__(self, folder, max_fonts=32):
+        self.folder = folder
+        self.max_fonts = max_fonts
+        self._fonts = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._fonts)
+
+    def list_fonts(self):
+        """Return the font file names in the folder, sorted by name."""
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names
+                      if name.lower().endswith(FONT_EXTENSIONS))
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def get(self, name, size):
+        """Return the font ``name`` at ``size``, loading it if needed."""
+        path = self.path(name)
+        key = (path, size, os.stat(path).st_mtime_ns)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+
+        font = ImageFont.truetype(path, size)
+        with self._lock:
+            self._fonts[key] = font
+            # 同一文件的旧版本已失效
+            for stale in [k for k in self._fonts
+                          if k[0] == path and k[2] != key[2]]:
+                del self._fonts[stale]
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def preload(self, name, size):
+        """Load a font on a background thread so the next ``get`` is instant."""
+        job = (name, size)
+        with self._lock:
+            if job in self._pending:
+                return None
+            self._pending.add(job)
+
+        def run():
+            try:
+                self.get(name, size)
+            except Exception as e:
+                print(f"预加载字体失败: {name}, 错误: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard(job)
+
+        thread = threading.Thread(target=run, name="font-preload", daemon=True)
+        thread.start()
+        return thread
@@ -1,13 +1,84 @@
+import time
+
+# 尽早记录启动时刻，用于统计从启动到首帧的耗时
+STARTED = time.perf_counter()
+
+import importlib
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageDraw, ImageFont, ImageTk
-import math
-import json
 import os
+import queue
 import shutil
-from datetime import datetime
+import threading
+from dataclasses import replace
+
+from matrix_printing_logic import (
+    GridSettings,
+    IncrementalLayout,
+    calculate_grid_metrics,
+    diff_placements,
+)
+from matrix_printing_presets import PresetLibrary, write_preset
+from matrix_printing_preview import (
+    PreviewFrame,
+    PreviewJob,
+    PreviewScheduler,
+    RenderCancelled,
+    RenderWorker,
+)
+from matrix_printing_timing import StageTimings
+
+
+# 占启动耗时大部分的图像处理模块（PIL、numpy 等），窗口显示之后才在后台线程中导入
+HEAVY_MODULES = (
+    "PIL.Image",
+    "PIL.ImageTk",
+    "matrix_printing_cache",
+    "matrix_printing_calibrate",
+    "matrix_printing_detect",
+    "matrix_printing_encode",
+    "matrix_printing_fonts",
+    "matrix_printing_pdf",
+    "matrix_printing_render",
+    "matrix_printing_storage",
+)
+
 
-from matrix_printing_logic import calculate_grid_metrics, split_text_paragraphs
+def load_modules():
+    """在后台线程中预先导入 HEAVY_MODULES
+
+    用到这些模块的方法在函数内部导入所需名称，预先导入之后那些导入
+    只是查一次 sys.modules。
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+# 状态栏中各阶段的显示名称
+STAGE_LABELS = {
+    "queue": "排队",
+    "background": "缩放底图",
+    "grid": "网格",
+    "font": "字体",
+    "layout": "排版",
+    "draw": "绘制",
+    "photo": "显示",
+    "latency": "总延迟",
+}
+
+# 预设中各参数缺少时的默认值
+PRESET_DEFAULTS = {
+    "start_x": "0.0",
+    "start_y": "0.0",
+    "cell_width": "0.0",
+    "cell_height": "0.0",
+    "font_size": "",
+    "offset_x": "1",
+    "offset_y": "-1",
+    "grid_columns": "",
+    "grid_rows": "",
+    "grid_line_thickness": "1.0",
+}
 
 class MatrixPrintingGUI:
     def __init__(self, root):
@@ -24,9 +95,36 @@ class MatrixPrintingGUI:
         
         # 图片相关变量
         self.image_path = None
-        self.image = None
+        self.image = None  # LazyPage：只读取文件头，需要像素时才解码
         self.preview_image = None
-        self.font_path = "LXGWWenKai-Regular.ttf"  # 默认字体
+        # 增量排版对象，按 (参数, 字体) 区分预览和导出，最多保留两个
+        self.layouts = {}
+        self.layout_lock = threading.Lock()
+        self.last_render = None  # (底图, 排版对象, 排版版本, 预览图, 第一页排版)，仅由预览线程使用
+        self.preview_item = None  # Canvas 上常驻的预览图元素
+        self.preview_page_count = 0  # 当前显示的预览共几页，只在 Tk 线程中读写
+        self.glyph_cache = None  # 字形边框和蒙版缓存，启动加载完成后创建
+        # 合并连续的预览请求，停止输入片刻后才真正渲染
+        self.preview_scheduler = PreviewScheduler(root, self.on_preview_due)
+        self.preview_layers = None  # 仅由预览线程使用，启动加载完成后创建
+        # 预览在后台线程渲染，新的请求会取消旧的渲染
+        self.render_worker = RenderWorker(self.render_preview_job)
+        # 各阶段耗时统计，退出时写入 logs/timings.json
+        self.timings = StageTimings()
+        self.show_timings = tk.BooleanVar(value=False)
+        # 网格识别要解码全图，也在后台线程中进行，过期的结果直接丢弃
+        self.detection_results = queue.Queue()
+        self.detecting = 0  # 尚未取回结果的识别次数
+        # 自动校准在后台线程中搜索参数，结果经队列交回 Tk 线程
+        self.calibration_results = queue.Queue()
+        self.calibrating = False
+        # 导出在后台线程中绘制、编码和写盘，界面保持响应
+        self.export_results = queue.Queue()
+        self.exporting = False
+        # 先显示窗口，图像模块、字体列表和预设在首帧之后由后台线程加载
+        self.startup_results = queue.Queue()
+        self.ready = False
+        self.first_frame = None  # 从启动到首帧的秒数
         
         # 参数变量
         self.start_x = tk.StringVar()
@@ -41,34 +139,127 @@ class MatrixPrintingGUI:
         self.grid_line_thickness = tk.StringVar(value="1")  # 添加线条粗细参数
         self.first_line_indent = tk.BooleanVar(value=True)  # 首段缩进控制
         self.first_line_newline = tk.BooleanVar(value=False)  # 首行换行控制
+        self.text_only = tk.BooleanVar(value=False)  # 仅输出文字，用于套打
         
-        # 创建必要的文件夹并清理旧文件
+        # 必要的文件夹在后台加载时创建
         self.folders = {
             'fonts': 'fonts',
             'uploads': 'uploads',
             'output': 'output',
-            'config': 'config'  # 添加 config 文件夹
+            'config': 'config',  # 添加 config 文件夹
+            'logs': 'logs'
         }
-        self.create_folders()
-        self.cleanup_uploads()  # 在启动时清理旧文件
+        
+        # 以下对象在启动加载完成后创建（finish_startup）
+        self.render_cache = None  # 导出结果按内容缓存在 output/cache
+        self.storage = None  # 上传去重，以及 uploads、output 的容量和期限检查
+        self.presets = None  # config 文件夹中的预设，常驻内存
+        self.selected_preset = tk.StringVar()
         
         # 字体相关变量
         self.fonts_list = []
         self.selected_font = tk.StringVar()
-        self.load_available_fonts()
+        self.font_registry = None
         
         # 添加输出尺寸选择
-        self.output_sizes = {
-            "原始尺寸": "original",
-            "A4 (2480x3508)": (2480, 3508),
-            "A3 (3508x4961)": (3508, 4961),
-            "4K (3840x2160)": (3840, 2160),
-            "高清 (1920x1080)": (1920, 1080)
-        }
+        self.output_sizes = {}
         self.selected_size = tk.StringVar(value="原始尺寸")
+        self.selected_encoding = tk.StringVar(value="PNG 彩色")
         
+        # 各面板先以空的下拉列表显示，加载完成后再填充
         self.setup_ui()
+        self.poll_preview_results()
+        self.root.bind('<Map>', self.on_first_map, add="+")
+        # 个别窗口管理器不发送 Map 事件时，稍后照样开始加载
+        self.root.after(1000, self.on_first_frame)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+    
+    def when_ready(self, command):
+        """包装按钮命令：启动加载完成之前忽略点击"""
+        def run(*args):
+            if self.ready:
+                return command(*args)
+        return run
+    
+    def on_first_map(self, event):
+        """主窗口显示后，等各控件绘制完再记录首帧"""
+        if event.widget is self.root and self.first_frame is None:
+            self.root.after_idle(self.on_first_frame)
+    
+    def on_first_frame(self):
+        """记录首帧耗时，并在后台线程中开始加载"""
+        if self.first_frame is not None:
+            return
+        self.first_frame = time.perf_counter() - STARTED
+        self.timings.record("startup_first_frame", self.first_frame)
+        self.status_var.set("正在加载……")
+        threading.Thread(target=self.run_startup, daemon=True).start()
+        self.root.after(20, self.poll_startup)
+    
+    def run_startup(self):
+        """后台线程：导入图像模块、创建文件夹、枚举字体并读取预设"""
+        from matrix_printing_fonts import FontRegistry
+
+        try:
+            with self.timings.stage("startup_load"):
+                load_modules()
+                self.create_folders()
+                font_registry = FontRegistry(self.folders['fonts'])
+                fonts_list = font_registry.list_fonts()
+                presets = PresetLibrary(self.folders['config'])
+            self.startup_results.put((font_registry, fonts_list, presets, None))
+        except Exception as e:
+            self.startup_results.put((None, None, None, e))
+    
+    def poll_startup(self):
+        """在 Tk 线程中取回加载结果"""
+        try:
+            font_registry, fonts_list, presets, error = self.startup_results.get_nowait()
+        except queue.Empty:
+            self.root.after(20, self.poll_startup)
+            return
+        
+        if error is not None:
+            self.report_error("startup", "启动加载失败", error)
+            messagebox.showerror("错误", f"启动加载失败: {str(error)}")
+            return
+        self.finish_startup(font_registry, fonts_list, presets)
+    
+    def finish_startup(self, font_registry, fonts_list, presets):
+        """创建依赖图像模块的对象，填充下拉框并应用默认预设"""
+        from matrix_printing_cache import RenderCache
+        from matrix_printing_encode import ENCODING_LABELS
+        from matrix_printing_render import OUTPUT_SIZES, GlyphCache, PreviewLayers
+        from matrix_printing_storage import OUTPUT_QUOTA, UPLOAD_QUOTA, StorageManager
+
+        self.font_registry = font_registry
+        self.presets = presets
+        self.glyph_cache = GlyphCache()
+        self.preview_layers = PreviewLayers()
+        self.render_cache = RenderCache(os.path.join(self.folders['output'], 'cache'))
+        # uploads 和 output 的容量与期限在后台线程中检查，启动时不扫描文件夹
+        self.storage = StorageManager(
+            self.folders['uploads'],
+            {self.folders['uploads']: UPLOAD_QUOTA,
+             self.folders['output']: OUTPUT_QUOTA},
+            caches=(self.render_cache,))
+        self.output_sizes = OUTPUT_SIZES
+        for name, values in ((self.size_combo_name, list(OUTPUT_SIZES)),
+                             (self.encoding_combo_name, list(ENCODING_LABELS)),
+                             (self.preset_combo_name, presets.names())):
+            self.root.nametowidget(name)['values'] = values
+        self.ready = True
+        
+        self.load_available_fonts(fonts_list)
         self.load_default_settings()
+        self.preload_selected_font()
+        self.root.after(1000, self.poll_presets)
+        self.storage.start(delay=10)  # 等首帧预览完成后再开始检查
+        
+        ready = time.perf_counter() - STARTED
+        self.timings.record("startup_ready", ready)
+        self.status_var.set(f"启动完成：首帧 {self.first_frame:.2f} 秒，"
+                            f"可以使用 {ready:.2f} 秒")
     
     def setup_ui(self):
         # 左侧面板：图片和参数设置
@@ -90,7 +281,8 @@ class MatrixPrintingGUI:
                                  values=list(self.output_sizes.keys()),
                                  state="readonly")
         size_combo.pack(fill=tk.X, pady=5)
-        size_combo.bind('<<ComboboxSelected>>', self.on_size_changed)
+        size_combo.bind('<<ComboboxSelected>>', self.when_ready(self.on_size_changed))
+        self.size_combo_name = str(size_combo)
         
         # 2. 网格参数（移到上传按钮之前）
         grid_frame = ttk.LabelFrame(self.left_frame, text="网格参数", padding="5")
@@ -103,8 +295,10 @@ class MatrixPrintingGUI:
         ttk.Entry(grid_frame, textvariable=self.grid_rows).pack(fill=tk.X, pady=2)
         
         # 3. 上传按钮
-        ttk.Button(self.left_frame, text="上传格子图片", command=self.load_image).pack(pady=5)
-        ttk.Button(self.left_frame, text="上传字体文件", command=self.load_font).pack(pady=5)
+        ttk.Button(self.left_frame, text="上传格子图片",
+                   command=self.when_ready(self.load_image)).pack(pady=5)
+        ttk.Button(self.left_frame, text="上传字体文件",
+                   command=self.when_ready(self.load_font)).pack(pady=5)
         
         # 4. 详细参数调整
         params_frame = ttk.LabelFrame(self.left_frame, text="参数调整", padding="5")
@@ -140,28 +334,39 @@ class MatrixPrintingGUI:
             ttk.Label(frame, text=label).pack(side=tk.LEFT)
             entry = ttk.Entry(frame, textvariable=var)
             entry.pack(side=tk.RIGHT)
-            var.trace_add("write", self.update_preview)
         
         # 参数预设
         preset_frame = ttk.LabelFrame(self.left_frame, text="参数预设", padding="5")
         preset_frame.pack(fill=tk.X, pady=5)
-        ttk.Button(preset_frame, text="保存当前参数", command=self.save_settings).pack(pady=2)
-        ttk.Button(preset_frame, text="加载保存的参数", command=self.load_settings).pack(pady=2)
+        preset_combo = ttk.Combobox(preset_frame,
+                                    textvariable=self.selected_preset,
+                                    state="readonly")
+        preset_combo.pack(fill=tk.X, pady=2)
+        preset_combo.bind("<<ComboboxSelected>>",
+                          lambda event: self.apply_preset(self.selected_preset.get()))
+        self.preset_combo_name = str(preset_combo)
+        ttk.Button(preset_frame, text="保存当前参数",
+                   command=self.when_ready(self.save_settings)).pack(pady=2)
+        ttk.Button(preset_frame, text="加载保存的参数",
+                   command=self.when_ready(self.load_settings)).pack(pady=2)
+        ttk.Button(preset_frame, text="自动校准",
+                   command=self.when_ready(self.calibrate_settings)).pack(pady=2)
         
-        # 为所有参数添加跟踪
+        # 为所有参数添加跟踪（每个变量只登记一次）
         params = [self.start_x, self.start_y, self.cell_width, self.cell_height,
-                  self.font_size, self.offset_x, self.offset_y, 
-                  self.grid_columns, self.grid_rows]
+                  self.grid_line_thickness, self.font_size, self.offset_x,
+                  self.offset_y, self.grid_columns, self.grid_rows]
         
         for var in params:
-            var.trace_add("write", self.update_preview)
+            var.trace_add("write", self.preview_scheduler.request)
         
         # 为字体选择添加跟踪
-        self.selected_font.trace_add("write", self.update_preview)
+        self.selected_font.trace_add("write", self.preload_selected_font)
+        self.selected_font.trace_add("write", self.preview_scheduler.request)
         
         # 为缩进和换行选项添加跟踪
-        self.first_line_indent.trace_add("write", self.update_preview)
-        self.first_line_newline.trace_add("write", self.update_preview)
+        self.first_line_indent.trace_add("write", self.preview_scheduler.request)
+        self.first_line_newline.trace_add("write", self.preview_scheduler.request)
     
     def setup_middle_panel(self):
         # 文本输入区域
@@ -180,9 +385,20 @@ class MatrixPrintingGUI:
         
         ttk.Checkbutton(format_frame, text="首行缩进", variable=self.first_line_indent).pack()
         ttk.Checkbutton(format_frame, text="首行换行", variable=self.first_line_newline).pack()
+        ttk.Checkbutton(format_frame, text="仅输出文字（套打）", variable=self.text_only).pack()
+        
+        # 图片编码：调色板、灰度和黑白 G4 比彩色 PNG 小得多，写盘也更快
+        encoding_frame = ttk.LabelFrame(self.middle_frame, text="输出编码", padding="5")
+        encoding_frame.pack(fill=tk.X, pady=5)
+        encoding_combo = ttk.Combobox(encoding_frame,
+                                      textvariable=self.selected_encoding,
+                                      state="readonly")
+        encoding_combo.pack(fill=tk.X, pady=5)
+        self.encoding_combo_name = str(encoding_combo)
         
         # 生成按钮
-        ttk.Button(self.middle_frame, text="生成图片", command=self.generate_image).pack(pady=10)
+        ttk.Button(self.middle_frame, text="生成图片",
+                   command=self.when_ready(self.generate_image)).pack(pady=10)
     
     def setup_right_panel(self):
         self.right_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)  # 添加 expand=True
@@ -194,46 +410,38 @@ class MatrixPrintingGUI:
         self.preview_canvas = tk.Canvas(preview_frame)
         self.preview_canvas.pack(fill=tk.BOTH, expand=True)
         
+        # 状态栏
+        self.status_var = tk.StringVar()
+        ttk.Label(self.right_frame, textvariable=self.status_var,
+                  anchor="w").pack(fill=tk.X)
+        ttk.Checkbutton(self.right_frame, text="显示耗时",
+                        variable=self.show_timings,
+                        command=self.update_status).pack(anchor="w")
+        
         # 绑定窗口大小变化事件
         self.root.bind('<Configure>', self.on_window_resize)
     
     def load_image(self):
-        """上传并处理图片"""
-        # 先检查网格参数
-        if not self.grid_columns.get() or not self.grid_rows.get():
-            messagebox.showerror("错误", "请先输入网格参数（每行格子数和格子行数）")
-            return
-            
-        try:
-            columns = int(self.grid_columns.get())
-            rows = int(self.grid_rows.get())
-            if columns <= 0 or rows <= 0:
-                messagebox.showerror("错误", "网格参数必须为正整数")
-                return
-        except ValueError:
-            messagebox.showerror("错误", "网格参数必须为有效的数字")
-            return
-        
+        """上传并处理图片，自动识别格子参数"""
+        from matrix_printing_render import LazyPage
+
         # 选择文件
         file_path = filedialog.askopenfilename(
             filetypes=[("Image files", "*.png *.jpg *.jpeg *.gif *.bmp")]
         )
         
         if file_path:
-            # 生成唯一文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"upload_{timestamp}{os.path.splitext(file_path)[1]}"
-            upload_path = os.path.join(self.folders['uploads'], filename)
-            
-            # 复制文件到 uploads 文件夹
-            shutil.copy2(file_path, upload_path)
+            # 按内容保存到 uploads 文件夹，同一张图只保存一份
+            upload_path = self.storage.store_upload(file_path)
+            self.storage.protect(upload_path)
             self.image_path = upload_path
             
-            # 保存原始图片并进行尺寸调整
-            self.original_image = Image.open(upload_path)
-            self.resize_image()
+            # 只读取图片尺寸，预览按 Canvas 大小降采样解码，导出时才解码全图
+            with self.timings.stage("load_image"):
+                self.image = LazyPage(upload_path,
+                                      self.output_sizes[self.selected_size.get()])
             self.calculate_params()  # 自动计算参数
-            self.update_preview()
+            self.preview_scheduler.request()
     
     def load_font(self):
         """上传并复制字体到 fonts 文件夹"""
@@ -254,14 +462,11 @@ class MatrixPrintingGUI:
                 
                 # 复制文件到 fonts 文件夹
                 shutil.copy2(font_path, dest_path)
+                self.glyph_cache.clear()  # 同名字体被替换后旧字形失效
                 
-                # 重新加载字体列表
+                # 重新加载字体列表并更新下拉框
                 self.load_available_fonts()
                 
-                # 更新下拉框的值
-                font_combo = self.root.nametowidget(self.font_combo_name)  # 获取下拉框组件
-                font_combo['values'] = self.fonts_list  # 更新可选值
-                
                 # 选择新上传的字体
                 self.selected_font.set(filename)
                 
@@ -270,7 +475,7 @@ class MatrixPrintingGUI:
                 messagebox.showerror("错误", f"添加字体失败: {str(e)}")
     
     def save_settings(self):
-        settings = {
+        values = {
             'start_x': format(float(self.start_x.get()), '.1f'),
             'start_y': format(float(self.start_y.get()), '.1f'),
             'cell_width': format(float(self.cell_width.get()), '.1f'),
@@ -293,8 +498,8 @@ class MatrixPrintingGUI:
         
         if filename:  # 如果用户没有取消
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(settings, f, ensure_ascii=False, indent=4)
+                write_preset(filename, values)
+                self.refresh_presets()
                 messagebox.showinfo("成功", "参数配置已保存")
             except Exception as e:
                 messagebox.showerror("错误", f"保存配置失败: {str(e)}")
@@ -309,432 +514,684 @@ class MatrixPrintingGUI:
             )
             
             if filename:  # 如果用户没有取消
-                with open(filename, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    self.start_x.set(settings.get('start_x', '0.0'))
-                    self.start_y.set(settings.get('start_y', '0.0'))
-                    self.cell_width.set(settings.get('cell_width', '0.0'))
-                    self.cell_height.set(settings.get('cell_height', '0.0'))
-                    self.font_size.set(settings.get('font_size', ''))
-                    self.offset_x.set(settings.get('offset_x', '1'))
-                    self.offset_y.set(settings.get('offset_y', '-1'))
-                    self.grid_columns.set(settings.get('grid_columns', ''))
-                    self.grid_rows.set(settings.get('grid_rows', ''))
-                    self.grid_line_thickness.set(settings.get('grid_line_thickness', '1.0'))
-                    messagebox.showinfo("成功", "参数配置已加载")
+                preset = self.presets.resolve(filename)
+                self.apply_preset_values(preset.values)
+                # 不在 config 文件夹中的文件不进入预设列表
+                in_library = preset.name in self.presets and \
+                    self.presets.get(preset.name).path == preset.path
+                self.selected_preset.set(preset.name if in_library else "")
+                messagebox.showinfo("成功", "参数配置已加载")
         except FileNotFoundError:
             messagebox.showerror("错误", "未找到配置文件")
         except Exception as e:
             messagebox.showerror("错误", f"加载配置失败: {str(e)}")
     
+    def apply_preset(self, name):
+        """应用内存中的预设"""
+        try:
+            self.apply_preset_values(self.presets.get(name).values)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+    
+    def apply_preset_values(self, values):
+        """一次性写入全部参数，只触发一次预览渲染"""
+        with self.preview_scheduler.hold():
+            for name, default in PRESET_DEFAULTS.items():
+                getattr(self, name).set(values.get(name, default))
+    
+    def refresh_presets(self):
+        """同步预设索引并更新下拉框，返回有变化的预设名"""
+        changed = self.presets.refresh()
+        if changed:
+            preset_combo = self.root.nametowidget(self.preset_combo_name)
+            preset_combo['values'] = self.presets.names()
+        return changed
+    
+    def poll_presets(self):
+        """定时检查 config 文件夹；当前预设被修改时自动重新应用"""
+        try:
+            changed = self.refresh_presets()
+            name = self.selected_preset.get()
+            if name in changed:
+                if name in self.presets:
+                    self.apply_preset_values(self.presets.get(name).values)
+                else:
+                    self.selected_preset.set("")
+        except Exception as e:
+            self.report_error("presets", "刷新参数预设失败", e)
+        self.root.after(1000, self.poll_presets)
+    
     def generate_image(self):
-        """生成并保存当前图片。"""
+        """排版后在后台线程中绘制、编码并保存（图片逐页保存，或合并为一个 PDF）。"""
+        from PIL import Image
+        from matrix_printing_encode import (
+            ENCODING_LABELS,
+            ENCODINGS,
+            FORMATS,
+            with_extension,
+        )
+        from matrix_printing_render import unique_name
+
+        if self.exporting:
+            return
         if not self.image:
             messagebox.showerror("错误", "请先上传图片")
             return
             
         try:
-            # 创建新图像并绘制文本
-            result_image = self.image.copy()
-            self.draw_text_on_image(result_image)
+            # 先完成排版，参数或字体有误时在选择保存位置之前报错
+            with self.timings.stage("export_layout"):
+                font, pages = self.layout_for_export()
             
             # 保存结果
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            default_filename = f"output_{timestamp}.png"
+            label = self.selected_encoding.get()
+            encoding = ENCODINGS[ENCODING_LABELS[label]]
+            default_filename = unique_name("output", encoding.extension)
             save_path = filedialog.asksaveasfilename(
                 initialdir=self.folders['output'],
                 initialfile=default_filename,
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png")]
+                defaultextension=encoding.extension,
+                filetypes=[(label, " ".join("*" + ext for ext in FORMATS[encoding.format])),
+                           ("PDF files", "*.pdf")]
             )
-            if save_path:
-                result_image.save(save_path, dpi=(300, 300))
-                result_image.show()
-                messagebox.showinfo("成功", "图片已生成并保存")
+            if not save_path:
+                return
+            
+            is_pdf = save_path.lower().endswith(".pdf")
+            if not is_pdf:
+                save_path = with_extension(save_path, encoding)
+            # 相同文本、参数、字体、底图和编码导出过时直接复制上次的结果
+            with self.timings.stage("export_cache"):
+                cache_key, cached = self.restore_export(save_path, is_pdf, encoding)
+            if cached:
+                if not is_pdf:
+                    with Image.open(cached[0]) as first_page:
+                        first_page.show()
+                messagebox.showinfo("成功", f"已保存 {len(cached)} 页（与上次导出相同，直接使用缓存）")
+                return
+            
+            self.exporting = True
+            self.status_var.set("正在生成图片，请稍候……")
+            threading.Thread(
+                target=self.run_export,
+                args=(self.image, font, pages, save_path, is_pdf, encoding,
+                      self.text_only.get(), cache_key),
+                daemon=True,
+            ).start()
+            self.root.after(100, self.poll_export)
                 
         except Exception as e:
+            self.timings.error("export", e)
             messagebox.showerror("错误", f"生成失败: {str(e)}")
     
-    def draw_text_on_image(self, result_image):
-        """在图片上绘制文本"""
-        draw = ImageDraw.Draw(result_image)
+    def run_export(self, page, font, pages, save_path, is_pdf, encoding,
+                   text_only, cache_key):
+        """后台线程：逐页绘制、编码并写盘，结果放入队列"""
+        from matrix_printing_encode import save_encoded
+        from matrix_printing_pdf import save_pdf
+        from matrix_printing_render import draw_glyph_layers, draw_pages, glyph_overlay
+
+        try:
+            # 逐页绘制并写盘，超出一页的文字自动续到下一页
+            # 套打模式只输出文字层，坐标与格子图片一致，直接打印在作文本上
+            # 全尺寸底图只在导出期间存在，套打模式完全不需要解码底图
+            with self.timings.stage("export"):
+                size = page.size
+                background = None if text_only else page.materialize()
+                if is_pdf:
+                    layers = draw_glyph_layers(size, pages, font,
+                                               glyph_cache=self.glyph_cache)
+                    count = save_pdf(save_path, layers, size, background=background)
+                    paths = [save_path] * count
+                else:
+                    if text_only:
+                        layers = draw_glyph_layers(size, pages, font,
+                                                   glyph_cache=self.glyph_cache)
+                        result_pages = (glyph_overlay(layer) for layer in layers)
+                    else:
+                        result_pages = draw_pages(background, pages, font, fill="black",
+                                                  glyph_cache=self.glyph_cache)
+                    # 绘制下一页的同时在编码线程中压缩上一页
+                    paths = save_encoded(result_pages, save_path, encoding)
+                del background  # 弹出提示框之前释放全尺寸底图
+            if cache_key is not None:
+                try:
+                    self.render_cache.put(cache_key, paths)
+                except OSError as e:
+                    self.report_error("export_cache", "写入渲染缓存失败", e)
+            self.export_results.put((paths, is_pdf, None))
+        except Exception as e:
+            self.export_results.put((None, is_pdf, e))
+    
+    def poll_export(self):
+        """在 Tk 线程中取回导出结果并提示"""
+        from PIL import Image
+
+        try:
+            paths, is_pdf, error = self.export_results.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_export)
+            return
         
-        # 获取参数
+        self.exporting = False
+        self.update_status()
+        if error is not None:
+            self.timings.error("export", error)
+            messagebox.showerror("错误", f"生成失败: {str(error)}")
+            return
+        if not is_pdf:
+            with Image.open(paths[0]) as first_page:
+                first_page.show()
+        messagebox.showinfo("成功", f"已生成并保存 {len(paths)} 页")
+    
+    def restore_export(self, save_path, is_pdf, encoding):
+        """查找渲染缓存，返回 (缓存键, 已复制到 save_path 的文件或 None)"""
         try:
-            start_x = float(self.start_x.get())
-            start_y = float(self.start_y.get())
-            cell_width = float(self.cell_width.get())
-            cell_height = float(self.cell_height.get())
-            grid_width = int(self.grid_columns.get())
-            font_size = int(self.font_size.get())
-            offset_x = int(self.offset_x.get())
-            offset_y = int(self.offset_y.get())
-            line_thickness = float(self.grid_line_thickness.get())  # 添加到参数列表
-            
-            # 计算实际的格子尺寸（包含线条厚度）
-            actual_cell_width = cell_width + line_thickness
-            actual_cell_height = cell_height + line_thickness
-            
-            # 创建字体对象
-            try:
-                font_path = os.path.join(self.folders['fonts'], self.selected_font.get())
-                font = ImageFont.truetype(font_path, font_size)
-            except Exception:
-                raise Exception("字体加载失败")
-            
-            # 获取文本并分段
+            settings = self.get_grid_settings(strict=True)
             text = self.text_input.get("1.0", tk.END)
-            paragraphs = split_text_paragraphs(text)
-            
-            # 绘制文本
-            current_x, current_y = start_x, start_y
-            line_char_count = 0
-            
-            for i, para in enumerate(paragraphs):
-                # 处理首行换行
-                if i == 0 and self.first_line_newline.get():
-                    current_x = start_x
-                    current_y += actual_cell_height
-                    line_char_count = 0
-                
-                # 处理段落缩进
-                if i == 0 and self.first_line_indent.get():
-                    current_x += actual_cell_width * 2
-                    line_char_count = 2
-                elif i > 0:
-                    if line_char_count > 0:
-                        current_x = start_x
-                        current_y += actual_cell_height
-                        line_char_count = 0
-                    current_x += actual_cell_width * 2
-                    line_char_count = 2
-                
-                # 绘制段落中的每个字符
-                for char in para:
-                    if line_char_count >= grid_width:
-                        current_x = start_x
-                        current_y += actual_cell_height
-                        line_char_count = 0
-                    
-                    # 计算字符位置（居中对齐）
-                    bbox = font.getbbox(char)
-                    char_width = bbox[2] - bbox[0]
-                    char_height = bbox[3] - bbox[1]
-                    
-                    char_x = current_x + (actual_cell_width - char_width) / 2 + offset_x
-                    char_y = current_y + (actual_cell_height - char_height) / 2 + offset_y
-                    
-                    draw.text((char_x, char_y), char, fill="black", font=font)
-                    
-                    current_x += actual_cell_width
-                    line_char_count += 1
-            
-            return result_image
+            font_path = self.font_registry.path(self.selected_font.get())
+            if self.text_only.get():
+                # 套打只用到底图尺寸
+                background, output_size = None, self.image.size
+            else:
+                background, output_size = self.image.path, self.image.output_size
+            key = self.render_cache.key(text, settings, font_path, background,
+                                        output_size,
+                                        "pdf" if is_pdf else encoding.cache_label,
+                                        "1" if self.text_only.get() else None)
+            return key, self.render_cache.restore(key, save_path)
+        except (OSError, ValueError) as e:
+            self.report_error("export_cache", "读取渲染缓存失败", e)
+            return None, None
+    
+    def layout_for_export(self):
+        """按原始分辨率排版当前文本，返回 (字体, 分页排版表)"""
+        settings = self.get_grid_settings(strict=True)
         
-        except ValueError:
-            raise ValueError("请确保所有参数都是有效的数值")
+        # 创建字体对象
+        try:
+            font = self.font_registry.get(self.selected_font.get(), settings.font_size)
+        except Exception:
+            raise Exception("字体加载失败")
+        
+        text = self.text_input.get("1.0", tk.END)
+        with self.layout_lock:
+            layout = self.compute_layout(text, settings, font)
+            return font, list(layout.pages())
+    
+    def get_grid_settings(self, strict=False):
+        """读取界面参数，返回不可变的 GridSettings 快照"""
+        values = {
+            'start_x': self.start_x.get(),
+            'start_y': self.start_y.get(),
+            'cell_width': self.cell_width.get(),
+            'cell_height': self.cell_height.get(),
+            'grid_columns': self.grid_columns.get(),
+            'grid_rows': self.grid_rows.get(),
+            'font_size': self.font_size.get(),
+            'offset_x': self.offset_x.get(),
+            'offset_y': self.offset_y.get(),
+            'grid_line_thickness': self.grid_line_thickness.get(),
+            'first_line_indent': self.first_line_indent.get(),
+            'first_line_newline': self.first_line_newline.get(),
+        }
+        return GridSettings.from_values(values, strict=strict)
+    
+    def compute_layout(self, text, settings, font):
+        """增量更新排版，只重排发生变化的段落（调用方需持有 layout_lock）"""
+        key = (settings, font.path, font.size)
+        layout = self.layouts.pop(key, None)
+        if layout is None:
+            layout = IncrementalLayout(settings, self.glyph_cache.measure(font))
+        self.layouts[key] = layout
+        while len(self.layouts) > 2:
+            del self.layouts[next(iter(self.layouts))]
+        layout.update(text)
+        return layout
     
     def create_folders(self):
         """创建必要的文件夹"""
         for folder in self.folders.values():
             os.makedirs(folder, exist_ok=True)
 
-    def load_available_fonts(self):
-        """加载 fonts 文件夹中的所有字体文件"""
-        self.fonts_list = [f for f in os.listdir(self.folders['fonts']) 
-                          if f.lower().endswith(('.ttf', '.otf'))]
+    def load_available_fonts(self, fonts_list=None):
+        """加载 fonts 文件夹中的所有字体文件并更新下拉框"""
+        if fonts_list is None:
+            fonts_list = self.font_registry.list_fonts()
+        self.fonts_list = fonts_list
+        font_combo = self.root.nametowidget(self.font_combo_name)
+        font_combo['values'] = self.fonts_list
         if self.fonts_list:
             self.selected_font.set(self.fonts_list[0])
 
-    def cleanup_uploads(self, days=7):
-        """清理超过指定天数的上传文件"""
+    def preload_selected_font(self, *args):
+        """在后台线程中提前加载当前字体，避免首次预览卡顿"""
         try:
-            current_time = datetime.now()
-            for filename in os.listdir(self.folders['uploads']):
-                file_path = os.path.join(self.folders['uploads'], filename)
-                file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                if (current_time - file_time).days > days:
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"清理文件失败: {filename}, 错误: {str(e)}")
-        except Exception as e:
-            print(f"清理上传文件夹失败: {str(e)}")
+            size = int(self.font_size.get())
+        except ValueError:
+            return
+        if self.selected_font.get():
+            self.font_registry.preload(self.selected_font.get(), size)
 
     def calculate_params(self):
-        """Calculate suggested parameters based on the uploaded image"""
+        """Calculate suggested parameters based on the uploaded image
+
+        First try to detect the printed grid (origin, pitch, line thickness,
+        rows and columns); if no grid is found, fall back to dividing the
+        page by the rows and columns the user typed. Detection decodes the
+        full image, so it runs on a background thread and the result is
+        applied by ``poll_detection``.
+        """
         if not self.image:
             messagebox.showerror("错误", "请先上传图片")
             return
-            
-        # Get image dimensions
-        img_width, img_height = self.image.size
         
-        # Get grid dimensions from user input
+        self.status_var.set("正在识别网格……")
+        self.detecting += 1
+        threading.Thread(target=self.run_detection, args=(self.image,),
+                         daemon=True).start()
+        if self.detecting == 1:
+            self.root.after(100, self.poll_detection)
+
+    def run_detection(self, page):
+        """后台线程：解码全图并识别网格，结果放入队列"""
+        from PIL import Image
+        from matrix_printing_detect import detect_grid
+
+        try:
+            with self.timings.stage("detect_grid"):
+                with Image.open(page.path) as source:
+                    metrics = detect_grid(source, page.output_size)
+            self.detection_results.put((page, metrics, None))
+        except Exception as e:
+            self.detection_results.put((page, None, e))
+
+    def poll_detection(self):
+        """在 Tk 线程中取回识别结果；底图或输出尺寸已改变时丢弃"""
+        while True:
+            try:
+                page, metrics, error = self.detection_results.get_nowait()
+            except queue.Empty:
+                break
+            self.detecting -= 1
+            if page is self.image:
+                self.update_status()
+                self.apply_detected_params(metrics, error)
+        if self.detecting:
+            self.root.after(100, self.poll_detection)
+
+    def apply_detected_params(self, metrics, error):
+        """填入识别出的网格参数，识别失败时按行列数均分页面"""
+        if error is not None:
+            self.report_error("detect_grid", "自动识别网格失败", error)
+        
+        if metrics is None:
+            # Get grid dimensions from user input
+            try:
+                columns = int(self.grid_columns.get())
+                rows = int(self.grid_rows.get())
+            except ValueError:
+                messagebox.showerror("错误", "未能识别出网格线，请先输入有效行数和列数")
+                return
+
+            try:
+                metrics = calculate_grid_metrics(self.image.size, columns, rows)
+            except ValueError as error:
+                messagebox.showerror("错误", str(error))
+                return
+
+        # Set calculated parameters
+        for name, value in metrics.items():
+            getattr(self, name).set(value)
+        
+        if "grid_columns" in metrics:
+            messagebox.showinfo("成功", f"已识别 {metrics['grid_columns']} 列 × "
+                                f"{metrics['grid_rows']} 行网格，参数已更新")
+        else:
+            messagebox.showinfo("成功", "参数已更新")
+        self.preview_scheduler.request()
+
+    def calibrate_settings(self):
+        """在后台搜索字号、偏移和格子尺寸，使文字居中于底图的格子，并另存为新预设"""
+        if self.calibrating:
+            return
+        if not self.image:
+            messagebox.showerror("错误", "请先上传图片")
+            return
+        if not self.selected_font.get():
+            messagebox.showerror("错误", "请先选择字体")
+            return
         try:
-            columns = int(self.grid_columns.get())
-            rows = int(self.grid_rows.get())
-        except ValueError:
-            messagebox.showerror("错误", "请先输入有效行数和列数")
+            settings = self.get_grid_settings(strict=True)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
             return
 
+        self.calibrating = True
+        self.status_var.set("正在自动校准，请稍候……")
+        threading.Thread(
+            target=self.run_calibration,
+            args=(self.image.path, self.image.output_size, settings,
+                  self.font_registry.path(self.selected_font.get())),
+            daemon=True,
+        ).start()
+        self.root.after(100, self.poll_calibration)
+
+    def run_calibration(self, image_path, output_size, settings, font_path):
+        """后台线程：执行校准并保存预设，结果放入队列"""
+        from PIL import Image
+        from matrix_printing_calibrate import calibrate, save_calibrated
+
         try:
-            metrics = calculate_grid_metrics((img_width, img_height), columns, rows)
-        except ValueError as error:
-            messagebox.showerror("错误", str(error))
+            with self.timings.stage("calibrate"):
+                with Image.open(image_path) as source:
+                    best, _, evaluations = calibrate(source, settings, font_path,
+                                                     output_size=output_size)
+                path = save_calibrated(best, self.folders['config'])
+            self.calibration_results.put((best, evaluations, path, None))
+        except Exception as e:
+            self.calibration_results.put((None, 0, None, e))
+
+    def poll_calibration(self):
+        """在 Tk 线程中取回校准结果并填入参数"""
+        try:
+            best, evaluations, path, error = self.calibration_results.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_calibration)
             return
 
-        # Set calculated parameters
-        self.start_x.set(metrics["start_x"])
-        self.start_y.set(metrics["start_y"])
-        self.cell_width.set(metrics["cell_width"])
-        self.cell_height.set(metrics["cell_height"])
-        self.font_size.set(metrics["font_size"])
-        
-        messagebox.showinfo("成功", "参数已更新")
-        self.update_preview()
+        self.calibrating = False
+        self.update_status()
+        if error is not None:
+            self.report_error("calibrate", "自动校准失败", error)
+            messagebox.showerror("错误", f"自动校准失败: {str(error)}")
+            return
+        with self.preview_scheduler.hold():
+            values = best.to_values()
+            for name in ("cell_width", "cell_height", "font_size", "offset_x", "offset_y"):
+                getattr(self, name).set(values[name])
+        self.refresh_presets()
+        messagebox.showinfo("成功", f"已评估 {evaluations} 组参数，"
+                            f"校准结果已保存为 {os.path.basename(path)}")
 
     def on_text_changed(self, event):
         """处理文本变化事件"""
         self.text_input.edit_modified(False)  # 重置modified标志
-        self.update_preview()
+        self.preview_scheduler.request()
 
     def on_window_resize(self, event):
         """处理窗口大小变化"""
         if hasattr(self, 'last_preview_image'):
-            self.update_preview()
+            self.preview_scheduler.request()
+
+    def on_preview_due(self):
+        """防抖计时结束后执行一次预览渲染"""
+        self.update_preview()
+        self.update_status()
+
+    def update_status(self):
+        """刷新预览下方的状态栏"""
+        status = (f"预览已渲染 {self.preview_scheduler.rendered} 次，"
+                  f"合并跳过 {self.preview_scheduler.skipped} 次")
+        if self.preview_page_count > 1:
+            status = f"第 1 页，共 {self.preview_page_count} 页；" + status
+        frame = self.timings.last_frame
+        if self.show_timings.get() and frame:
+            # 上一帧各阶段耗时（毫秒）
+            parts = [f"{STAGE_LABELS.get(name, name)} {seconds * 1000:.1f}"
+                     for name, seconds in frame.items()]
+            status += "\n上一帧(ms)：" + " · ".join(parts)
+        self.status_var.set(status)
+
+    def report_error(self, stage, message, error):
+        """输出错误信息并记入耗时统计"""
+        print(f"{message}: {str(error)}")
+        self.timings.error(stage, error)
+
+    def on_close(self):
+        """退出前停止后台渲染和存储检查，并把耗时统计写入 logs/timings.json"""
+        try:
+            # 正在渲染的大图只在阶段之间检查取消，不等它画完
+            self.render_worker.stop(timeout=0.5)
+            if self.storage is not None:
+                self.storage.stop(timeout=1)
+            self.timings.dump(os.path.join(self.folders['logs'], 'timings.json'))
+        except Exception as e:
+            print(f"保存耗时统计失败: {str(e)}")
+        self.root.destroy()
 
     def update_preview(self, *args):
-        """更新预览图像，包含网格和文本"""
+        """提交预览任务；网格和文本在后台线程中绘制"""
         if not self.image:
             return
-            
+        
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        if canvas_width <= 1 or canvas_height <= 1:
+            return
+        
         try:
-            # 创建原图副本
-            preview = self.image.copy()
-            draw = ImageDraw.Draw(preview)
-            
-            # 获取参数
+            settings = self.get_grid_settings()
+        except ValueError as e:
+            self.report_error("settings", "参数错误", e)
+            settings = None  # 如果参数无效，至少显示原图
+        
+        job = PreviewJob(
+            page=self.image,
+            settings=settings,
+            text=self.text_input.get("1.0", tk.END),
+            font_name=self.selected_font.get(),
+            canvas_size=(canvas_width, canvas_height),
+            requested_at=time.perf_counter(),
+        )
+        self.render_worker.submit(job)
+
+    def render_preview_job(self, job, is_cancelled):
+        """在后台线程中渲染预览，并附上这一帧各阶段的耗时"""
+        stages = {}
+        if job.requested_at is not None:
+            self.timings.record("queue", time.perf_counter() - job.requested_at,
+                                stages)
+        frame = self.draw_preview(job, is_cancelled, stages)
+        return replace(frame, timings=stages, requested_at=job.requested_at)
+
+    def draw_preview(self, job, is_cancelled, stages):
+        """在后台线程中绘制预览（不能访问任何 Tk 对象）
+
+        先把底图缩放到 Canvas 大小，再按同样比例缩放网格参数和字号，
+        直接在显示分辨率上绘制，导出时才使用原始分辨率。
+        """
+        # 缩放后的底图和网格层都有缓存，改文字时只重绘文字层
+        with self.timings.stage("background", stages):
+            background = self.preview_layers.background(job.page, job.canvas_size)
+        if job.settings is None:
+            return PreviewFrame(background)
+        
+        ratio = background.width / job.page.width
+        settings = job.settings.scaled(ratio)
+        with self.timings.stage("grid", stages):
+            grid = self.preview_layers.grid(background.size, settings)
+        font = None
+        if job.font_name:
             try:
-                start_x = float(self.start_x.get()) if self.start_x.get() else 0.0
-                start_y = float(self.start_y.get()) if self.start_y.get() else 0.0
-                cell_width = float(self.cell_width.get()) if self.cell_width.get() else 50.0
-                cell_height = float(self.cell_height.get()) if self.cell_height.get() else 50.0
-                columns = int(self.grid_columns.get()) if self.grid_columns.get() else 10
-                rows = int(self.grid_rows.get()) if self.grid_rows.get() else 10
-                font_size = int(self.font_size.get()) if self.font_size.get() else 30
-                offset_x = int(self.offset_x.get()) if self.offset_x.get() else 0
-                offset_y = int(self.offset_y.get()) if self.offset_y.get() else 0
-                line_thickness = float(self.grid_line_thickness.get()) if self.grid_line_thickness.get() else 1.0
-                
-                # 计算实际的格子尺寸
-                actual_cell_width = cell_width + line_thickness
-                actual_cell_height = cell_height + line_thickness
-                
-                # 绘制网格线
-                for i in range(columns + 1):
-                    x = start_x + i * actual_cell_width
-                    # 将浮点数坐标转换为整数
-                    x = round(x)
-                    y1 = round(start_y)
-                    y2 = round(start_y + rows * actual_cell_height)
-                    draw.line([(x, y1), (x, y2)], 
-                             fill="red", width=round(line_thickness))
-                
-                for i in range(rows + 1):
-                    y = start_y + i * actual_cell_height
-                    # 将浮点数坐标转换为整数
-                    y = round(y)
-                    x1 = round(start_x)
-                    x2 = round(start_x + columns * actual_cell_width)
-                    draw.line([(x1, y), (x2, y)], 
-                             fill="red", width=round(line_thickness))
-                
-                # 如果有文本且有选择字体，绘制文本
-                text = self.text_input.get("1.0", tk.END)
-                if text and self.selected_font.get():
-                    try:
-                        font_path = os.path.join(self.folders['fonts'], self.selected_font.get())
-                        font = ImageFont.truetype(font_path, font_size)
-                        
-                        current_x, current_y = start_x, start_y
-                        line_char_count = 0
-                        
-                        paragraphs = split_text_paragraphs(text)
-                        
-                        for i, para in enumerate(paragraphs):
-                            # 处理首行换行
-                            if i == 0 and self.first_line_newline.get():
-                                current_x = start_x
-                                current_y += actual_cell_height
-                                line_char_count = 0
-                            
-                            # 处理首行缩进
-                            if i == 0 and self.first_line_indent.get():
-                                current_x += actual_cell_width * 2
-                                line_char_count = 2
-                            elif i > 0:
-                                if line_char_count > 0:
-                                    current_x = start_x
-                                    current_y += actual_cell_height
-                                    line_char_count = 0
-                                current_x += actual_cell_width * 2
-                                line_char_count = 2
-                            
-                            for char in para:
-                                if line_char_count >= columns:
-                                    current_x = start_x
-                                    current_y += actual_cell_height
-                                    line_char_count = 0
-                                
-                                bbox = font.getbbox(char)
-                                char_width = bbox[2] - bbox[0]
-                                char_height = bbox[3] - bbox[1]
-                                
-                                # 使用实际格子尺寸计算字符位置
-                                char_x = current_x + (actual_cell_width - char_width) / 2 + offset_x
-                                char_y = current_y + (actual_cell_height - char_height) / 2 + offset_y
-                                
-                                draw.text((char_x, char_y), char, fill="blue", font=font)
-                                
-                                current_x += actual_cell_width
-                                line_char_count += 1
-                            
-                    except Exception as e:
-                        print(f"预览文本绘制失败: {str(e)}")
-                
-                # 保存原始预览图像
-                self.last_preview_image = preview
-                
-                # 获取Canvas当大小
-                canvas_width = self.preview_canvas.winfo_width()
-                canvas_height = self.preview_canvas.winfo_height()
-                
-                if canvas_width > 1 and canvas_height > 1:
-                    # 计算缩放比例
-                    width_ratio = canvas_width / preview.width
-                    height_ratio = canvas_height / preview.height
-                    ratio = min(width_ratio, height_ratio)
-                    
-                    # 计算新尺寸
-                    new_width = int(preview.width * ratio)
-                    new_height = int(preview.height * ratio)
-                    
-                    # 调整图像大小
-                    preview_resized = preview.resize((new_width, new_height), Image.LANCZOS)
-                    
-                    # 转换并显示
-                    self.preview_image = ImageTk.PhotoImage(preview_resized)
-                    
-                    # 清除Canvas并居中显示图像
-                    self.preview_canvas.delete("all")
-                    x = (canvas_width - new_width) // 2
-                    y = (canvas_height - new_height) // 2
-                    self.preview_canvas.create_image(x, y, anchor="nw", image=self.preview_image)
-                
-            except (ValueError, tk.TclError) as e:
-                print(f"参数错误: {str(e)}")
-                # 如果参数无效，至少显示原图
-                self.show_original_preview(preview)
-                
+                with self.timings.stage("font", stages):
+                    font = self.font_registry.get(job.font_name, settings.font_size)
+            except Exception as e:
+                self.report_error("font", "预览文本绘制失败", e)
+        
+        if font is None:
+            preview = background.copy()
+            preview.paste("red", (0, 0), grid)
+            return PreviewFrame(preview)
+        
+        # 如果有选择字体，绘制文本（预览只显示第一页）
+        try:
+            with self.timings.stage("layout", stages), self.layout_lock:
+                layout = self.compute_layout(job.text, settings, font)
+                version, dirty_rows = layout.version, layout.dirty_rows
+                page_count = layout.page_count
+                placements = layout.page(0)
         except Exception as e:
-            print(f"预览更新失败: {str(e)}")
+            self.report_error("layout", "预览文本绘制失败", e)
+            preview = background.copy()
+            preview.paste("red", (0, 0), grid)
+            return PreviewFrame(preview)
+        
+        if is_cancelled():
+            raise RenderCancelled()
+        
+        with self.timings.stage("draw", stages):
+            frame = self.draw_text_layer(background, grid, settings, font,
+                                         layout, version, dirty_rows, placements)
+        self.last_render = (background, layout, version, frame.image, placements)
+        # 页数随帧交回 Tk 线程，被取消的渲染不会改动状态栏
+        return replace(frame, page_count=page_count)
+
+    def draw_text_layer(self, background, grid, settings, font, layout,
+                        version, dirty_rows, placements):
+        """在缩放后的底图上绘制文字，能增量重绘时只重绘改动的行"""
+        from matrix_printing_render import dirty_boxes, draw_placements, redraw_rows
+
+        last = self.last_render
+        same_base = (last is not None and last[0] is background
+                     and last[1] is layout)
+        if same_base and last[2] == version:
+            preview = last[3]
+            frame = PreviewFrame(preview, base=preview, dirty_boxes=())
+        elif same_base and last[2] == version - 1 and dirty_rows is not None:
+            # 只重绘文字变化所在的行，并记下需要刷新到 Canvas 的区域
+            preview = redraw_rows(last[3].copy(), background, grid, settings,
+                                  placements, dirty_rows, font, fill="blue",
+                                  glyph_cache=self.glyph_cache)
+            changed = diff_placements(last[4], placements)
+            boxes = dirty_boxes(
+                changed, last[4], placements, settings,
+                lambda char: self.glyph_cache.glyph(font, char)[0],
+                preview.size)
+            area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in boxes)
+            if area * 2 > preview.width * preview.height:
+                boxes = None  # 改动太多时整图刷新更快
+            frame = PreviewFrame(preview, base=last[3],
+                                 dirty_boxes=None if boxes is None else tuple(boxes))
+        else:
+            preview = background.copy()
+            preview.paste("red", (0, 0), grid)
+            draw_placements(preview, placements, font, fill="blue",
+                            glyph_cache=self.glyph_cache)
+            frame = PreviewFrame(preview)
+        return frame
+
+    def poll_preview_results(self):
+        """在 Tk 线程中取回后台渲染结果并显示"""
+        latest = None
+        while True:
+            try:
+                latest = self.render_worker.results.get_nowait()
+            except queue.Empty:
+                break
+        
+        if latest is not None:
+            generation, frame, error = latest
+            if error is not None:
+                self.report_error("preview", "预览更新失败", error)
+            elif self.render_worker.is_current(generation):
+                self.show_preview(frame)
+        
+        self.root.after(30, self.poll_preview_results)
 
-    def show_original_preview(self, preview):
-        """显示原始图片预览（当参数无效时使用）"""
+    def show_preview(self, frame):
+        """将缩放好的预览图居中显示在 Canvas 上
+
+        尺寸不变时复用同一个 PhotoImage 和 Canvas 元素；如果新图只是在
+        当前显示的图上改了几处，只把这些区域写入 PhotoImage。
+        """
+        from PIL import ImageTk
+
+        if not isinstance(frame, PreviewFrame):
+            frame = PreviewFrame(frame)
+        preview_resized = frame.image
         canvas_width = self.preview_canvas.winfo_width()
         canvas_height = self.preview_canvas.winfo_height()
+        x = (canvas_width - preview_resized.width) // 2
+        y = (canvas_height - preview_resized.height) // 2
         
-        if canvas_width > 1 and canvas_height > 1:
-            width_ratio = canvas_width / preview.width
-            height_ratio = canvas_height / preview.height
-            ratio = min(width_ratio, height_ratio)
-            
-            new_width = int(preview.width * ratio)
-            new_height = int(preview.height * ratio)
-            
-            preview_resized = preview.resize((new_width, new_height), Image.LANCZOS)
-            self.preview_image = ImageTk.PhotoImage(preview_resized)
-            
-            self.preview_canvas.delete("all")
-            x = (canvas_width - new_width) // 2
-            y = (canvas_height - new_height) // 2
-            self.preview_canvas.create_image(x, y, anchor="nw", image=self.preview_image)
+        same_size = (self.preview_image is not None and self.preview_item is not None
+                     and (self.preview_image.width(), self.preview_image.height())
+                     == preview_resized.size)
+        with self.timings.stage("photo", frame.timings):
+            if not same_size:
+                # 尺寸变化（首次显示或窗口缩放）时才重建图像和 Canvas 元素
+                self.preview_image = ImageTk.PhotoImage(preview_resized)
+                self.preview_canvas.delete("all")
+                self.preview_item = self.preview_canvas.create_image(
+                    x, y, anchor="nw", image=self.preview_image)
+            else:
+                self.preview_canvas.coords(self.preview_item, x, y)
+                partial = (frame.dirty_boxes is not None
+                           and getattr(self, 'last_preview_image', None) is frame.base)
+                try:
+                    if partial:
+                        for box in frame.dirty_boxes:
+                            self.blit_preview_region(preview_resized, box)
+                    else:
+                        self.preview_image.paste(preview_resized)
+                except tk.TclError:
+                    self.preview_image.paste(preview_resized)
+        
+        # 记录从提交到显示的总延迟
+        if frame.timings is not None:
+            if frame.requested_at is not None:
+                self.timings.record("latency",
+                                    time.perf_counter() - frame.requested_at,
+                                    frame.timings)
+            self.timings.finish(frame.timings)
+        
+        # 保存预览图像
+        self.last_preview_image = preview_resized
+        self.preview_page_count = frame.page_count
+        self.update_status()
+
+    def blit_preview_region(self, image, box):
+        """把 image 中 box 区域写到 PhotoImage 的相同位置"""
+        region = image.crop(box)
+        if region.mode != "RGB":
+            region = region.convert("RGB")
+        data = (f"P6 {region.width} {region.height} 255\n".encode("ascii")
+                + region.tobytes())
+        self.root.tk.call(str(self.preview_image), "put", data,
+                          "-format", "ppm", "-to", box[0], box[1])
 
     def load_default_settings(self):
-        """加载默认配置文件，如果不存在则使用默认值"""
-        default_config = os.path.join(self.folders['config'], 'default.json')
-        try:
-            if os.path.exists(default_config):
-                with open(default_config, 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    self.start_x.set(settings.get('start_x', '0.0'))
-                    self.start_y.set(settings.get('start_y', '0.0'))
-                    self.cell_width.set(settings.get('cell_width', '0.0'))
-                    self.cell_height.set(settings.get('cell_height', '0.0'))
-                    self.font_size.set(settings.get('font_size', ''))
-                    self.offset_x.set(settings.get('offset_x', '1'))
-                    self.offset_y.set(settings.get('offset_y', '-1'))
-                    self.grid_columns.set(settings.get('grid_columns', ''))
-                    self.grid_rows.set(settings.get('grid_rows', ''))
-                    self.grid_line_thickness.set(settings.get('grid_line_thickness', '1.0'))
-        except Exception as e:
-            print(f"加载默认配置失败: {str(e)}")
+        """加载默认预设 config/default.json，如果不存在则使用默认值"""
+        if 'default' in self.presets:
+            self.apply_preset_values(self.presets.get('default').values)
+            self.selected_preset.set('default')
+        elif 'default' in self.presets.errors:
+            self.report_error("settings", "加载默认配置失败",
+                              ValueError(self.presets.errors['default']))
             # 如果加载失败，使用空白值
-            self.start_x.set('')
-            self.start_y.set('')
-            self.cell_width.set('')
-            self.cell_height.set('')
-            self.font_size.set('')
-            self.offset_x.set('1')
-            self.offset_y.set('-1')
-            self.grid_columns.set('')
-            self.grid_rows.set('')
-            self.grid_line_thickness.set('1.0')
+            self.apply_preset_values({name: '' for name in PRESET_DEFAULTS
+                                      if name not in ('offset_x', 'offset_y',
+                                                      'grid_line_thickness')})
 
     def on_size_changed(self, event=None):
         """处理输出尺寸变化"""
         if self.image:
             self.resize_image()
             self.calculate_params()  # 重新计算网格参数
-            self.update_preview()
+            self.preview_scheduler.request()
 
     def resize_image(self):
-        """根据选择的尺寸调整图片大小"""
-        if not hasattr(self, 'original_image'):
-            self.original_image = self.image.copy()
-        
+        """根据选择的尺寸调整页面大小
+
+        不在这里缩放像素：预览按 Canvas 大小解码，导出时才按输出尺寸
+        等比例缩放并居中粘贴到白色背景上。
+        """
         selected = self.selected_size.get()
         target_size = self.output_sizes[selected]
         
-        if target_size == "original":
-            self.image = self.original_image.copy()
-            return
-        
-        # 计算缩放比例
-        orig_width, orig_height = self.original_image.size
-        target_width, target_height = target_size
-        
-        # 计算等比例缩放
-        width_ratio = target_width / orig_width
-        height_ratio = target_height / orig_height
-        ratio = min(width_ratio, height_ratio)
-        
-        new_width = int(orig_width * ratio)
-        new_height = int(orig_height * ratio)
-        
-        # 创建新的空白图像（白色背景）
-        new_image = Image.new('RGB', target_size, 'white')
-        
-        # 调整原图大小
-        resized = self.original_image.resize((new_width, new_height), Image.LANCZOS)
-        
-        # 将调整后的图片居中粘贴到新图像上
-        x = (target_width - new_width) // 2
-        y = (target_height - new_height) // 2
-        new_image.paste(resized, (x, y))
-        
-        self.image = new_image
+        with self.timings.stage("resize"):
+            self.image = self.image.with_output_size(target_size)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,6 +1,9 @@
 """Core calculation helpers for matrix printing."""
 
 import re
+from dataclasses import dataclass, fields, replace
+
+INDENT_CELLS = 2
 
 
 def calculate_grid_metrics(image_size, columns, rows, font_padding=4):
@@ -31,3 +34,402 @@ def split_text_paragraphs(text):
         if segment.strip()
     ]
     return paragraphs
+
+
+@dataclass(frozen=True)
+class GridSettings:
+    """Immutable snapshot of every parameter the layout depends on.
+
+    Field names match the keys stored in ``config/*.json`` presets; the
+    defaults are the fallbacks the preview uses for empty entries.
+    """
+
+    start_x: float = 0.0
+    start_y: float = 0.0
+    cell_width: float = 50.0
+    cell_height: float = 50.0
+    grid_columns: int = 10
+    grid_rows: int = 10
+    font_size: int = 30
+    offset_x: int = 0
+    offset_y: int = 0
+    grid_line_thickness: float = 1.0
+    first_line_indent: bool = True
+    first_line_newline: bool = False
+
+    @property
+    def pitch_x(self):
+        """Horizontal distance between cell origins, including the line."""
+        return self.cell_width + self.grid_line_thickness
+
+    @property
+    def pitch_y(self):
+        """Vertical distance between cell origins, including the line."""
+        return self.cell_height + self.grid_line_thickness
+
+    @property
+    def cells_per_page(self):
+        return self.grid_columns * self.grid_rows
+
+    def cell_origin(self, cell_index):
+        """Return the top-left corner of ``cell_index`` in page pixels."""
+        row, col = divmod(cell_index, self.grid_columns)
+        return (self.start_x + col * self.pitch_x,
+                self.start_y + row * self.pitch_y)
+
+    def scaled(self, ratio):
+        """Return the same grid as seen on a page scaled by ``ratio``.
+
+        Used to lay out the preview directly at display resolution; cell
+        assignment is unchanged, only pixel geometry and font size shrink.
+        """
+        return replace(
+            self,
+            start_x=self.start_x * ratio,
+            start_y=self.start_y * ratio,
+            cell_width=self.cell_width * ratio,
+            cell_height=self.cell_height * ratio,
+            grid_line_thickness=self.grid_line_thickness * ratio,
+            offset_x=self.offset_x * ratio,
+            offset_y=self.offset_y * ratio,
+            font_size=max(1, round(self.font_size * ratio)),
+        )
+
+    @classmethod
+    def from_values(cls, values, strict=True):
+        """Build settings from preset-style string values.
+
+        With ``strict`` every numeric field must be present and valid, as
+        required for export. Otherwise empty or missing entries fall back
+        to the defaults, which is what the live preview needs while the
+        user is still typing.
+        """
+        parsed = {}
+        for field in fields(cls):
+            if field.name not in values:
+                if strict and field.type is not bool:
+                    raise ValueError("请确保所有参数都是有效的数值")
+                continue
+            raw = values[field.name]
+            if field.type is bool:
+                parsed[field.name] = bool(raw)
+                continue
+            if isinstance(raw, str):
+                raw = raw.strip()
+            if raw in ("", None):
+                if strict:
+                    raise ValueError("请确保所有参数都是有效的数值")
+                continue
+            try:
+                parsed[field.name] = (int(raw) if field.type is int
+                                      else float(raw))
+            except (TypeError, ValueError):
+                raise ValueError("请确保所有参数都是有效的数值") from None
+        return cls(**parsed)
+
+    def to_values(self):
+        """Return the preset-style string values that ``from_values`` reads."""
+        return {
+            "start_x": f"{self.start_x:.1f}",
+            "start_y": f"{self.start_y:.1f}",
+            "cell_width": f"{self.cell_width:.1f}",
+            "cell_height": f"{self.cell_height:.1f}",
+            "font_size": str(round(self.font_size)),
+            "offset_x": str(round(self.offset_x)),
+            "offset_y": str(round(self.offset_y)),
+            "grid_columns": str(round(self.grid_columns)),
+            "grid_rows": str(round(self.grid_rows)),
+            "grid_line_thickness": f"{self.grid_line_thickness:.1f}",
+        }
+
+
+def paragraph_start(index, prev_end, first_line_indent=True,
+                    first_line_newline=False):
+    """Return the ``(row, col)`` where paragraph ``index`` starts.
+
+    ``prev_end`` is the ``(row, col)`` just after the previous paragraph's
+    last character (``(0, 0)`` for the first paragraph).
+    """
+    row, col = prev_end
+    # 处理首行换行
+    if index == 0 and first_line_newline:
+        row += 1
+        col = 0
+
+    # 处理段落缩进
+    if index == 0 and first_line_indent:
+        col += INDENT_CELLS
+    elif index > 0:
+        if col > 0:
+            row += 1
+            col = 0
+        col += INDENT_CELLS
+    return row, col
+
+
+def paragraph_cells(para, columns, start_col):
+    """Lay out one paragraph starting at ``start_col`` of row 0.
+
+    Returns ``(cells, end)`` where ``cells`` holds ``(cell_index, char)``
+    relative to the paragraph's first row and ``end`` is the ``(row, col)``
+    just after its last character.
+    """
+    cells = []
+    row, col = 0, start_col
+    for char in para:
+        if col >= columns:
+            row += 1
+            col = 0
+        cells.append((row * columns + col, char))
+        col += 1
+    return cells, (row, col)
+
+
+def layout_cells(paragraphs, columns, first_line_indent=True,
+                 first_line_newline=False):
+    """Assign every character to a grid cell.
+
+    Returns a list of ``(cell_index, char)`` where ``cell_index`` counts
+    cells row by row from the top-left of the grid. Rows are not bounded,
+    so text longer than one page keeps going past ``grid_rows``.
+    """
+    cells = []
+    end = (0, 0)
+
+    for i, para in enumerate(paragraphs):
+        row, col = paragraph_start(i, end, first_line_indent,
+                                   first_line_newline)
+        para_cells, (end_row, end_col) = paragraph_cells(para, columns, col)
+        offset = row * columns
+        cells.extend((offset + index, char) for index, char in para_cells)
+        end = (row + end_row, end_col)
+
+    return cells
+
+
+def glyph_offset(settings, bbox):
+    """Offset from a cell's origin that centres a glyph with ``bbox``."""
+    left, top, right, bottom = bbox
+    return ((settings.pitch_x - (right - left)) / 2 + settings.offset_x,
+            (settings.pitch_y - (bottom - top)) / 2 + settings.offset_y)
+
+
+def place_glyphs(cells, settings, glyph_bbox):
+    """Turn ``(cell_index, char)`` pairs into a placement table.
+
+    ``glyph_bbox`` maps a character to its ``(left, top, right, bottom)``
+    box at the current font size (``ImageFont.getbbox`` fits). Each glyph
+    is centred in its cell and shifted by the configured offsets. Returns
+    a list of ``(cell_index, char, x, y)`` ready to be rasterized.
+    """
+    placements = []
+
+    for cell_index, char in cells:
+        origin_x, origin_y = settings.cell_origin(cell_index)
+        dx, dy = glyph_offset(settings, glyph_bbox(char))
+        placements.append((cell_index, char, origin_x + dx, origin_y + dy))
+
+    return placements
+
+
+def diff_placements(old, new):
+    """Return the cell indices whose glyph differs between two tables."""
+    before = {index: (char, x, y) for index, char, x, y in old}
+    after = {index: (char, x, y) for index, char, x, y in new}
+    return {index for index in before.keys() | after.keys()
+            if before.get(index) != after.get(index)}
+
+
+def text_cells(text, settings):
+    """Split ``text`` into paragraphs and assign every character a cell."""
+    return layout_cells(
+        split_text_paragraphs(text),
+        settings.grid_columns,
+        settings.first_line_indent,
+        settings.first_line_newline,
+    )
+
+
+def layout_text(text, settings, glyph_bbox):
+    """Split ``text`` into paragraphs and compute its placement table."""
+    return place_glyphs(text_cells(text, settings), settings, glyph_bbox)
+
+
+def page_count(cells, cells_per_page):
+    """Return how many pages ``cells`` fill; empty text still needs one."""
+    if cells_per_page <= 0:
+        raise ValueError("网格行数和列数必须为正整数")
+    if not cells:
+        return 1
+    return cells[-1][0] // cells_per_page + 1
+
+
+def paginate_cells(cells, cells_per_page):
+    """Yield the ``(cell_index, char)`` pairs of each page in turn.
+
+    Indices are rebased so every page starts at cell 0. Indentation and
+    paragraph breaks carry across page boundaries because they are already
+    part of the global cell numbering.
+    """
+    pages = page_count(cells, cells_per_page)
+    position = 0
+    for page in range(pages):
+        end = (page + 1) * cells_per_page
+        offset = page * cells_per_page
+        page_cells = []
+        while position < len(cells) and cells[position][0] < end:
+            cell_index, char = cells[position]
+            page_cells.append((cell_index - offset, char))
+            position += 1
+        yield page_cells
+
+
+def layout_pages(text, settings, glyph_bbox):
+    """Yield one placement table per page of ``settings.grid_rows`` rows.
+
+    Tables are computed lazily, so a caller that renders and writes each
+    page before asking for the next never holds the whole document.
+    """
+    cells = text_cells(text, settings)
+    for page_cells in paginate_cells(cells, settings.cells_per_page):
+        yield place_glyphs(page_cells, settings, glyph_bbox)
+
+
+class IncrementalLayout:
+    """Keep a document's placement table current across small edits.
+
+    Every paragraph after the first starts on a fresh row, so its cells
+    relative to that row depend only on its own text. Each paragraph's
+    cells and glyph offsets are kept as a checkpoint together with its
+    starting row: an edit re-lays out only the paragraphs whose text
+    changed and moves the ones after them by whole rows, without measuring
+    a single glyph again. Typing near the end of a long essay therefore
+    costs the same as typing in a short one.
+    """
+
+    def __init__(self, settings, glyph_bbox):
+        self.settings = settings
+        self.glyph_bbox = glyph_bbox
+        # 每次排版发生变化时加一，便于判断缓存的渲染结果是否只落后一步
+        self.version = 0
+        # 上次 update 中改变的行范围 (first, stop)，stop 为 None 表示直到末尾
+        self.dirty_rows = None
+        # 每段一个检查点: (text, start_row, start_col, glyphs, end)
+        # glyphs 为相对段首行的 (cell_index, char, dx, dy)
+        self._paragraphs = []
+
+    def update(self, text):
+        """Lay out ``text`` again, reusing every paragraph that did not change.
+
+        Returns ``dirty_rows``: ``(first, stop)`` in document rows, where
+        ``stop`` is None when everything from ``first`` on may have moved,
+        or None when the layout is unchanged.
+        """
+        paragraphs = split_text_paragraphs(text)
+        old = self._paragraphs
+        shared = min(len(old), len(paragraphs))
+
+        first = 0
+        while first < shared and old[first][0] == paragraphs[first]:
+            first += 1
+        if first == len(old) == len(paragraphs):
+            self.dirty_rows = None
+            return None
+
+        tail = 0
+        while (tail < shared - first
+               and old[-1 - tail][0] == paragraphs[-1 - tail]):
+            tail += 1
+
+        settings = self.settings
+        new = old[:first]
+        end = self._end(new[-1]) if new else (0, 0)
+        tail_start = len(paragraphs) - tail
+        for i in range(first, len(paragraphs)):
+            row, col = paragraph_start(i, end, settings.first_line_indent,
+                                       settings.first_line_newline)
+            reused = old[len(old) - len(paragraphs) + i] if i >= tail_start else None
+            if reused is not None and reused[2] == col:
+                glyphs, rel_end = reused[3], reused[4]
+            else:
+                glyphs, rel_end = self._layout_paragraph(paragraphs[i], col)
+            record = (paragraphs[i], row, col, glyphs, rel_end)
+            new.append(record)
+            end = self._end(record)
+
+        self.dirty_rows = self._dirty(old, new, first, tail)
+        self._paragraphs = new
+        self.version += 1
+        return self.dirty_rows
+
+    @property
+    def page_count(self):
+        cells = self.settings.cells_per_page
+        if cells <= 0:
+            raise ValueError("网格行数和列数必须为正整数")
+        last = None
+        for record in reversed(self._paragraphs):
+            if record[3]:
+                last = record[1] * self.settings.grid_columns + record[3][-1][0]
+                break
+        return 1 if last is None else last // cells + 1
+
+    def page(self, number):
+        """Return the placement table of page ``number``, as ``layout_pages``."""
+        settings = self.settings
+        columns = settings.grid_columns
+        first_row = number * settings.grid_rows
+        stop_row = first_row + settings.grid_rows
+        offset = number * settings.cells_per_page
+        placements = []
+
+        for _, row, _, glyphs, (end_row, _) in self._paragraphs:
+            if row + end_row < first_row or row >= stop_row:
+                continue
+            base = row * columns - offset
+            for rel_index, char, dx, dy in glyphs:
+                cell_index = base + rel_index
+                if 0 <= cell_index < settings.cells_per_page:
+                    origin_x, origin_y = settings.cell_origin(cell_index)
+                    placements.append(
+                        (cell_index, char, origin_x + dx, origin_y + dy))
+        return placements
+
+    def pages(self):
+        """Yield every page's placement table in order."""
+        for number in range(self.page_count):
+            yield self.page(number)
+
+    def _layout_paragraph(self, para, start_col):
+        cells, rel_end = paragraph_cells(para, self.settings.grid_columns,
+                                         start_col)
+        glyphs = [(index, char, *glyph_offset(self.settings,
+                                              self.glyph_bbox(char)))
+                  for index, char in cells]
+        return glyphs, rel_end
+
+    @staticmethod
+    def _end(record):
+        _, row, _, _, (end_row, end_col) = record
+        return row + end_row, end_col
+
+    def _dirty(self, old, new, first, tail):
+        def start_row(records, index):
+            return records[index][1] if index < len(records) else None
+
+        rows = [r for r in (start_row(old, first), start_row(new, first))
+                if r is not None]
+        if not rows:
+            # 只删除了末尾的段落
+            rows = [self._end(old[first - 1])[0] + 1] if first else [0]
+        dirty_first = min(rows)
+
+        if tail:
+            old_tail_row = old[len(old) - tail][1]
+            new_tail_row = new[len(new) - tail][1]
+            return (dirty_first, new_tail_row if old_tail_row == new_tail_row
+                    else None)
+
+        ends = [self._end(records[-1])[0] + 1
+                for records in (old, new) if records]
+        return (dirty_first, max(ends + [dirty_first]))
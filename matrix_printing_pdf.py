@@ -0,0 +1,186 @@
+"""Stream multi-page PDFs without holding every page in memory.
+
+Each page is the shared background image, embedded once for the whole
+document, with that page's glyph layer drawn over it. The glyph layer is
+the anti-aliased coverage mask produced by ``iter_glyph_layers``: it is
+stored as the soft mask of a solid-colour image, so the text keeps its
+smooth edges while pages stay a few kilobytes each.
+"""
+
+import io
+import os
+import zlib
+
+PDF_HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+POINTS_PER_INCH = 72
+
+
+class PdfWriter:
+    """Write a PDF one page at a time.
+
+    Objects are appended to the file as soon as a page is added; only the
+    page tree and cross-reference table are written on ``close``. Object 2
+    is reserved for the page tree so pages can point at it before it
+    exists. Leaving a ``with`` block on an exception calls ``abort``
+    instead, so a failed export never looks like a finished PDF.
+    """
+
+    def __init__(self, path, page_size, background=None, dpi=300,
+                 background_format="jpeg", jpeg_quality=90):
+        self.path = path
+        self.page_size = tuple(page_size)
+        self.dpi = dpi
+        if background is not None and background.size != self.page_size:
+            raise ValueError("底图尺寸必须与页面尺寸一致")
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._pages = []
+        self._next_id = 3
+        self._fill_streams = {}
+
+        self._background_id = None
+        try:
+            self._file.write(PDF_HEADER)
+            self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+            if background is not None:
+                self._background_id = self._write_image(
+                    background, background_format, jpeg_quality)
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    def add_page(self, glyph_layer=None, color=(0, 0, 0)):
+        """Append a page with ``glyph_layer`` (an ``L`` coverage mask) on top."""
+        width, height = self.page_size
+        points_w = width * POINTS_PER_INCH / self.dpi
+        points_h = height * POINTS_PER_INCH / self.dpi
+        resources = []
+        content = []
+
+        if self._background_id is not None:
+            resources.append(f"/Bg {self._background_id} 0 R")
+            content.append(f"q {points_w:.4f} 0 0 {points_h:.4f} 0 0 cm /Bg Do Q")
+
+        if glyph_layer is not None and glyph_layer.getbbox():
+            if glyph_layer.size != self.page_size:
+                raise ValueError("文字层尺寸必须与页面尺寸一致")
+            glyphs_id = self._write_glyph_layer(glyph_layer.convert("L"), color)
+            resources.append(f"/Gl {glyphs_id} 0 R")
+            content.append(f"q {points_w:.4f} 0 0 {points_h:.4f} 0 0 cm /Gl Do Q")
+
+        content_id = self._write_stream(
+            b"", "\n".join(content).encode("ascii"), compress=True)
+        page_id = self._new_id()
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent 2 0 R "
+            f"/MediaBox [0 0 {points_w:.4f} {points_h:.4f}] "
+            f"/Resources << /XObject << {' '.join(resources)} >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode("ascii"))
+        self._pages.append(page_id)
+
+    def close(self):
+        if self._file.closed:
+            return
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._pages)
+        self._write_object(2, (
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>"
+        ).encode("ascii"))
+
+        xref_offset = self._file.tell()
+        count = self._next_id
+        lines = [f"xref\n0 {count}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, count):
+            lines.append(f"{self._offsets[object_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {count} /Root 1 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._file.write("".join(lines).encode("ascii"))
+        self._file.close()
+
+    def abort(self):
+        """Close the file without finishing it and delete the partial output."""
+        if self._file.closed:
+            return
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _new_id(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _write_object(self, object_id, body):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode("ascii"))
+        self._file.write(body)
+        self._file.write(b"\nendobj\n")
+
+    def _write_stream(self, dictionary, data, compress=False):
+        if compress:
+            data = zlib.compress(data)
+            dictionary += b" /Filter /FlateDecode"
+        object_id = self._new_id()
+        self._write_object(object_id, (
+            b"<<" + dictionary + b" /Length " + str(len(data)).encode("ascii")
+            + b" >>\nstream\n" + data + b"\nendstream"
+        ))
+        return object_id
+
+    def _write_image(self, image, image_format, jpeg_quality):
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        colour_space = b"/DeviceRGB" if image.mode == "RGB" else b"/DeviceGray"
+        dictionary = (b" /Type /XObject /Subtype /Image /Width %d /Height %d"
+                      b" /ColorSpace %s /BitsPerComponent 8"
+                      % (image.width, image.height, colour_space))
+        if image_format == "jpeg":
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=jpeg_quality)
+            return self._write_stream(dictionary + b" /Filter /DCTDecode",
+                                      buffer.getvalue())
+        return self._write_stream(dictionary, image.tobytes(), compress=True)
+
+    def _write_glyph_layer(self, coverage, color):
+        width, height = coverage.size
+        mask_id = self._write_stream(
+            b" /Type /XObject /Subtype /Image /Width %d /Height %d"
+            b" /ColorSpace /DeviceGray /BitsPerComponent 8" % (width, height),
+            coverage.tobytes(), compress=True)
+
+        # 纯色底图每页相同，只压缩一次
+        color = tuple(color)
+        fill = self._fill_streams.get(color)
+        if fill is None:
+            fill = zlib.compress(bytes(color) * (width * height))
+            self._fill_streams[color] = fill
+        return self._write_stream(
+            b" /Type /XObject /Subtype /Image /Width %d /Height %d"
+            b" /ColorSpace /DeviceRGB /BitsPerComponent 8 /SMask %d 0 R"
+            b" /Filter /FlateDecode" % (width, height, mask_id),
+            fill)
+
+
+def save_pdf(path, glyph_layers, page_size, background=None, dpi=300,
+             color=(0, 0, 0), **options):
+    """Write every layer from ``glyph_layers`` as a PDF page; return the count."""
+    with PdfWriter(path, page_size, background=background, dpi=dpi,
+                   **options) as writer:
+        for layer in glyph_layers:
+            writer.add_page(layer, color=color)
+        return writer.page_count
@@ -0,0 +1,22 @@
+"""Process pools whose workers set up their state once.
+
+Renderers keep per-process objects (fonts, decoded backgrounds, glyph
+masks, cell maps) in a module-level ``_worker`` dict filled by an
+initializer, so tasks carry only what changes between them.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def worker_pool(initializer, initargs=(), workers=None):
+    """A process pool whose workers run ``initializer(*initargs)`` first.
+
+    Workers are spawned rather than forked: the GUI and the service start
+    pools from processes that already run other threads (Tk, the event
+    loop, storage sweeps), and forking such a process is unsafe.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer, initargs=initargs)
@@ -0,0 +1,159 @@
+"""An in-memory index of the ``config/*.json`` parameter presets.
+
+``PresetLibrary`` reads every preset once and afterwards only ``stat``s
+the folder: ``refresh`` reloads files whose modification time or size
+changed and drops deleted ones, so the GUI can poll it for hot reload and
+batch jobs can switch between templates without reading files per job.
+"""
+
+import json
+import os
+import threading
+from dataclasses import dataclass
+
+from matrix_printing_logic import GridSettings
+
+PRESET_EXTENSION = ".json"
+
+
+@dataclass(frozen=True)
+class Preset:
+    """One parsed preset file; ``values`` holds the raw preset strings."""
+
+    name: str
+    path: str
+    values: dict
+    mtime_ns: int = 0
+    size: int = 0
+
+    def settings(self, first_line_indent=True, first_line_newline=False):
+        """Return the preset as strict ``GridSettings``."""
+        values = dict(self.values)
+        values["first_line_indent"] = first_line_indent
+        values["first_line_newline"] = first_line_newline
+        return GridSettings.from_values(values)
+
+
+def read_preset(path, name=None):
+    """Parse the preset file at ``path`` into a ``Preset``."""
+    stat = os.stat(path)
+    with open(path, "r", encoding="utf-8") as f:
+        values = json.load(f)
+    if not isinstance(values, dict):
+        raise ValueError(f"参数预设格式不正确: {path}")
+    if name is None:
+        name = os.path.splitext(os.path.basename(path))[0]
+    return Preset(name, path, {key: str(value) for key, value in values.items()},
+                  stat.st_mtime_ns, stat.st_size)
+
+
+def write_preset(path, values):
+    """Write preset ``values`` to ``path`` atomically.
+
+    The file is written to a temporary name and moved into place, so a
+    concurrent ``refresh`` never sees a half-written preset.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(values, f, ensure_ascii=False, indent=4)
+    os.replace(temporary, path)
+    return path
+
+
+class PresetLibrary:
+    """Parsed presets of one folder, keyed by file name without ``.json``.
+
+    Files that fail to parse are left out of the index and their error
+    message is kept in ``errors`` until they are fixed or removed.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.errors = {}
+        self._presets = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __contains__(self, name):
+        return name in self._presets
+
+    def __len__(self):
+        return len(self._presets)
+
+    def names(self):
+        return sorted(self._presets)
+
+    def get(self, name):
+        try:
+            return self._presets[name]
+        except KeyError:
+            raise ValueError(f"未找到参数预设: {name}") from None
+
+    def settings(self, name, first_line_indent=True, first_line_newline=False):
+        return self.get(name).settings(first_line_indent, first_line_newline)
+
+    def path(self, name):
+        return os.path.join(self.folder, name + PRESET_EXTENSION)
+
+    def _scan(self):
+        """Return ``{name: stat}`` for every preset file in the folder."""
+        try:
+            entries = list(os.scandir(self.folder))
+        except FileNotFoundError:
+            return {}
+        return {
+            entry.name[:-len(PRESET_EXTENSION)]: entry.stat()
+            for entry in entries
+            if entry.name.lower().endswith(PRESET_EXTENSION) and entry.is_file()
+        }
+
+    def refresh(self):
+        """Re-read added or modified files and forget deleted ones.
+
+        Returns the sorted names whose contents changed, appeared or
+        disappeared since the previous call.
+        """
+        changed = []
+        with self._lock:
+            found = self._scan()
+            for name in list(self._presets) + list(self.errors):
+                if name not in found:
+                    if self._presets.pop(name, None) is not None:
+                        changed.append(name)
+                    self.errors.pop(name, None)
+            for name, stat in found.items():
+                known = self._presets.get(name)
+                if (known is not None and known.mtime_ns == stat.st_mtime_ns
+                        and known.size == stat.st_size):
+                    continue
+                try:
+                    preset = read_preset(os.path.join(self.folder, name
+                                                      + PRESET_EXTENSION), name)
+                except (OSError, ValueError) as e:
+                    # 写到一半或格式错误的文件：保留旧内容，下次再试
+                    self.errors[name] = str(e)
+                    continue
+                self.errors.pop(name, None)
+                if known is None or known.values != preset.values:
+                    changed.append(name)
+                self._presets[name] = preset
+        return sorted(set(changed))
+
+    def resolve(self, name_or_path):
+        """Return the preset for a library name or a preset file path.
+
+        Files inside the folder are served from the index; any other file
+        is read directly without being added to it.
+        """
+        if name_or_path in self._presets:
+            return self._presets[name_or_path]
+        path = os.path.abspath(name_or_path)
+        if os.path.dirname(path) == os.path.abspath(self.folder):
+            # 对话框里选中的文件可能刚被改过，先同步索引
+            self.refresh()
+            name = os.path.splitext(os.path.basename(path))[0]
+            if name in self._presets:
+                return self._presets[name]
+        if not os.path.isfile(name_or_path):
+            raise ValueError(f"未找到参数预设: {name_or_path}")
+        return read_preset(name_or_path)
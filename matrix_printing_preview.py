@@ -0,0 +1,196 @@
+"""Scheduling helpers that keep preview rendering off the typing path."""
+
+import queue
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+
+class PreviewScheduler:
+    """Coalesce preview requests with ``after()``-based debouncing.
+
+    Every request restarts a short timer on ``widget``; only when no new
+    request arrives for ``delay_ms`` does ``callback`` run. Requests that
+    are superseded before their timer fires are counted as skipped.
+    """
+
+    def __init__(self, widget, callback, delay_ms=80):
+        self.widget = widget
+        self.callback = callback
+        self.delay_ms = delay_ms
+        self.requested = 0
+        self.rendered = 0
+        self.skipped = 0
+        self._after_id = None
+        self._holds = 0
+        self._deferred = False
+
+    @property
+    def pending(self):
+        return self._after_id is not None or self._deferred
+
+    def request(self, *args):
+        """Ask for a render; accepts and ignores Tk trace/event arguments."""
+        self.requested += 1
+        if self._holds:
+            if self._deferred:
+                self.skipped += 1
+            self._deferred = True
+            return
+        self._schedule()
+
+    @contextmanager
+    def hold(self):
+        """Merge every request made inside the block into one at its end.
+
+        Used when several entries change together, such as applying a
+        preset, so their traces cause a single render.
+        """
+        self._holds += 1
+        try:
+            yield self
+        finally:
+            self._holds -= 1
+            if not self._holds and self._deferred:
+                self._deferred = False
+                self._schedule()
+
+    def _schedule(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self.skipped += 1
+        self._after_id = self.widget.after(self.delay_ms, self._fire)
+
+    def flush(self):
+        """Run a pending render immediately."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._fire()
+
+    def cancel(self):
+        """Drop a pending render without running it."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+            self.skipped += 1
+
+    def _fire(self):
+        self._after_id = None
+        self.rendered += 1
+        self.callback()
+
+
+class RenderCancelled(Exception):
+    """Raised by a render function once a newer job has superseded it."""
+
+
+@dataclass(frozen=True)
+class PreviewJob:
+    """Everything one preview render needs, captured on the Tk thread.
+
+    ``page`` is the background image; it is only ever read and copied,
+    never drawn on. ``settings`` is None when the entries are invalid, in
+    which case only the page itself is shown. ``requested_at`` is the
+    ``time.perf_counter()`` reading when the job was submitted.
+    """
+
+    page: object
+    settings: object
+    text: str
+    font_name: str
+    canvas_size: tuple
+    requested_at: float = None
+
+
+@dataclass(frozen=True)
+class PreviewFrame:
+    """A finished preview and how it differs from the frame before it.
+
+    ``dirty_boxes`` lists the pixel boxes that changed relative to
+    ``base`` (the previous frame's image); None means repaint everything.
+    ``timings`` maps stage names to the seconds spent on this frame, and
+    ``page_count`` is how many pages the text fills (0 without text).
+    """
+
+    image: object
+    base: object = None
+    dirty_boxes: tuple = None
+    timings: dict = None
+    requested_at: float = None
+    page_count: int = 0
+
+
+class RenderWorker:
+    """Run renders on a background thread, always favouring the newest job.
+
+    ``render(job, is_cancelled)`` runs off the Tk thread and should raise
+    ``RenderCancelled`` when ``is_cancelled()`` turns true between stages.
+    Finished renders arrive on ``results`` as ``(generation, result, error)``
+    for the Tk thread to pick up; results of superseded jobs are dropped.
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self.results = queue.Queue()
+        self.generation = 0
+        self.cancelled = 0
+        self._job = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="preview-render",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        """Queue ``job``, replacing any job that has not started yet."""
+        with self._condition:
+            self.generation += 1
+            if self._job is not None:
+                self.cancelled += 1
+            self._job = (self.generation, job)
+            self._condition.notify()
+            return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def stop(self, timeout=None):
+        """Cancel the running render and wait up to ``timeout`` seconds for it.
+
+        The thread is a daemon, so a render still stuck in a stage when the
+        timeout expires does not keep the program alive.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _count_cancelled(self):
+        # submit 在 Tk 线程中持锁计数，这里同样要持锁
+        with self._condition:
+            self.cancelled += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._job is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                generation, job = self._job
+                self._job = None
+
+            try:
+                image = self.render(
+                    job, lambda: self._stopped or not self.is_current(generation))
+            except RenderCancelled:
+                self._count_cancelled()
+                continue
+            except Exception as e:
+                self.results.put((generation, None, e))
+                continue
+
+            if self.is_current(generation):
+                self.results.put((generation, image, None))
+            else:
+                self._count_cancelled()
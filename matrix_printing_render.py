@@ -0,0 +1,550 @@
+"""Rasterize grid overlays and placement tables with Pillow.
+
+Nothing here touches Tk, so the same code serves the GUI preview, export
+and headless batch jobs.
+"""
+
+import json
+import math
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from matrix_printing_logic import layout_pages
+
+# Modes whose pixels accept a named colour in ``Image.paste``.
+MASK_PASTE_MODES = ("RGB", "RGBA", "L")
+
+# 输出尺寸选项，"original" 表示保持上传图片的尺寸
+OUTPUT_SIZES = {
+    "原始尺寸": "original",
+    "A4 (2480x3508)": (2480, 3508),
+    "A3 (3508x4961)": (3508, 4961),
+    "4K (3840x2160)": (3840, 2160),
+    "高清 (1920x1080)": (1920, 1080),
+}
+
+
+class GlyphCache:
+    """Bounded LRU cache of glyph boxes and pre-rendered alpha masks.
+
+    Entries are keyed by ``(font file, size, char)``, so several fonts and
+    sizes can share one cache. Essays repeat a few hundred characters, so
+    after the first page nearly every glyph is a cache hit and drawing it
+    is a single mask paste instead of a FreeType render.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # 预览线程与导出可能同时使用同一个缓存
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def glyph(self, font, char):
+        """Return ``(bbox, mask)`` for ``char``; ``mask`` is None for blanks."""
+        key = (font.path, font.size, char)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            bbox = font.getbbox(char)
+            left, top, right, bottom = bbox
+            mask = None
+            if right > left and bottom > top:
+                mask = Image.new("L", (right - left, bottom - top), 0)
+                ImageDraw.Draw(mask).text((-left, -top), char, fill=255,
+                                          font=font)
+            entry = (bbox, mask)
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+
+    def measure(self, font):
+        """Return a ``glyph_bbox`` callable for ``layout_text``."""
+        return lambda char: self.glyph(font, char)[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+def _line_coverage(length, positions, thickness):
+    """Fraction of each of ``length`` pixels covered by lines at ``positions``.
+
+    Lines are ``thickness`` wide and centred on the pixel a position rounds
+    to in Pillow's convention, so fractional positions and widths such as
+    93.5/0.5 shade partial pixels instead of being rounded away.
+    """
+    centres = np.asarray(positions, dtype=np.float64)[:, None] + 0.5
+    pixels = np.arange(length, dtype=np.float64)[None, :]
+    overlap = (np.minimum(pixels + 1, centres + thickness / 2)
+               - np.maximum(pixels, centres - thickness / 2))
+    return np.clip(overlap, 0, 1).sum(axis=0).clip(0, 1)
+
+
+def _to_alpha(coverage):
+    return np.rint(coverage * 255).astype(np.uint8)
+
+
+def grid_mask(size, settings):
+    """Return an ``L`` image of ``size`` with the grid lines set to 255.
+
+    The mask is built from one coverage profile per axis: vertical lines
+    are the column profile repeated over the grid's rows and horizontal
+    lines the row profile repeated over its columns, so anti-aliased edges
+    reflect the exact sub-pixel thickness.
+    """
+    width, height = size
+    thickness = settings.grid_line_thickness
+    xs = settings.start_x + np.arange(settings.grid_columns + 1) * settings.pitch_x
+    ys = settings.start_y + np.arange(settings.grid_rows + 1) * settings.pitch_y
+
+    columns = _line_coverage(width, xs, thickness)
+    rows = _line_coverage(height, ys, thickness)
+    # 网格外框所覆盖的像素范围
+    (x_inside,) = np.nonzero(_line_coverage(width, [(xs[0] + xs[-1]) / 2],
+                                            xs[-1] - xs[0] + thickness))
+    (y_inside,) = np.nonzero(_line_coverage(height, [(ys[0] + ys[-1]) / 2],
+                                            ys[-1] - ys[0] + thickness))
+
+    mask = np.zeros((height, width), dtype=np.uint8)
+    if x_inside.size and y_inside.size:
+        x0, x1 = x_inside[0], x_inside[-1] + 1
+        y0, y1 = y_inside[0], y_inside[-1] + 1
+        mask[y0:y1, x0:x1] = np.maximum(_to_alpha(columns[x0:x1])[None, :],
+                                        _to_alpha(rows[y0:y1])[:, None])
+    return Image.fromarray(mask, "L")
+
+
+def draw_grid(image, settings, fill="red"):
+    """Paint the grid described by ``settings`` onto an RGB, RGBA or L image."""
+    image.paste(fill, (0, 0), grid_mask(image.size, settings))
+    return image
+
+
+def grid_key(settings):
+    """The subset of ``settings`` that decides how the grid looks."""
+    return (settings.start_x, settings.start_y, settings.pitch_x,
+            settings.pitch_y, settings.grid_line_thickness,
+            settings.grid_columns, settings.grid_rows)
+
+
+def draw_placements(image, placements, font, fill="black", glyph_cache=None,
+                    origin=(0, 0)):
+    """Draw every glyph of a placement table onto ``image``.
+
+    With a ``glyph_cache`` each glyph is pasted from its cached mask;
+    positions are rounded to whole pixels. ``image`` may be a crop of the
+    page whose top-left corner is at the integer page point ``origin``;
+    positions are rounded in page coordinates first, so a glyph lands on
+    the same page pixel as when the whole page is drawn.
+    """
+    origin_x, origin_y = origin
+    if glyph_cache is None or image.mode not in MASK_PASTE_MODES:
+        draw = ImageDraw.Draw(image)
+        for _, char, x, y in placements:
+            draw.text((x - origin_x, y - origin_y), char, fill=fill, font=font)
+        return image
+
+    for _, char, x, y in placements:
+        (left, top, _, _), mask = glyph_cache.glyph(font, char)
+        if mask is not None:
+            image.paste(fill, (round(x + left) - origin_x,
+                               round(y + top) - origin_y), mask)
+    return image
+
+
+def preview_ratio(page_size, canvas_size):
+    """Return the scale at which a page of ``page_size`` fits the canvas."""
+    return min(canvas_size[0] / page_size[0], canvas_size[1] / page_size[1])
+
+
+def fit_to_canvas(image, canvas_size):
+    """Scale ``image`` down to fit ``canvas_size``, keeping its aspect ratio."""
+    ratio = preview_ratio(image.size, canvas_size)
+    new_width = max(1, int(image.width * ratio))
+    new_height = max(1, int(image.height * ratio))
+    return image.resize((new_width, new_height), Image.LANCZOS)
+
+
+class PreviewLayers:
+    """Cache the preview's scaled background and grid overlay.
+
+    The scanned page only needs rescaling when the page or the canvas size
+    changes, and the grid mask only when the grid geometry changes, so a
+    text edit re-composites glyphs over pixels that are already scaled.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._page = None
+        self._backgrounds = OrderedDict()
+        self._grids = OrderedDict()
+
+    def background(self, page, canvas_size):
+        """Return ``page`` scaled to fit ``canvas_size`` as an RGB image."""
+        # 换了底图后旧的缩放结果全部作废，也不再持有旧底图
+        if page is not self._page:
+            self._page = page
+            self._backgrounds.clear()
+
+        key = tuple(canvas_size)
+        scaled = self._backgrounds.get(key)
+        if scaled is not None:
+            self._backgrounds.move_to_end(key)
+            return scaled
+
+        if isinstance(page, LazyPage):
+            scaled = page.preview(canvas_size)
+        else:
+            scaled = fit_to_canvas(page, canvas_size).convert("RGB")
+        self._store(self._backgrounds, key, scaled)
+        return scaled
+
+    def grid(self, size, settings):
+        """Return the grid mask for ``settings`` drawn at ``size``."""
+        key = (tuple(size), grid_key(settings))
+        mask = self._grids.get(key)
+        if mask is not None:
+            self._grids.move_to_end(key)
+            return mask
+
+        mask = grid_mask(size, settings)
+        self._store(self._grids, key, mask)
+        return mask
+
+    def clear(self):
+        self._page = None
+        self._backgrounds.clear()
+        self._grids.clear()
+
+    def _store(self, entries, key, value):
+        entries[key] = value
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+def redraw_rows(image, background, grid, settings, placements, rows, font,
+                fill="black", grid_fill="red", glyph_cache=None):
+    """Re-rasterize only the grid rows ``rows`` of a rendered page in place.
+
+    ``rows`` is ``(first, stop)`` in page rows, ``stop`` None meaning to the
+    bottom. The band (padded by a row on each side) is rebuilt from the
+    cached ``background`` and ``grid`` layers, and glyphs from the rows
+    around it are redrawn clipped to the band, so characters that spill
+    over a cell border stay whole.
+    """
+    first, stop = rows
+    if first >= settings.grid_rows:
+        return image
+    band_first = max(first - 1, 0)
+    band_stop = (settings.grid_rows if stop is None
+                 else min(stop + 1, settings.grid_rows))
+
+    y0 = 0 if band_first == 0 else math.floor(
+        settings.start_y + band_first * settings.pitch_y)
+    y1 = image.height if band_stop >= settings.grid_rows else math.ceil(
+        settings.start_y + band_stop * settings.pitch_y)
+    y0, y1 = max(y0, 0), min(y1, image.height)
+    if y1 <= y0:
+        return image
+
+    box = (0, y0, image.width, y1)
+    band = background.crop(box)
+    band.paste(grid_fill, (0, 0), grid.crop(box))
+    columns = settings.grid_columns
+    nearby = [placement for placement in placements
+              if band_first - 1 <= placement[0] // columns <= band_stop]
+    draw_placements(band, nearby, font, fill=fill, glyph_cache=glyph_cache,
+                    origin=(0, y0))
+    image.paste(band, (0, y0))
+    return image
+
+
+def dirty_boxes(cells, old, new, settings, glyph_bbox, size):
+    """Pixel boxes that must be refreshed for the changed ``cells``.
+
+    Each cell's rectangle is grown to cover the ink of its old and new
+    glyph, so characters larger than their cell are fully erased and
+    redrawn; boxes in the same grid row are merged into one.
+    """
+    glyphs = {}
+    for index, char, x, y in list(old) + list(new):
+        if index in cells:
+            glyphs.setdefault(index, []).append((char, x, y))
+
+    rows = {}
+    for index in cells:
+        origin_x, origin_y = settings.cell_origin(index)
+        box = [origin_x, origin_y, origin_x + settings.pitch_x,
+               origin_y + settings.pitch_y]
+        for char, x, y in glyphs.get(index, ()):
+            left, top, right, bottom = glyph_bbox(char)
+            box = [min(box[0], x + left), min(box[1], y + top),
+                   max(box[2], x + right), max(box[3], y + bottom)]
+        row = index // settings.grid_columns
+        merged = rows.get(row)
+        rows[row] = box if merged is None else [
+            min(merged[0], box[0]), min(merged[1], box[1]),
+            max(merged[2], box[2]), max(merged[3], box[3])]
+
+    width, height = size
+    boxes = []
+    for x0, y0, x1, y1 in rows.values():
+        box = (max(math.floor(x0) - 1, 0), max(math.floor(y0) - 1, 0),
+               min(math.ceil(x1) + 1, width), min(math.ceil(y1) + 1, height))
+        if box[0] < box[2] and box[1] < box[3]:
+            boxes.append(box)
+    return boxes
+
+
+def page_placement(source_size, target_size):
+    """Return ``(x, y, width, height)`` of a source scaled into the page.
+
+    The source keeps its aspect ratio and is centred; for ``"original"``
+    it covers the whole page at its own size.
+    """
+    if target_size == "original":
+        return (0, 0) + tuple(source_size)
+    target_width, target_height = target_size
+    source_width, source_height = source_size
+    ratio = min(target_width / source_width, target_height / source_height)
+    new_width = int(source_width * ratio)
+    new_height = int(source_height * ratio)
+    return ((target_width - new_width) // 2, (target_height - new_height) // 2,
+            new_width, new_height)
+
+
+def fit_page(image, target_size):
+    """Scale ``image`` into ``target_size``, centred on a white page.
+
+    ``target_size`` may be ``"original"``, which returns a plain copy.
+    """
+    if target_size == "original":
+        return image.copy()
+
+    x, y, new_width, new_height = page_placement(image.size, target_size)
+    page = Image.new("RGB", target_size, "white")
+    resized = image.resize((new_width, new_height), Image.LANCZOS)
+    page.paste(resized, (x, y))
+    return page
+
+
+class LazyPage:
+    """A background page that is only decoded when its pixels are needed.
+
+    Creating one reads just the file header, so the page size is known
+    without decoding. ``preview`` decodes at reduced resolution (JPEG
+    ``draft`` scaling plus ``reduce`` before resampling) and ``materialize``
+    builds the full-resolution page for export. Neither result is kept,
+    so full-size pixels are freed as soon as the caller drops them.
+    """
+
+    def __init__(self, path, output_size="original"):
+        self.path = path
+        self.output_size = output_size
+        with Image.open(path) as image:
+            self.source_size = image.size
+        if output_size == "original":
+            self.size = self.source_size
+        else:
+            self.size = tuple(output_size)
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def with_output_size(self, output_size):
+        """The same source placed on a page of ``output_size``."""
+        return LazyPage(self.path, output_size)
+
+    def preview(self, canvas_size):
+        """Return the page scaled to fit ``canvas_size`` as an RGB image."""
+        ratio = preview_ratio(self.size, canvas_size)
+        page_size = (max(1, int(self.width * ratio)),
+                     max(1, int(self.height * ratio)))
+        x, y, width, height = page_placement(self.source_size, self.output_size)
+        if self.output_size == "original":
+            target = page_size
+        else:
+            target = (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+        with Image.open(self.path) as image:
+            # JPEG 可以直接按 1/2、1/4、1/8 解码，省去大部分全尺寸像素
+            image.draft("RGB", target)
+            scaled = image.convert("RGB").resize(target, Image.LANCZOS,
+                                                 reducing_gap=3.0)
+        if self.output_size == "original":
+            return scaled
+        page = Image.new("RGB", page_size, "white")
+        page.paste(scaled, (int(x * ratio), int(y * ratio)))
+        return page
+
+    def materialize(self):
+        """Decode and return the full-resolution page, as ``fit_page`` would."""
+        with Image.open(self.path) as image:
+            image.load()
+            if self.output_size == "original":
+                return image
+            return fit_page(image, self.output_size)
+
+
+def draw_pages(page, pages, font, fill="black", glyph_cache=None):
+    """Yield a copy of ``page`` per placement table in ``pages``, lazily.
+
+    Each sheet is only drawn when the caller asks for it, so writing pages
+    out as they arrive keeps one page in memory however long the text is.
+    """
+    for placements in pages:
+        yield draw_placements(page.copy(), placements, font, fill=fill,
+                              glyph_cache=glyph_cache)
+
+
+def draw_glyph_layers(size, pages, font, glyph_cache=None):
+    """Yield one ``L`` coverage mask per placement table in ``pages``.
+
+    Glyph pixels are 255 on a 0 background, ready to be used as a mask
+    over any template; nothing of the background is copied.
+    """
+    for placements in pages:
+        yield draw_placements(Image.new("L", size, 0), placements, font,
+                              fill=255, glyph_cache=glyph_cache)
+
+
+def glyph_overlay(layer, mode="1", color=(0, 0, 0), levels=16):
+    """Turn a glyph coverage mask into a text-only page for overprinting.
+
+    ``mode="1"`` gives a black-and-white image thresholded at half
+    coverage; ``mode="P"`` keeps the anti-aliasing as ``levels`` palette
+    shades from white to ``color``. Both stay aligned with the template's
+    pixel coordinates and compress to a fraction of a full-colour page.
+    """
+    if mode == "1":
+        return layer.point(lambda v: 0 if v >= 128 else 255, "1")
+    if mode != "P":
+        raise ValueError(f"不支持的套打模式: {mode}")
+
+    step = 255 / (levels - 1)
+    overlay = layer.point(lambda v: round(v / step))
+    palette = []
+    for level in range(levels):
+        t = level / (levels - 1)
+        palette.extend(round(255 + (c - 255) * t) for c in color)
+    overlay.putpalette(palette)
+    return overlay
+
+
+def iter_text_pages(page, settings, text, font, glyph_cache=None,
+                    fill="black"):
+    """Lay out ``text`` and yield a rendered copy of ``page`` per sheet."""
+    measure = glyph_cache.measure(font) if glyph_cache else font.getbbox
+    return draw_pages(page, layout_pages(text, settings, measure), font,
+                      fill=fill, glyph_cache=glyph_cache)
+
+
+def iter_glyph_layers(size, settings, text, font, glyph_cache=None):
+    """Lay out ``text`` and yield its glyph coverage mask per sheet."""
+    measure = glyph_cache.measure(font) if glyph_cache else font.getbbox
+    return draw_glyph_layers(size, layout_pages(text, settings, measure),
+                             font, glyph_cache=glyph_cache)
+
+
+def unique_name(prefix, extension):
+    """A file name that does not collide, even for concurrent requests.
+
+    The microsecond timestamp keeps names sortable by time; the random
+    suffix separates names created within the same microsecond or by
+    different processes.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}{extension}"
+
+
+def page_path(path, number):
+    """Return the file name of page ``number`` (1-based) for ``path``.
+
+    The first page keeps ``path``; later ones get ``_2``, ``_3``... before
+    the extension.
+    """
+    if number == 1:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{number}{ext}"
+
+
+def pages_record(path):
+    """The hidden file listing the follow-up pages last exported to ``path``."""
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f".{name}.pages")
+
+
+def record_pages(path, paths):
+    """Record the pages just written to ``path`` and drop the previous extras.
+
+    Exporting a shorter text under the same name would otherwise leave
+    the last pages of the previous, longer export next to the new ones.
+    Only follow-up pages listed in the record of an earlier export are
+    removed; other files that happen to share the stem are left alone.
+    The record exists only while the export has more than one page.
+    """
+    record = pages_record(path)
+    try:
+        with open(record, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = []
+    folder = os.path.dirname(path)
+    current = [os.path.basename(page) for page in paths[1:]]
+    followers = {os.path.basename(page_path(path, number))
+                 for number in range(2, len(previous) + 2)}
+    for name in previous:
+        if name not in current and name in followers:
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
+    if not current:
+        try:
+            os.remove(record)
+        except FileNotFoundError:
+            pass
+        return
+    temporary = f"{record}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False)
+    os.replace(temporary, record)
+
+
+def save_pages(pages, path, **save_options):
+    """Write every image from ``pages`` as soon as it is produced.
+
+    Returns the list of written paths, named by ``page_path``; follow-up
+    pages of a longer earlier export are removed (see ``record_pages``).
+    """
+    paths = []
+    for number, image in enumerate(pages, 1):
+        target = page_path(path, number)
+        image.save(target, **save_options)
+        paths.append(target)
+    record_pages(path, paths)
+    return paths
@@ -0,0 +1,573 @@
+"""Local HTTP render service on top of the headless core.
+
+Example::
+
+    python -m matrix_printing_server --port 8765 --font LXGWWenKai-Regular.ttf
+
+    curl -X POST localhost:8765/render -o page.png \\
+        -d '{"preset": "作文本", "text": "春天来了……", "size": "A4"}'
+
+``POST /render`` takes a JSON object with ``preset`` (a name in
+``config/``) and ``text``, plus optional ``font``, ``format`` (``png`` or
+``pdf``), ``encoding`` (a name from ``matrix_printing_encode.ENCODINGS``
+such as ``png-palette`` or ``tiff-g4``) with ``quality`` and
+``compress_level``, ``size``, ``text_only`` (``"1"`` or ``"P"``), ``page``
+(which image page to return), ``background`` (a base64-encoded image; without one
+the preset's grid is drawn on white paper), ``first_line_indent`` and
+``first_line_newline``. ``GET /presets``, ``GET /stats`` and
+``GET /healthz`` report the templates, the timings and liveness.
+
+Rendering runs on a process pool whose workers keep fonts, decoded
+backgrounds and glyph masks warm between requests. At most ``workers``
+requests render at once and ``queue_size`` more may wait; anything beyond
+is answered ``503`` with ``Retry-After`` straight away. Every result is
+written under a collision-free name in the output folder and streamed back
+from there; a background thread keeps the output and upload folders within
+their size and age quotas.
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import io
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_cli import parse_output_size
+from matrix_printing_encode import ENCODINGS, parse_encoding, save_encoded
+from matrix_printing_fonts import FontRegistry
+from matrix_printing_pdf import save_pdf
+from matrix_printing_pool import worker_pool
+from matrix_printing_presets import PresetLibrary
+from matrix_printing_render import (
+    OUTPUT_SIZES,
+    GlyphCache,
+    LazyPage,
+    draw_grid,
+    glyph_overlay,
+    grid_key,
+    iter_glyph_layers,
+    iter_text_pages,
+    page_path,
+    unique_name,
+)
+from matrix_printing_storage import UPLOAD_QUOTA, Quota, StorageManager
+from matrix_printing_timing import StageTimings
+
+MAX_BODY = 32 * 1024 * 1024  # 含 base64 底图的请求体上限
+MAX_HEADER_LINES = 100
+CHUNK_SIZE = 64 * 1024
+BLANK_PAGE_SIZE = OUTPUT_SIZES["A4 (2480x3508)"]
+MAX_PAGES = 8  # 每个工作进程缓存的底图数
+# 结果发送后就不再需要，缓存另有副本
+SERVICE_QUOTA = Quota(max_bytes=1024 ** 3, max_age_days=1)
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg",
+                 "webp": "image/webp", "tiff": "image/tiff"}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+_worker = {}
+
+
+class HTTPError(Exception):
+    """An error answered with ``status`` and a JSON ``{"error": message}``."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+@dataclass(frozen=True)
+class RenderJob:
+    """Everything one worker needs to render a request to ``path``."""
+
+    settings: object
+    text: str
+    font_name: str
+    background: str  # 底图路径；None 表示在白纸上画网格
+    output_size: object
+    output_format: str
+    overlay_mode: str
+    path: str
+    encoding: object = ENCODINGS["png"]
+
+
+def _init_worker(fonts_folder):
+    _worker["fonts"] = FontRegistry(fonts_folder)
+    _worker["glyph_cache"] = GlyphCache()
+    _worker["pages"] = OrderedDict()
+
+
+def _warm(font_name, sizes):
+    """Load ``font_name`` at every size so the first requests find it cached."""
+    for size in sizes if font_name else ():
+        try:
+            _worker["fonts"].get(font_name, size)
+        except OSError:
+            return
+
+
+def _page(job):
+    """The job's background page, decoded once per worker and reused."""
+    if job.background is None:
+        size = (BLANK_PAGE_SIZE if job.output_size == "original"
+                else tuple(job.output_size))
+        key = ("grid", size, grid_key(job.settings))
+    else:
+        key = (job.background, os.stat(job.background).st_mtime_ns,
+               job.output_size)
+
+    pages = _worker["pages"]
+    page = pages.get(key)
+    if page is not None:
+        pages.move_to_end(key)
+        return page
+    if job.background is None:
+        page = draw_grid(Image.new("RGB", size, "white"), job.settings)
+    else:
+        page = LazyPage(job.background, job.output_size).materialize()
+    pages[key] = page
+    while len(pages) > MAX_PAGES:
+        pages.popitem(last=False)
+    return page
+
+
+def _render(job):
+    """Render ``job`` to ``job.path``; return ``(paths, timings)``."""
+    timings = {}
+    start = time.perf_counter()
+    font = _worker["fonts"].get(job.font_name, job.settings.font_size)
+    page = _page(job)
+    timings["warm"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    glyph_cache = _worker["glyph_cache"]
+    if job.output_format == "pdf":
+        layers = iter_glyph_layers(page.size, job.settings, job.text, font,
+                                   glyph_cache)
+        background = None if job.overlay_mode else page
+        count = save_pdf(job.path, layers, page.size, background=background)
+        paths = [job.path] * count
+    else:
+        if job.overlay_mode:
+            layers = iter_glyph_layers(page.size, job.settings, job.text, font,
+                                       glyph_cache)
+            pages = (glyph_overlay(layer, job.overlay_mode) for layer in layers)
+        else:
+            pages = iter_text_pages(page, job.settings, job.text, font,
+                                    glyph_cache)
+        paths = save_encoded(pages, job.path, job.encoding)
+    timings["render"] = time.perf_counter() - start
+    return paths, timings
+
+
+async def read_request(reader, max_body=MAX_BODY):
+    """Read one HTTP/1.1 request; return ``(method, path, headers, body)``."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "无法解析请求行") from None
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(400, "请求头过多")
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400, "Content-Length 无效") from None
+    if length < 0:
+        raise HTTPError(400, "Content-Length 无效")
+    if length > max_body:
+        raise HTTPError(413, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+class RenderService:
+    """Admission control, warm worker pool and HTTP routing."""
+
+    def __init__(self, config="config", fonts="fonts", output="output/service",
+                 uploads="uploads", font=None, workers=None, queue_size=16,
+                 cache=None):
+        self.presets = PresetLibrary(config)
+        self.cache = cache  # RenderCache；None 表示每次都重新渲染
+        self.fonts = FontRegistry(fonts)
+        self.output = output
+        self.uploads = uploads
+        self.storage = StorageManager(
+            uploads, {uploads: UPLOAD_QUOTA, output: SERVICE_QUOTA},
+            caches=(cache,) if cache is not None else ())
+        self.default_font = font
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + queue_size
+        self.pending = 0  # 正在渲染和排队的请求数
+        self.rejected = 0
+        self.timings = StageTimings()
+        self._slots = None
+        self._pool = None
+        self._last_refresh = 0.0
+
+    async def start(self):
+        os.makedirs(self.output, exist_ok=True)
+        os.makedirs(self.uploads, exist_ok=True)
+        self.storage.start()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._pool = worker_pool(_init_worker, (self.fonts.folder,),
+                                 self.workers)
+        # 先启动工作进程并加载默认字体的各预设字号，第一个请求不必等待
+        font_name = self.default_font or next(iter(self.fonts.list_fonts()), None)
+        sizes = set()
+        for name in self.presets.names():
+            size = self.presets.get(name).values.get("font_size", "")
+            if size.isdigit():
+                sizes.add(int(size))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._pool, _warm, font_name, sorted(sizes))
+            for _ in range(self.workers)))
+
+    def close(self):
+        self.storage.stop()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    @contextmanager
+    def admit(self):
+        """Reserve a place among the running and waiting requests, or 503."""
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPError(503, "服务繁忙，请稍后重试", {"Retry-After": "1"})
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def handle(self, reader, writer):
+        """Serve one request per connection."""
+        received = time.perf_counter()
+        frame = {}
+        try:
+            try:
+                with self.timings.stage("read", frame):
+                    request = await read_request(reader)
+                if request is None:
+                    return
+                await self.dispatch(writer, *request, received=received,
+                                    frame=frame)
+            except HTTPError as e:
+                await self.send_json(writer, {"error": str(e)}, e.status,
+                                     e.headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                return
+            except Exception as e:
+                self.timings.error("server", e)
+                await self.send_json(writer, {"error": str(e)}, 500)
+        finally:
+            self.timings.record("request", time.perf_counter() - received,
+                                frame)
+            self.timings.finish(frame)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, writer, method, path, headers, body, received,
+                       frame):
+        if path == "/render":
+            if method != "POST":
+                raise HTTPError(405, "请使用 POST")
+            await self.render(writer, body, received, frame)
+        elif method != "GET":
+            raise HTTPError(405, "请使用 GET")
+        elif path == "/healthz":
+            await self.send_json(writer, {"status": "ok", "pending": self.pending})
+        elif path == "/presets":
+            self.refresh_presets()
+            await self.send_json(writer, {"presets": self.presets.names()})
+        elif path == "/stats":
+            snapshot = self.timings.snapshot()
+            snapshot.update(pending=self.pending, capacity=self.capacity,
+                            rejected=self.rejected)
+            if self.cache is not None:
+                snapshot["cache"] = self.cache.stats()
+            snapshot["storage"] = self.storage.stats()
+            await self.send_json(writer, snapshot)
+        else:
+            raise HTTPError(404, f"未知路径: {path}")
+
+    def refresh_presets(self):
+        # 预设文件夹最多每秒检查一次
+        now = time.monotonic()
+        if now - self._last_refresh >= 1.0:
+            self._last_refresh = now
+            self.presets.refresh()
+
+    async def render(self, writer, body, received, frame):
+        with self.admit():
+            with self.timings.stage("parse", frame):
+                job, page = await self.parse_job(body)
+
+            key = paths = None
+            if self.cache is not None:
+                # 命中缓存的请求不占用渲染进程
+                with self.timings.stage("cache", frame):
+                    key, paths = await asyncio.to_thread(self.lookup, job)
+            cached = paths is not None
+            if not cached:
+                with self.timings.stage("queue", frame):
+                    await self._slots.acquire()
+                try:
+                    with self.timings.stage("render", frame):
+                        loop = asyncio.get_running_loop()
+                        paths, worker_timings = await loop.run_in_executor(
+                            self._pool, _render, job)
+                finally:
+                    self._slots.release()
+                for name, seconds in worker_timings.items():
+                    self.timings.record(f"worker_{name}", seconds, frame)
+                if key is not None:
+                    await asyncio.to_thread(self.cache.put, key, paths)
+
+        count = len(paths)
+        if not 1 <= page <= count:
+            raise HTTPError(400, f"页码超出范围：共 {count} 页")
+        path = paths[0] if job.output_format == "pdf" else page_path(job.path, page)
+        content_type = ("application/pdf" if job.output_format == "pdf"
+                        else CONTENT_TYPES[job.encoding.format])
+        frame["total_before_send"] = time.perf_counter() - received
+        timing = ", ".join(f"{name};dur={seconds * 1000:.1f}"
+                           for name, seconds in frame.items())
+        with self.timings.stage("send", frame):
+            await self.send_file(writer, path, content_type, {
+                "X-Cache": "HIT" if cached else "MISS",
+                "X-Page-Count": str(count),
+                "X-Output-Name": os.path.basename(path),
+                "Server-Timing": timing,
+                "Content-Disposition":
+                    f'attachment; filename="{os.path.basename(path)}"',
+            })
+
+    def lookup(self, job):
+        """Return ``(key, paths)``; ``paths`` is None on a cache miss."""
+        font_path = self.fonts.path(job.font_name)
+        key = self.cache.key(job.text, job.settings, font_path, job.background,
+                             job.output_size,
+                             "pdf" if job.output_format == "pdf"
+                             else job.encoding.cache_label,
+                             job.overlay_mode)
+        return key, self.cache.restore(key, job.path)
+
+    async def parse_job(self, body):
+        """Validate the request body; return ``(RenderJob, page)``."""
+        try:
+            request = json.loads(body or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HTTPError(400, "请求体不是有效的 JSON") from None
+        if not isinstance(request, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象")
+
+        text = request.get("text")
+        if not isinstance(text, str):
+            raise HTTPError(400, "缺少 text")
+        flags = {}
+        for name, default in (("first_line_indent", True),
+                              ("first_line_newline", False)):
+            flags[name] = request.get(name, default)
+            if not isinstance(flags[name], bool):
+                raise HTTPError(400, f"{name} 必须是 true 或 false")
+        self.refresh_presets()
+        try:
+            settings = self.presets.settings(
+                str(request.get("preset", "")),
+                flags["first_line_indent"], flags["first_line_newline"])
+        except ValueError as e:
+            status = 404 if str(e).startswith("未找到") else 400
+            raise HTTPError(status, str(e)) from None
+
+        font_name = request.get("font") or self.default_font
+        if not font_name:
+            fonts = self.fonts.list_fonts()
+            if not fonts:
+                raise HTTPError(400, "字体文件夹中没有字体")
+            font_name = fonts[0]
+        font_name = os.path.basename(str(font_name))
+        if not os.path.isfile(self.fonts.path(font_name)):
+            raise HTTPError(404, f"未找到字体: {font_name}")
+
+        output_format = request.get("format", "png")
+        if output_format not in ("png", "pdf"):
+            raise HTTPError(400, "format 只能是 png 或 pdf")
+        levels = {}
+        for name in ("quality", "compress_level"):
+            if request.get(name) is not None:
+                try:
+                    levels[name] = int(request[name])
+                except (TypeError, ValueError):
+                    raise HTTPError(400, f"{name} 必须是整数") from None
+        try:
+            encoding = parse_encoding(str(request.get("encoding", "png")),
+                                      **levels)
+        except ValueError as e:
+            raise HTTPError(400, str(e)) from None
+        overlay_mode = request.get("text_only") or None
+        if overlay_mode not in (None, "1", "P"):
+            raise HTTPError(400, "text_only 只能是 1 或 P")
+        try:
+            output_size = parse_output_size(str(request.get("size", "original")))
+        except argparse.ArgumentTypeError as e:
+            raise HTTPError(400, str(e)) from None
+        try:
+            page = int(request.get("page", 1))
+        except (TypeError, ValueError):
+            raise HTTPError(400, "page 必须是整数") from None
+        if page < 1:
+            raise HTTPError(400, "page 必须从 1 开始")
+
+        background = None
+        if request.get("background"):
+            background = await asyncio.to_thread(self.store_background,
+                                                 request["background"])
+        extension = ".pdf" if output_format == "pdf" else encoding.extension
+        path = os.path.join(self.output, unique_name("render", extension))
+        return RenderJob(settings, text, font_name, background, output_size,
+                         output_format, overlay_mode, path, encoding), page
+
+    def store_background(self, encoded):
+        """Save an uploaded background under its content hash and return the path.
+
+        The same sheet uploaded again maps to the same file, so workers
+        reuse the page they already decoded.
+        """
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            raise HTTPError(400, "background 不是有效的 base64") from None
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                extension = (image.format or "png").lower()
+                image.verify()
+        except Exception:
+            raise HTTPError(400, "background 不是可识别的图片") from None
+        return self.storage.store_bytes(data, "." + extension)
+
+    async def send_headers(self, writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+        await writer.drain()
+
+    async def send_json(self, writer, payload, status=200, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        await self.send_headers(writer, status, {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body)),
+            **(headers or {}),
+        })
+        writer.write(body)
+        await writer.drain()
+
+    async def send_file(self, writer, path, content_type, headers):
+        """Stream ``path`` in chunks, waiting for the client to keep up."""
+        await self.send_headers(writer, 200, {
+            "Content-Type": content_type,
+            "Content-Length": str(os.path.getsize(path)),
+            **headers,
+        })
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                writer.write(chunk)
+                await writer.drain()
+
+
+async def serve(service, host="127.0.0.1", port=8765):
+    """Start ``service`` and return the listening ``asyncio`` server."""
+    await service.start()
+    return await asyncio.start_server(service.handle, host, port)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m matrix_printing_server",
+        description="本地排版渲染服务：POST /render 返回 PNG 或 PDF",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--config", default="config", help="参数预设文件夹")
+    parser.add_argument("--fonts", default="fonts", help="字体文件夹")
+    parser.add_argument("--font", default=None,
+                        help="默认字体文件名，默认使用字体文件夹中的第一个")
+    parser.add_argument("--output", default=os.path.join("output", "service"),
+                        help="渲染结果保存的文件夹")
+    parser.add_argument("--uploads", default="uploads", help="上传底图保存的文件夹")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="渲染进程数，默认等于 CPU 核数")
+    parser.add_argument("--queue", type=int, default=16,
+                        help="渲染进程都忙时最多排队的请求数，超出返回 503")
+    parser.add_argument("--cache", default=os.path.join("output", "cache"),
+                        help="渲染缓存文件夹，相同请求直接返回上次的结果")
+    parser.add_argument("--cache-size", type=int, default=512,
+                        help="渲染缓存上限（MB），超出时淘汰最久未用的结果")
+    parser.add_argument("--no-cache", dest="cache", action="store_const",
+                        const=None, help="不使用渲染缓存")
+    return parser
+
+
+async def run(args):
+    cache = (RenderCache(args.cache, args.cache_size * 1024 * 1024)
+             if args.cache else None)
+    service = RenderService(args.config, args.fonts, args.output, args.uploads,
+                            args.font, args.workers, args.queue, cache)
+    server = await serve(service, args.host, args.port)
+    print(f"渲染服务已启动: http://{args.host}:{args.port}，"
+          f"{service.workers} 个渲染进程，最多排队 {args.queue} 个请求")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Content-addressed uploads and background quotas for ``uploads/`` and ``output/``.
+
+Uploaded backgrounds are stored as ``upload_<sha256 prefix><ext>``, so
+choosing the same sheet twice reuses the stored copy instead of adding
+another one. ``StorageManager`` enforces per-folder size and age limits
+on a daemon thread: nothing is scanned at startup, so launching does not
+slow down as uploads and exports pile up. Files are evicted oldest
+first by modification time; reusing an upload touches it, which makes
+the order least recently used.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+
+from matrix_printing_cache import FileDigests
+
+UPLOAD_PREFIX = "upload_"
+DIGEST_LENGTH = 32
+DAY = 24 * 60 * 60
+# 刚写入的文件可能仍在导出或发送中，超出容量时也不删除
+GRACE_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class Quota:
+    """Limits for the files under one folder; None disables a limit.
+
+    Only files whose names start with one of ``prefixes`` are managed
+    (all files when empty), and subfolders named in ``exclude`` are
+    skipped, e.g. a render cache that evicts its own entries.
+    """
+
+    max_bytes: int = None
+    max_age_days: float = None
+    prefixes: tuple = ()
+    exclude: tuple = ()
+
+
+# 只管理程序生成的上传文件，uploads/ 中自带的样张不受影响
+UPLOAD_QUOTA = Quota(max_bytes=1024 ** 3, max_age_days=7,
+                     prefixes=(UPLOAD_PREFIX,))
+OUTPUT_QUOTA = Quota(max_bytes=2 * 1024 ** 3, max_age_days=90,
+                     exclude=("cache",))
+
+
+def upload_name(digest, extension):
+    """The stored file name of an upload with content hash ``digest``."""
+    return f"{UPLOAD_PREFIX}{digest[:DIGEST_LENGTH]}{extension.lower()}"
+
+
+class StorageManager:
+    """Store uploads by content and keep folders within their quotas.
+
+    ``quotas`` maps folders to a ``Quota``. ``caches`` are
+    ``RenderCache`` objects whose folders are indexed on the maintenance
+    thread rather than when they are first used. Paths passed to
+    ``protect`` (the background being edited) are never evicted.
+    """
+
+    def __init__(self, uploads, quotas, caches=(), interval=3600):
+        self.uploads = uploads
+        self.quotas = dict(quotas)
+        self.caches = tuple(caches)
+        self.interval = interval
+        self.digest = FileDigests()
+        self.sweeps = 0
+        self.removed = 0
+        self.freed = 0
+        self._protected = frozenset()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def store_upload(self, source):
+        """Copy ``source`` into the uploads folder unless it is already there.
+
+        Returns the stored path; an existing copy is touched so that it
+        counts as recently used.
+        """
+        extension = os.path.splitext(source)[1]
+        path = os.path.join(self.uploads, upload_name(self.digest(source),
+                                                      extension))
+        if self._reuse(path):
+            return path
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, path)
+        return path
+
+    def store_bytes(self, data, extension):
+        """Like ``store_upload`` for an upload held in memory."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.uploads, upload_name(digest, extension))
+        if self._reuse(path):
+            return path
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        return path
+
+    def _reuse(self, path):
+        os.makedirs(self.uploads, exist_ok=True)
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def protect(self, *paths):
+        """Exempt ``paths`` from eviction, replacing the previous set."""
+        self._protected = frozenset(os.path.abspath(path)
+                                    for path in paths if path)
+
+    def _files(self, folder, quota):
+        """Yield ``(mtime, size, path)`` of every managed file under ``folder``."""
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs if name not in quota.exclude]
+            for name in files:
+                if quota.prefixes and not name.startswith(quota.prefixes):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def enforce(self, folder, quota, now=None):
+        """Evict expired files, then the oldest until the folder fits.
+
+        Returns ``(files removed, bytes freed)``.
+        """
+        now = time.time() if now is None else now
+        files = sorted(self._files(folder, quota))
+        total = sum(size for _, size, _ in files)
+        protected = self._protected
+        removed = freed = 0
+        for mtime, size, path in files:
+            age = now - mtime
+            expired = (quota.max_age_days is not None
+                       and age > quota.max_age_days * DAY)
+            over = (quota.max_bytes is not None and total > quota.max_bytes
+                    and age > GRACE_SECONDS)
+            if not (expired or over) or os.path.abspath(path) in protected:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # 被其他程序占用，下次再试
+                continue
+            else:
+                removed += 1
+                freed += size
+            total -= size
+        return removed, freed
+
+    def sweep(self, now=None):
+        """Index the caches and apply every quota once."""
+        for cache in self.caches:
+            cache.load()
+        removed = freed = 0
+        for folder, quota in self.quotas.items():
+            if os.path.isdir(folder):
+                count, size = self.enforce(folder, quota, now)
+                removed += count
+                freed += size
+        with self._lock:
+            self.sweeps += 1
+            self.removed += removed
+            self.freed += freed
+        return removed, freed
+
+    def start(self, delay=0):
+        """Sweep on a daemon thread after ``delay`` seconds, then every ``interval``."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(delay,),
+                                        name="storage", daemon=True)
+        self._thread.start()
+
+    def _run(self, delay):
+        if self._stop.wait(delay):
+            return
+        while True:
+            try:
+                self.sweep()
+            except OSError as e:
+                print(f"清理存储失败: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {"sweeps": self.sweeps, "removed": self.removed,
+                    "freed_bytes": self.freed}
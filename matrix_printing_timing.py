@@ -0,0 +1,98 @@
+"""Lightweight per-stage timing for the preview and export paths.
+
+Stages are timed with ``StageTimings.stage`` and aggregated per name;
+the most recent samples, finished frames and errors are kept in bounded
+ring buffers so a long session never grows without limit. A *frame* is a
+plain ``{stage: seconds}`` dict that follows one preview from request to
+display, across threads.
+"""
+
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class StageTimings:
+    """Thread-safe stage durations, counts and recent errors."""
+
+    def __init__(self, capacity=256, max_errors=50):
+        self.samples = deque(maxlen=capacity)  # (阶段, 秒)
+        self.frames = deque(maxlen=capacity)
+        self.errors = deque(maxlen=max_errors)
+        self.last_frame = None
+        self._totals = {}  # 阶段 -> [次数, 总耗时, 最长耗时]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        """Time the ``with`` block as ``name``, also adding it to ``frame``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, frame)
+
+    def record(self, name, seconds, frame=None):
+        with self._lock:
+            totals = self._totals.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            self.samples.append((name, seconds))
+            if frame is not None:
+                frame[name] = frame.get(name, 0.0) + seconds
+
+    def finish(self, frame):
+        """Store a completed frame as the latest breakdown."""
+        with self._lock:
+            self.last_frame = dict(frame)
+            self.frames.append(self.last_frame)
+
+    def error(self, stage, error):
+        with self._lock:
+            self.errors.append({
+                "time": datetime.now().isoformat(timespec="seconds"),
+                "stage": stage,
+                "type": type(error).__name__,
+                "message": str(error),
+            })
+
+    def summary(self):
+        """Per-stage count, totals and the median of the recent samples."""
+        with self._lock:
+            recent = {}
+            for name, seconds in self.samples:
+                recent.setdefault(name, []).append(seconds)
+            return {
+                name: {
+                    "count": count,
+                    "total_s": total,
+                    "mean_s": total / count,
+                    "max_s": longest,
+                    "recent_median_s": (statistics.median(recent[name])
+                                        if name in recent else None),
+                }
+                for name, (count, total, longest) in self._totals.items()
+            }
+
+    def snapshot(self):
+        stages = self.summary()
+        with self._lock:
+            return {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "stages": stages,
+                "frames": list(self.frames),
+                "errors": list(self.errors),
+            }
+
+    def dump(self, path):
+        """Write ``snapshot()`` to ``path`` as JSON."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
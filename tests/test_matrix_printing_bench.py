@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from matrix_printing_bench import (
+    compare,
+    list_backgrounds,
+    main,
+    run_benchmarks,
+    sample_text,
+)
+
+
+class BenchmarkTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        os.makedirs(self.path("config"))
+        os.makedirs(self.path("uploads"))
+        with open(self.path("config/preset.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "start_x": "2", "start_y": "2", "cell_width": "19",
+                "cell_height": "19", "font_size": "16", "offset_x": "0",
+                "offset_y": "0", "grid_columns": "4", "grid_rows": "4",
+                "grid_line_thickness": "1",
+            }, f)
+        Image.new("RGB", (100, 100), "white").save(self.path("uploads/a.png"))
+        Image.new("RGB", (100, 100), "white").save(self.path("uploads/b.png"))
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def test_sample_text_has_requested_length(self):
+        text = sample_text(200, paragraph_length=50)
+
+        self.assertEqual(len(text.replace("\n", "")), 200)
+        self.assertEqual(text.count("\n"), 3)
+
+    def test_identical_backgrounds_are_measured_once(self):
+        self.assertEqual(list_backgrounds(self.path("uploads")),
+                         [self.path("uploads/a.png")])
+
+    def test_times_every_stage(self):
+        results = run_benchmarks([self.path("config/preset.json")],
+                                 [self.path("uploads/a.png")],
+                                 lengths=(10, 40), sizes=("original", "200x300"),
+                                 repeat=2, encodings=("png-palette", "tiff-g4"),
+                                 startup=False)
+
+        stages = {entry["stage"] for entry in results}
+        self.assertEqual(stages, {"split", "rasterize", "layout", "resize",
+                                  "preview_downscale", "draw", "png_save",
+                                  "encode"})
+        self.assertEqual(len(results), 2 * 3 + 2 * (2 + 2 * (2 + 2)))
+        encoded = [e for e in results if e["stage"] == "encode"]
+        self.assertEqual({e["encoding"] for e in encoded},
+                         {"png-palette", "tiff-g4"})
+        self.assertTrue(all(e["bytes"] > 0 for e in encoded))
+        layout = [e for e in results if e["stage"] == "layout"]
+        self.assertEqual([e["pages"] for e in layout], [1, 3])
+        self.assertTrue(all(e["repeat"] == 2 and e["min_s"] <= e["median_s"]
+                            for e in results))
+
+    def test_writes_report_and_flags_regressions(self):
+        output = self.path("bench.json")
+        argv = ["--config", self.path("config"), "--uploads",
+                self.path("uploads"), "--lengths", "10", "--sizes", "original",
+                "--repeat", "1", "--output", output]
+
+        self.assertEqual(main(argv), 0)
+        with open(output, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertIn("pillow", report)
+
+        slower = json.loads(json.dumps(report))
+        for entry in slower["results"]:
+            entry["median_s"] *= 2
+        self.assertEqual(compare(report, report), [])
+        self.assertEqual(len(compare(report, slower)), len(report["results"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
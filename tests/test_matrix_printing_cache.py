@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+from dataclasses import replace
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_logic import GridSettings
+from matrix_printing_render import page_path
+
+
+class RenderCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.font = self.write("font.ttf", b"font-bytes")
+        self.background = self.write("bg.png", b"background-bytes")
+        self.settings = GridSettings(grid_columns=4, grid_rows=4)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def write(self, name, data):
+        with open(self.path(name), "wb") as f:
+            f.write(data)
+        return self.path(name)
+
+    def key(self, cache, text="春天来了", **changes):
+        inputs = dict(settings=self.settings, font_path=self.font,
+                      background_path=self.background, output_size="original")
+        inputs.update(changes)
+        return cache.key(text, **inputs)
+
+    def test_key_follows_contents_not_names(self):
+        cache = RenderCache(self.path("cache"))
+        base = self.key(cache)
+
+        self.assertEqual(self.key(cache, "\n春天来了  \n\n"), base)
+        shutil.copyfile(self.font, self.path("renamed.ttf"))
+        self.assertEqual(self.key(cache, font_path=self.path("renamed.ttf")), base)
+
+        different = [
+            self.key(cache, "秋天来了"),
+            self.key(cache, settings=replace(self.settings, font_size=31)),
+            self.key(cache, font_path=self.write("other.ttf", b"other")),
+            self.key(cache, background_path=None),
+            self.key(cache, output_size=(2480, 3508)),
+            self.key(cache, output_format="pdf"),
+            self.key(cache, overlay_mode="1"),
+        ]
+        self.assertNotIn(base, different)
+        self.assertEqual(len(set(different)), len(different))
+
+    def test_restores_png_pages_and_pdf_page_count(self):
+        cache = RenderCache(self.path("cache"))
+        pages = [self.write("a.png", b"page-1"), self.write("a_2.png", b"page-2")]
+        pdf = self.write("a.pdf", b"%PDF")
+        cache.put("png", pages)
+        cache.put("pdf", [pdf] * 3)
+
+        target = self.path("out.png")
+        restored = cache.restore("png", target)
+        self.assertEqual(restored, [target, page_path(target, 2)])
+        with open(restored[1], "rb") as f:
+            self.assertEqual(f.read(), b"page-2")
+        self.assertEqual(cache.restore("pdf", self.path("out.pdf")),
+                         [self.path("out.pdf")] * 3)
+        self.assertIsNone(cache.restore("missing", self.path("x.png")))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_overwriting_an_export_does_not_change_the_cache(self):
+        cache = RenderCache(self.path("cache"))
+        page = self.write("a.png", b"first")
+        cache.put("k", [page])
+
+        self.write("a.png", b"second")
+
+        cache.restore("k", self.path("b.png"))
+        with open(self.path("b.png"), "rb") as f:
+            self.assertEqual(f.read(), b"first")
+
+    def test_evicts_least_recently_used_beyond_the_size_bound(self):
+        cache = RenderCache(self.path("cache"), max_bytes=250)
+        for name in "abc":
+            cache.put(name, [self.write(f"{name}.png", b"x" * 100)])
+            if name == "b":
+                cache.get("a")  # a 比 b 更近被使用
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNone(cache.get("b"))
+        self.assertFalse(os.path.exists(self.path("cache/b")))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.stats()["bytes"], 200)
+
+    def test_entries_survive_a_restart_and_incomplete_ones_are_dropped(self):
+        cache = RenderCache(self.path("cache"))
+        cache.put("k", [self.write("a.png", b"page")])
+        os.makedirs(self.path("cache/broken"))
+        os.makedirs(self.path("cache/.tmp-leftover"))
+
+        reopened = RenderCache(self.path("cache"))
+
+        self.assertIsNotNone(reopened.get("k"))
+        self.assertIsNone(reopened.get("broken"))
+        self.assertEqual(sorted(os.listdir(self.path("cache"))), ["k"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from dataclasses import replace
+
+from PIL import Image, ImageFont
+
+from matrix_printing_calibrate import (
+    Calibrator,
+    CellMap,
+    calibrate,
+    neighbours,
+    save_calibrated,
+    settings_key,
+)
+from matrix_printing_cli import load_preset, main
+from matrix_printing_logic import GridSettings, layout_text
+from matrix_printing_render import GlyphCache, draw_grid
+
+SHEET = GridSettings(start_x=30, start_y=40, cell_width=38, cell_height=38,
+                     grid_columns=8, grid_rows=10, font_size=28,
+                     grid_line_thickness=2)
+
+
+class CalibrateTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.font_path = os.path.join(self.tmp, "font.ttf")
+        with open(self.font_path, "wb") as f:
+            f.write(ImageFont.load_default(size=10).path.getvalue())
+        self.sheet = Image.new("RGB", (400, 500), "white")
+        draw_grid(self.sheet, SHEET, fill="black")
+        self.cells = CellMap.from_image(self.sheet)
+
+    def test_cell_map_measures_cell_interiors(self):
+        self.assertEqual(len(self.cells.columns), 8)
+        self.assertEqual(len(self.cells.rows), 10)
+        low, high = self.cells.columns[0]
+        self.assertAlmostEqual(low, 32, delta=0.5)
+        self.assertAlmostEqual(high, 70, delta=0.5)
+
+    def test_search_recentres_misplaced_glyphs(self):
+        start = replace(SHEET, offset_x=9, offset_y=-8, font_size=18)
+
+        with Calibrator(self.cells, self.font_path, start, workers=1) as calibrator:
+            (initial,) = calibrator.evaluate([settings_key(start)])
+            best, score = calibrator.search()
+
+        self.assertLess(score, initial / 5)
+        self.assertEqual(best.start_x, SHEET.start_x)
+        # 字形墨迹的中心应落在格子内部的中心附近
+        font = ImageFont.truetype(self.font_path, best.font_size)
+        measure = GlyphCache().measure(font)
+        ((_, char, x, y),) = layout_text(
+            "永", replace(best, first_line_indent=False), measure)
+        left, top, right, bottom = measure(char)
+        self.assertAlmostEqual(x + (left + right) / 2, 51, delta=2)
+        self.assertAlmostEqual(y + (top + bottom) / 2, 61, delta=2)
+
+    def test_scores_are_memoized(self):
+        with Calibrator(self.cells, self.font_path, SHEET, workers=1) as calibrator:
+            keys = list(neighbours(settings_key(SHEET)))
+            first = calibrator.evaluate(keys)
+            evaluated = len(calibrator.scores)
+            second = calibrator.evaluate(keys + keys[:3])
+
+        self.assertEqual(evaluated, len(set(keys)))
+        self.assertEqual(len(calibrator.scores), evaluated)
+        self.assertEqual(second[:len(keys)], first)
+        self.assertEqual(calibrator.hits, len(keys) + 3)
+
+    def test_process_pool_matches_in_process_scores(self):
+        keys = [settings_key(SHEET)] + list(neighbours(settings_key(SHEET)))[:5]
+        with Calibrator(self.cells, self.font_path, SHEET, workers=1) as local:
+            expected = local.evaluate(keys)
+        with Calibrator(self.cells, self.font_path, SHEET, workers=2) as pool:
+            self.assertEqual(pool.evaluate(keys[:1]), expected[:1])
+            self.assertEqual(pool.evaluate(keys), expected)
+
+    def test_blank_sheet_is_rejected(self):
+        with self.assertRaises(ValueError):
+            calibrate(Image.new("RGB", (300, 400), "white"), SHEET,
+                      self.font_path, workers=1)
+
+    def test_saves_new_preset_without_overwriting(self):
+        best = replace(SHEET, offset_x=2, offset_y=-3)
+        folder = os.path.join(self.tmp, "config")
+
+        first = save_calibrated(best, folder)
+        second = save_calibrated(best, folder)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(load_preset(second), best)
+
+    def test_cli_writes_calibrated_preset(self):
+        background = os.path.join(self.tmp, "grid.png")
+        self.sheet.save(background)
+        output = os.path.join(self.tmp, "config")
+
+        code = main(["calibrate", "--background", background,
+                     "--font", self.font_path, "--output", output,
+                     "--workers", "1"])
+
+        self.assertEqual(code, 0)
+        (name,) = os.listdir(output)
+        preset = load_preset(os.path.join(output, name))
+        self.assertEqual(preset.grid_columns, 8)
+        self.assertEqual(preset.grid_rows, 10)
+
+    def test_cli_reports_sheets_without_a_grid(self):
+        background = os.path.join(self.tmp, "blank.png")
+        Image.new("RGB", (300, 400), "white").save(background)
+        output = os.path.join(self.tmp, "config")
+
+        with redirect_stderr(io.StringIO()) as stderr:
+            code = main(["calibrate", "--background", background,
+                         "--font", self.font_path, "--output", output,
+                         "--workers", "1"])
+
+        self.assertEqual(code, 1)
+        self.assertIn("--preset", stderr.getvalue())
+        self.assertFalse(os.path.exists(output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import tempfile
+import unittest
+
+from PIL import Image, ImageFont
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_cli import iter_texts, parse_output_size, render_batch
+from matrix_printing_encode import ENCODINGS
+
+
+class ParseOutputSizeTests(unittest.TestCase):
+    def test_accepts_labels_short_names_and_dimensions(self):
+        self.assertEqual(parse_output_size("original"), "original")
+        self.assertEqual(parse_output_size("A4 (2480x3508)"), (2480, 3508))
+        self.assertEqual(parse_output_size("a3"), (3508, 4961))
+        self.assertEqual(parse_output_size("800x600"), (800, 600))
+
+    def test_rejects_unknown_sizes(self):
+        for value in ("A5", "0x10", "12"):
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_output_size(value)
+
+
+class BatchRenderTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def path(self, *names):
+        return os.path.join(self.tmp, *names)
+
+    def test_reads_text_folder_and_jsonl(self):
+        os.makedirs(self.path("texts"))
+        with open(self.path("texts/b.txt"), "w", encoding="utf-8") as f:
+            f.write("乙")
+        with open(self.path("texts/a.txt"), "w", encoding="utf-8") as f:
+            f.write("甲")
+        with open(self.path("texts.jsonl"), "w", encoding="utf-8") as f:
+            f.write('"一"\n\n{"name": "two", "text": "二"}\n{"text": "三"}\n'
+                    '{"name": "four", "text": "四", "preset": "小方格"}\n')
+
+        self.assertEqual(list(iter_texts(self.path("texts"))),
+                         [("a", "甲"), ("b", "乙")])
+        self.assertEqual(list(iter_texts(self.path("texts.jsonl"))),
+                         [("00001", "一"), ("two", "二"), ("00004", "三"),
+                          ("four", "四", "小方格")])
+
+    def test_colliding_output_names_are_rejected(self):
+        cases = [
+            '{"name": "a", "text": "一"}\n"二"\n{"name": "sub/a", "text": "三"}\n',
+            '{"name": "a", "text": "一"}\n{"name": "a_2", "text": "二"}\n',
+            '{"name": "b_3", "text": "一"}\n"二"\n{"name": "b", "text": "三"}\n',
+        ]
+        for lines in cases:
+            with open(self.path("texts.jsonl"), "w", encoding="utf-8") as f:
+                f.write(lines)
+            with self.subTest(lines=lines), self.assertRaisesRegex(
+                    ValueError, "第 [23] 行"):
+                list(iter_texts(self.path("texts.jsonl")))
+
+        os.makedirs(self.path("texts"))
+        for name in ("a.txt", "a_2.txt"):
+            with open(self.path("texts", name), "w", encoding="utf-8") as f:
+                f.write("甲")
+        with self.assertRaisesRegex(ValueError, "a_2.txt"):
+            list(iter_texts(self.path("texts")))
+
+    def test_jsonl_objects_need_text(self):
+        with open(self.path("texts.jsonl"), "w", encoding="utf-8") as f:
+            f.write('"一"\n{"name": "two"}\n')
+
+        with self.assertRaisesRegex(ValueError, "第 2 行缺少 text"):
+            list(iter_texts(self.path("texts.jsonl")))
+
+    def write_template(self):
+        with open(self.path("preset.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "start_x": "2", "start_y": "2", "cell_width": "19",
+                "cell_height": "19", "font_size": "16", "offset_x": "0",
+                "offset_y": "0", "grid_columns": "4", "grid_rows": "4",
+                "grid_line_thickness": "1",
+            }, f)
+        Image.new("RGB", (100, 100), "white").save(self.path("bg.png"))
+        with open(self.path("font.ttf"), "wb") as f:
+            f.write(ImageFont.load_default(size=10).path.getvalue())
+
+    def test_renders_every_text_with_the_template(self):
+        self.write_template()
+
+        paths, seconds = render_batch(
+            [("one", "ABC"), ("two", "DEF")],
+            self.path("preset.json"), self.path("bg.png"),
+            self.path("font.ttf"), self.path("out"),
+            output_size=(200, 200), workers=1,
+        )
+
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         ["one.png", "two.png"])
+        self.assertGreater(seconds, 0)
+        with Image.open(paths[0]) as page:
+            self.assertEqual(page.size, (200, 200))
+            self.assertIsNotNone(Image.eval(page.convert("L"),
+                                            lambda v: 255 - v).getbbox())
+
+    def test_entries_can_switch_templates_by_name(self):
+        self.write_template()
+        with open(self.path("preset.json"), "r", encoding="utf-8") as f:
+            values = json.load(f)
+        values["start_x"] = "50"
+        with open(self.path("shifted.json"), "w", encoding="utf-8") as f:
+            json.dump(values, f)
+
+        paths, _ = render_batch(
+            [("plain", "A"), ("moved", "A", "shifted")],
+            self.path("preset.json"), self.path("bg.png"),
+            self.path("font.ttf"), self.path("out"),
+            output_size=(100, 100), workers=1, overlay_mode="1",
+        )
+
+        boxes = []
+        for path in paths:
+            with Image.open(path) as page:
+                boxes.append(Image.eval(page.convert("L"),
+                                        lambda v: 255 - v).getbbox())
+        self.assertEqual(boxes[1][0] - boxes[0][0], 48)
+
+    def test_repeated_texts_are_copied_from_the_cache(self):
+        self.write_template()
+        cache = RenderCache(self.path("cache"))
+        texts = [("one", "ABC"), ("two", "DEF")]
+        arguments = (self.path("preset.json"), self.path("bg.png"),
+                     self.path("font.ttf"))
+
+        first, _ = render_batch(texts, *arguments, self.path("out1"),
+                                workers=1, cache=cache)
+        second, _ = render_batch(texts + [("three", "GHI")], *arguments,
+                                 self.path("out2"), workers=1, cache=cache)
+
+        self.assertEqual([os.path.basename(p) for p in second],
+                         ["one.png", "two.png", "three.png"])
+        self.assertEqual(cache.stats()["hits"], 2)
+        for old, new in zip(first, second):
+            with open(old, "rb") as a, open(new, "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+    def test_encoding_sets_the_page_format(self):
+        self.write_template()
+
+        paths, _ = render_batch(
+            [("one", "ABC")],
+            self.path("preset.json"), self.path("bg.png"),
+            self.path("font.ttf"), self.path("out"),
+            output_size=(200, 200), workers=1,
+            encoding=ENCODINGS["tiff-g4"],
+        )
+
+        self.assertEqual([os.path.basename(p) for p in paths], ["one.tif"])
+        with Image.open(paths[0]) as page:
+            self.assertEqual((page.format, page.mode), ("TIFF", "1"))
+
+    def test_unknown_template_is_rejected(self):
+        self.write_template()
+
+        with self.assertRaisesRegex(ValueError, "未找到参数预设"):
+            render_batch([("one", "A", "missing")], self.path("preset.json"),
+                         self.path("bg.png"), self.path("font.ttf"),
+                         self.path("out"), workers=1)
+
+    def test_text_only_mode_writes_bilevel_pages(self):
+        self.write_template()
+
+        paths, _ = render_batch(
+            [("one", "ABC")],
+            self.path("preset.json"), self.path("missing.png"),
+            self.path("font.ttf"), self.path("out"),
+            output_size=(200, 200), workers=1, overlay_mode="1",
+        )
+
+        with Image.open(paths[0]) as page:
+            self.assertEqual(page.mode, "1")
+            self.assertEqual(page.size, (200, 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
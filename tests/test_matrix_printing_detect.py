@@ -0,0 +1,91 @@
+import time
+import unittest
+
+from PIL import Image, ImageDraw
+
+from matrix_printing_detect import darkness_profiles, detect_axis, detect_grid
+from matrix_printing_logic import GridSettings
+from matrix_printing_render import draw_grid, fit_page
+
+
+def grid_sheet(settings, size, fill=(200, 40, 40)):
+    """A white sheet with a grid drawn from ``settings``, plus some text."""
+    sheet = Image.new("RGB", size, (245, 243, 235))
+    draw_grid(sheet, settings, fill=fill)
+    draw = ImageDraw.Draw(sheet)
+    draw.text((settings.start_x + 8, settings.start_y + 8), "Name ____",
+              fill="black")
+    return sheet
+
+
+class DetectGridTests(unittest.TestCase):
+    def test_recovers_grid_drawn_from_settings(self):
+        settings = GridSettings(start_x=41, start_y=67, cell_width=26.5,
+                                cell_height=26.5, grid_columns=21,
+                                grid_rows=29, grid_line_thickness=2)
+        metrics = detect_grid(grid_sheet(settings, (700, 950)))
+
+        self.assertEqual(metrics["grid_columns"], "21")
+        self.assertEqual(metrics["grid_rows"], "29")
+        self.assertEqual(metrics["grid_line_thickness"], "2")
+        self.assertAlmostEqual(float(metrics["start_x"]), 41, delta=0.3)
+        self.assertAlmostEqual(float(metrics["start_y"]), 67, delta=0.3)
+        self.assertAlmostEqual(float(metrics["cell_width"]), 26.5, delta=0.2)
+        self.assertAlmostEqual(float(metrics["cell_height"]), 26.5, delta=0.2)
+
+    def test_rows_separated_by_a_gap_span_cell_and_gap(self):
+        # 作文本：每行格子之间留有空隙，上下边线各成一组
+        sheet = Image.new("RGB", (900, 1300), "white")
+        draw = ImageDraw.Draw(sheet)
+        for row in range(10):
+            top = 120 + row * 106
+            draw.line((60, top, 812, top), fill=(40, 90, 160), width=2)
+            draw.line((60, top + 94, 812, top + 94), fill=(40, 90, 160), width=2)
+            for column in range(17):
+                x = 60 + column * 47
+                draw.line((x, top, x, top + 94), fill=(40, 90, 160), width=2)
+
+        _, rows_profile = darkness_profiles(sheet)
+        start, pitch, _, cells = detect_axis(rows_profile)
+        self.assertEqual(cells, 10)
+        self.assertAlmostEqual(start, 120.5, delta=0.5)
+        self.assertAlmostEqual(pitch, 106, delta=0.1)
+
+        metrics = detect_grid(sheet)
+        self.assertEqual(metrics["grid_columns"], "16")
+        self.assertEqual(metrics["grid_rows"], "10")
+
+    def test_maps_coordinates_onto_the_output_page(self):
+        settings = GridSettings(start_x=30, start_y=40, cell_width=38,
+                                cell_height=38, grid_columns=12,
+                                grid_rows=16, grid_line_thickness=2)
+        sheet = grid_sheet(settings, (560, 740))
+
+        mapped = detect_grid(sheet, (1240, 1754))
+        direct = detect_grid(fit_page(sheet, (1240, 1754)))
+
+        self.assertEqual(mapped["grid_columns"], direct["grid_columns"])
+        self.assertEqual(mapped["grid_rows"], direct["grid_rows"])
+        for key in ("start_x", "start_y", "cell_width", "cell_height"):
+            self.assertAlmostEqual(float(mapped[key]), float(direct[key]),
+                                   delta=1.0)
+
+    def test_blank_page_is_rejected(self):
+        with self.assertRaises(ValueError):
+            detect_grid(Image.new("RGB", (300, 400), "white"))
+
+    def test_a3_scan_is_fast(self):
+        settings = GridSettings(start_x=200, start_y=300, cell_width=140,
+                                cell_height=140, grid_columns=21,
+                                grid_rows=30, grid_line_thickness=3)
+        sheet = grid_sheet(settings, (3508, 4961))
+
+        start = time.perf_counter()
+        metrics = detect_grid(sheet)
+
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(metrics["grid_columns"], "21")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image, ImageDraw
+
+from matrix_printing_encode import (
+    ENCODINGS,
+    OutputEncoding,
+    parse_encoding,
+    save_encoded,
+    with_extension,
+)
+
+
+def sample_page():
+    page = Image.new("RGB", (120, 80), (250, 248, 240))
+    draw = ImageDraw.Draw(page)
+    for x in range(10, 120, 20):
+        draw.line([(x, 0), (x, 79)], fill=(200, 40, 40))
+    draw.rectangle([30, 30, 50, 50], fill="black")
+    return page
+
+
+class OutputEncodingTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+
+    def test_every_named_encoding_writes_its_format_and_mode(self):
+        expected = {
+            "png": ("PNG", "RGB"), "png-fast": ("PNG", "RGB"),
+            "png-palette": ("PNG", "P"), "png-gray": ("PNG", "L"),
+            "jpeg": ("JPEG", "RGB"), "webp": ("WEBP", "RGB"),
+            "tiff-g4": ("TIFF", "1"),
+        }
+        for name, encoding in ENCODINGS.items():
+            with self.subTest(name):
+                path = encoding.save(sample_page(),
+                                     os.path.join(self.tmp, name + encoding.extension))
+                with Image.open(path) as image:
+                    self.assertEqual((image.format, image.mode), expected[name])
+                    if name == "tiff-g4":
+                        self.assertEqual(image.info["compression"], "group4")
+
+    def test_bilevel_keeps_grid_lines_and_drops_paper(self):
+        bilevel = ENCODINGS["tiff-g4"].convert(sample_page())
+
+        self.assertEqual(bilevel.getpixel((5, 5)), 255)
+        self.assertEqual(bilevel.getpixel((10, 5)), 0)
+        self.assertEqual(bilevel.getpixel((40, 40)), 0)
+
+    def test_overlay_pages_keep_their_mode(self):
+        overlay = Image.new("1", (10, 10), 1)
+
+        self.assertEqual(ENCODINGS["png"].convert(overlay).mode, "1")
+        self.assertEqual(ENCODINGS["png-palette"].convert(overlay).mode, "1")
+        self.assertEqual(ENCODINGS["jpeg"].convert(overlay).mode, "RGB")
+
+    def test_parse_and_validate(self):
+        self.assertEqual(parse_encoding("jpeg", quality=70).quality, 70)
+        self.assertEqual(parse_encoding("png", compress_level=1),
+                         ENCODINGS["png-fast"])
+        for call in (lambda: parse_encoding("gif"),
+                     lambda: parse_encoding("png", compress_level=10),
+                     lambda: parse_encoding("webp", quality=0),
+                     lambda: OutputEncoding("tiff", "gray")):
+            with self.assertRaises(ValueError):
+                call()
+
+    def test_cache_labels_keep_the_default_and_tell_encodings_apart(self):
+        labels = [encoding.cache_label for encoding in ENCODINGS.values()]
+
+        self.assertEqual(ENCODINGS["png"].cache_label, "png")
+        self.assertEqual(len(set(labels)), len(labels))
+        self.assertNotEqual(parse_encoding("jpeg", quality=70).cache_label,
+                            ENCODINGS["jpeg"].cache_label)
+
+    def test_with_extension(self):
+        self.assertEqual(with_extension("a/out.png", ENCODINGS["tiff-g4"]), "a/out.tif")
+        self.assertEqual(with_extension("out.JPEG", ENCODINGS["jpeg"]), "out.JPEG")
+        self.assertEqual(with_extension("out", ENCODINGS["webp"]), "out.webp")
+
+    def test_save_encoded_writes_pages_in_order(self):
+        colors = ["red", "green", "blue", "white", "black"]
+        pages = (Image.new("RGB", (8, 8), color) for color in colors)
+
+        paths = save_encoded(pages, os.path.join(self.tmp, "out.png"),
+                             ENCODINGS["png-fast"], workers=2)
+
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         ["out.png", "out_2.png", "out_3.png", "out_4.png",
+                          "out_5.png"])
+        for path, color in zip(paths, colors):
+            with Image.open(path) as image:
+                self.assertEqual(image.getpixel((0, 0)),
+                                 Image.new("RGB", (1, 1), color).getpixel((0, 0)))
+
+        save_encoded([Image.new("RGB", (8, 8))] * 2,
+                     os.path.join(self.tmp, "out.png"))
+
+        self.assertEqual(sorted(os.listdir(self.tmp)),
+                         [".out.png.pages", "out.png", "out_2.png"])
+
+    def test_save_encoded_reports_write_errors(self):
+        pages = [Image.new("RGB", (8, 8))] * 3
+
+        with self.assertRaises(OSError):
+            save_encoded(pages, os.path.join(self.tmp, "missing", "out.png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
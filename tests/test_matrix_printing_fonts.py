@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from PIL import ImageFont
+
+from matrix_printing_fonts import FontRegistry
+
+
+def write_font(folder, name):
+    data = ImageFont.load_default(size=10).path.getvalue()
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class FontRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.folder = self.tmp.name
+
+    def test_lists_only_font_files_sorted(self):
+        write_font(self.folder, "b.ttf")
+        write_font(self.folder, "A.OTF")
+        open(os.path.join(self.folder, "notes.txt"), "w").close()
+
+        self.assertEqual(FontRegistry(self.folder).list_fonts(),
+                         ["A.OTF", "b.ttf"])
+
+    def test_missing_folder_lists_nothing(self):
+        missing = os.path.join(self.folder, "missing")
+
+        self.assertEqual(FontRegistry(missing).list_fonts(), [])
+
+    def test_reuses_loaded_font_for_same_size(self):
+        write_font(self.folder, "a.ttf")
+        registry = FontRegistry(self.folder)
+
+        font = registry.get("a.ttf", 20)
+
+        self.assertIs(registry.get("a.ttf", 20), font)
+        self.assertIsNot(registry.get("a.ttf", 21), font)
+        self.assertEqual(font.size, 20)
+
+    def test_reloads_font_when_file_changes(self):
+        path = write_font(self.folder, "a.ttf")
+        registry = FontRegistry(self.folder)
+        font = registry.get("a.ttf", 20)
+
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        self.assertIsNot(registry.get("a.ttf", 20), font)
+
+    def test_preload_warms_the_cache(self):
+        write_font(self.folder, "a.ttf")
+        registry = FontRegistry(self.folder)
+
+        registry.preload("a.ttf", 20).join()
+
+        self.assertEqual(len(registry), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 界面模块导入后检查哪些重量级模块已被加载
+SCRIPT = """
+import sys
+import matrix_printing_gui
+heavy = ("PIL", "numpy", "matrix_printing_render", "matrix_printing_calibrate")
+print(",".join(name for name in heavy if name in sys.modules))
+matrix_printing_gui.load_modules()
+print(",".join(name for name in heavy if name in sys.modules))
+"""
+
+
+class StartupImportTests(unittest.TestCase):
+    def test_heavy_modules_load_only_after_the_first_frame(self):
+        # 需要全新的解释器：同一进程中其他测试早已导入 PIL 和 numpy
+        output = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+
+        before, after = output.splitlines()
+        self.assertEqual(before, "")
+        self.assertEqual(after, "PIL,numpy,matrix_printing_render,"
+                                "matrix_printing_calibrate")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,22 @@
 import unittest
+from dataclasses import replace
 
-from matrix_printing_logic import calculate_grid_metrics, split_text_paragraphs
+from matrix_printing_logic import (
+    GridSettings,
+    IncrementalLayout,
+    calculate_grid_metrics,
+    diff_placements,
+    layout_cells,
+    layout_pages,
+    layout_text,
+    page_count,
+    paginate_cells,
+    split_text_paragraphs,
+)
+
+
+def square_bbox(char):
+    return (0, 0, 10, 10)
 
 
 class CalculateGridMetricsTests(unittest.TestCase):
@@ -43,5 +59,201 @@ class SplitTextParagraphsTests(unittest.TestCase):
         self.assertEqual(split_text_paragraphs(text), ["第一段", "第二段"])
 
 
+class GridSettingsTests(unittest.TestCase):
+    def test_parses_preset_strings(self):
+        settings = GridSettings.from_values({
+            "start_x": "132.0",
+            "start_y": "228.0",
+            "cell_width": "93.5",
+            "cell_height": "105.5",
+            "font_size": "60",
+            "offset_x": "1",
+            "offset_y": "-1",
+            "grid_columns": "16",
+            "grid_rows": "25",
+            "grid_line_thickness": "0.5",
+        })
+
+        self.assertEqual(settings.grid_columns, 16)
+        self.assertEqual(settings.pitch_x, 94.0)
+        self.assertEqual(settings.pitch_y, 106.0)
+        self.assertEqual(settings.cell_origin(17), (226.0, 334.0))
+
+    def test_scaled_shrinks_geometry_and_font(self):
+        settings = GridSettings(start_x=100, cell_width=90, font_size=60,
+                                grid_line_thickness=10, offset_x=4,
+                                grid_columns=16)
+
+        scaled = settings.scaled(0.25)
+
+        self.assertEqual(scaled.start_x, 25)
+        self.assertEqual(scaled.pitch_x, 25)
+        self.assertEqual(scaled.font_size, 15)
+        self.assertEqual(scaled.offset_x, 1)
+        self.assertEqual(scaled.grid_columns, 16)
+
+    def test_to_values_round_trips_through_from_values(self):
+        settings = GridSettings(start_x=132, start_y=228.25, cell_width=93.5,
+                                cell_height=105.5, grid_columns=16,
+                                grid_rows=25, font_size=60, offset_x=1,
+                                offset_y=-1, grid_line_thickness=0.5)
+
+        values = settings.to_values()
+
+        self.assertEqual(values["start_x"], "132.0")
+        self.assertEqual(values["offset_y"], "-1")
+        self.assertEqual(GridSettings.from_values(values),
+                         replace(settings, start_y=228.2))
+        self.assertEqual(settings.scaled(0.25).to_values()["offset_x"], "0")
+
+    def test_lenient_mode_falls_back_to_defaults(self):
+        settings = GridSettings.from_values(
+            {"start_x": "", "grid_columns": "12"}, strict=False)
+
+        self.assertEqual(settings.start_x, 0.0)
+        self.assertEqual(settings.grid_columns, 12)
+        self.assertEqual(settings.font_size, 30)
+
+    def test_strict_mode_rejects_missing_or_invalid_values(self):
+        with self.assertRaisesRegex(ValueError, "有效的数值"):
+            GridSettings.from_values({"start_x": "1"})
+
+        with self.assertRaisesRegex(ValueError, "有效的数值"):
+            GridSettings.from_values({"grid_columns": "abc"}, strict=False)
+
+
+class LayoutTests(unittest.TestCase):
+    def test_indents_first_paragraph_and_wraps_rows(self):
+        cells = layout_cells(["一二三四五"], columns=4)
+
+        self.assertEqual(
+            cells,
+            [(2, "一"), (3, "二"), (4, "三"), (5, "四"), (6, "五")],
+        )
+
+    def test_later_paragraphs_start_on_new_indented_row(self):
+        cells = layout_cells(["一", "二"], columns=4, first_line_indent=False)
+
+        self.assertEqual(cells, [(0, "一"), (6, "二")])
+
+    def test_first_line_newline_skips_a_row(self):
+        cells = layout_cells(["一"], columns=4, first_line_indent=False,
+                             first_line_newline=True)
+
+        self.assertEqual(cells, [(4, "一")])
+
+    def test_layout_text_centres_glyphs_in_cells(self):
+        settings = GridSettings(start_x=10, start_y=20, cell_width=19,
+                                cell_height=29, grid_columns=3,
+                                offset_x=1, offset_y=-1,
+                                first_line_indent=False)
+
+        placements = layout_text("甲乙\n丙", settings, square_bbox)
+
+        self.assertEqual(
+            placements,
+            [
+                (0, "甲", 16.0, 29.0),
+                (1, "乙", 36.0, 29.0),
+                (5, "丙", 56.0, 59.0),
+            ],
+        )
+
+
+class PaginationTests(unittest.TestCase):
+    def test_splits_cells_into_pages_with_local_indices(self):
+        cells = layout_cells(["一二三四五六七"], columns=3)
+
+        pages = list(paginate_cells(cells, cells_per_page=6))
+
+        self.assertEqual(page_count(cells, 6), 2)
+        self.assertEqual(pages[0], [(2, "一"), (3, "二"), (4, "三"), (5, "四")])
+        self.assertEqual(pages[1], [(0, "五"), (1, "六"), (2, "七")])
+
+    def test_paragraph_indent_carries_onto_next_page(self):
+        cells = layout_cells(["一二三", "四"], columns=3,
+                             first_line_indent=False)
+
+        pages = list(paginate_cells(cells, cells_per_page=3))
+
+        self.assertEqual(pages[1], [(2, "四")])
+
+    def test_empty_text_still_has_one_page(self):
+        self.assertEqual(list(paginate_cells([], 6)), [[]])
+
+    def test_rejects_empty_grid(self):
+        with self.assertRaisesRegex(ValueError, "正整数"):
+            page_count([(0, "一")], 0)
+
+    def test_layout_pages_places_each_page_from_the_top(self):
+        settings = GridSettings(cell_width=9, cell_height=9, grid_columns=2,
+                                grid_rows=1, grid_line_thickness=1,
+                                first_line_indent=False)
+
+        pages = list(layout_pages("甲乙丙", settings, square_bbox))
+
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[1], [(0, "丙", 0.0, 0.0)])
+
+
+class IncrementalLayoutTests(unittest.TestCase):
+    def setUp(self):
+        self.settings = GridSettings(cell_width=9, cell_height=9,
+                                     grid_columns=4, grid_rows=3)
+        self.measured = []
+
+        def bbox(char):
+            self.measured.append(char)
+            return square_bbox(char)
+
+        self.layout = IncrementalLayout(self.settings, bbox)
+
+    def assertMatchesFullLayout(self, text):
+        self.assertEqual(list(self.layout.pages()),
+                         list(layout_pages(text, self.settings, square_bbox)))
+
+    def test_matches_full_layout_across_edits(self):
+        for text in ["一二三", "一二三\n四五六七八", "一二三\n四五\n六七八",
+                     "一\n四五\n六七八", "", "甲乙丙丁戊己庚辛壬癸子丑寅卯"]:
+            self.layout.update(text)
+            self.assertMatchesFullLayout(text)
+
+    def test_only_changed_paragraph_is_measured_again(self):
+        self.layout.update("一二\n三四\n五六")
+        self.measured.clear()
+
+        self.layout.update("一二\n三四甲\n五六")
+
+        self.assertEqual(self.measured, ["三", "四", "甲"])
+        self.assertMatchesFullLayout("一二\n三四甲\n五六")
+
+    def test_reports_rows_touched_by_an_edit(self):
+        self.assertEqual(self.layout.update("一二\n三四\n五六"), (0, 3))
+
+        # 同一行内的修改只影响这一段所在的行
+        self.assertEqual(self.layout.update("一二\n三甲\n五六"), (1, 2))
+        # 段落变长后，后面的段落整体下移
+        self.assertEqual(self.layout.update("一二\n三甲乙丙\n五六"), (1, None))
+        self.assertIsNone(self.layout.update("一二\n三甲乙丙\n五六"))
+        self.assertEqual(self.layout.version, 3)
+
+    def test_diff_placements_lists_changed_cells(self):
+        self.layout.update("一二\n三四")
+        before = self.layout.page(0)
+        self.layout.update("一二\n三甲乙")
+        after = self.layout.page(0)
+
+        self.assertEqual(diff_placements(before, after), {7, 8})
+        self.assertEqual(diff_placements(after, after), set())
+
+    def test_page_count_follows_text_length(self):
+        self.layout.update("")
+        self.assertEqual(self.layout.page_count, 1)
+
+        self.layout.update("一" * 20)
+
+        self.assertEqual(self.layout.page_count, 2)
+
+
 if __name__ == "__main__":
     unittest.main()
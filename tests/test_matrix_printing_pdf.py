@@ -0,0 +1,96 @@
+import os
+import re
+import tempfile
+import unittest
+import zlib
+
+from PIL import Image
+
+from matrix_printing_pdf import PdfWriter, save_pdf
+
+
+def read_objects(data):
+    """Map object ids to their offsets according to the xref table."""
+    xref = int(re.search(rb"startxref\n(\d+)", data).group(1))
+    lines = data[xref:].split(b"\n")
+    count = int(lines[1].split()[1])
+    return {i: int(lines[2 + i].split()[0]) for i in range(1, count)}
+
+
+class PdfWriterTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "out.pdf")
+
+    def layer(self, box):
+        layer = Image.new("L", (300, 600), 0)
+        layer.paste(255, box)
+        return layer
+
+    def test_writes_one_page_per_layer_over_a_shared_background(self):
+        background = Image.new("RGB", (300, 600), "white")
+        layers = (self.layer((10, 10, 20, 20)) for _ in range(3))
+
+        count = save_pdf(self.path, layers, (300, 600), background=background)
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertEqual(count, 3)
+        self.assertTrue(data.startswith(b"%PDF-1.4"))
+        self.assertIn(b"/Type /Pages /Kids [", data)
+        self.assertIn(b"/Count 3", data)
+        self.assertEqual(data.count(b"/Filter /DCTDecode"), 1)
+        self.assertEqual(data.count(b"/Type /Page "), 3)
+        # 300 像素在 300 dpi 下是 72 磅
+        self.assertIn(b"/MediaBox [0 0 72.0000 144.0000]", data)
+
+    def test_xref_offsets_point_at_objects(self):
+        with PdfWriter(self.path, (300, 600)) as writer:
+            writer.add_page(self.layer((0, 0, 5, 5)))
+            writer.add_page(None)
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for object_id, offset in read_objects(data).items():
+            self.assertTrue(
+                data[offset:].startswith(b"%d 0 obj" % object_id))
+
+    def test_glyph_layer_is_stored_as_soft_mask(self):
+        layer = self.layer((0, 0, 300, 1))
+
+        with PdfWriter(self.path, (300, 600)) as writer:
+            writer.add_page(layer)
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertIn(b"/SMask", data)
+        streams = re.findall(rb"stream\n(.*?)\nendstream", data, re.S)
+        self.assertIn(layer.tobytes(),
+                      [zlib.decompress(stream) for stream in streams])
+
+    def test_rejects_layers_of_the_wrong_size(self):
+        with PdfWriter(self.path, (300, 600)) as writer:
+            with self.assertRaisesRegex(ValueError, "尺寸"):
+                writer.add_page(Image.new("L", (10, 10), 255))
+
+    def test_wrong_background_size_writes_nothing(self):
+        with self.assertRaisesRegex(ValueError, "尺寸"):
+            PdfWriter(self.path, (300, 600),
+                      background=Image.new("RGB", (10, 10)))
+
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_failed_export_leaves_no_partial_pdf(self):
+        def layers():
+            yield self.layer((10, 10, 20, 20))
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            save_pdf(self.path, layers(), (300, 600))
+
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
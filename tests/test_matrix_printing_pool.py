@@ -0,0 +1,27 @@
+import multiprocessing
+import unittest
+
+from matrix_printing_pool import worker_pool
+
+_state = {}
+
+
+def _init(value):
+    _state["value"] = value
+
+
+def _read(_):
+    return _state.get("value"), multiprocessing.get_start_method()
+
+
+class WorkerPoolTests(unittest.TestCase):
+    def test_workers_are_spawned_and_initialized_once(self):
+        with worker_pool(_init, ("warm",), workers=1) as pool:
+            results = set(pool.map(_read, range(4)))
+
+        self.assertEqual(results, {("warm", "spawn")})
+        self.assertNotIn("value", _state)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import os
+import tempfile
+import unittest
+
+from matrix_printing_presets import PresetLibrary, read_preset, write_preset
+
+VALUES = {
+    "start_x": "2.0", "start_y": "2.0", "cell_width": "19.0",
+    "cell_height": "19.0", "font_size": "16", "offset_x": "0",
+    "offset_y": "0", "grid_columns": "4", "grid_rows": "4",
+    "grid_line_thickness": "1.0",
+}
+
+
+class PresetLibraryTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = tmp.name
+
+    def write(self, name, values, bump=0):
+        path = os.path.join(self.folder, name)
+        with open(path, "w", encoding="utf-8") as f:
+            if isinstance(values, str):
+                f.write(values)
+            else:
+                json.dump(values, f, ensure_ascii=False)
+        if bump:
+            # 保证修改时间变化，不依赖文件系统的时间精度
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump))
+        return path
+
+    def test_indexes_presets_by_name(self):
+        self.write("作文本.json", VALUES)
+        self.write("notes.txt", "not a preset")
+
+        library = PresetLibrary(self.folder)
+
+        self.assertEqual(library.names(), ["作文本"])
+        settings = library.settings("作文本", first_line_indent=False)
+        self.assertEqual(settings.grid_columns, 4)
+        self.assertFalse(settings.first_line_indent)
+        with self.assertRaisesRegex(ValueError, "未找到参数预设"):
+            library.get("missing")
+
+    def test_refresh_reports_added_modified_and_removed(self):
+        path = self.write("a.json", VALUES)
+        library = PresetLibrary(self.folder)
+
+        self.assertEqual(library.refresh(), [])
+        self.write("a.json", dict(VALUES, font_size="18"), bump=10**9)
+        self.write("b.json", VALUES)
+        self.assertEqual(library.refresh(), ["a", "b"])
+        self.assertEqual(library.get("a").values["font_size"], "18")
+
+        os.remove(path)
+        self.assertEqual(library.refresh(), ["a"])
+        self.assertNotIn("a", library)
+
+    def test_touched_file_with_same_contents_is_not_reported(self):
+        self.write("a.json", VALUES)
+        library = PresetLibrary(self.folder)
+
+        self.write("a.json", VALUES, bump=10**9)
+
+        self.assertEqual(library.refresh(), [])
+
+    def test_broken_file_keeps_previous_contents(self):
+        self.write("a.json", VALUES)
+        library = PresetLibrary(self.folder)
+
+        self.write("a.json", "{", bump=10**9)
+        self.assertEqual(library.refresh(), [])
+        self.assertIn("a", library.errors)
+        self.assertEqual(library.get("a").values, VALUES)
+
+        self.write("a.json", VALUES, bump=2 * 10**9)
+        library.refresh()
+        self.assertEqual(library.errors, {})
+
+    def test_written_preset_is_indexed_on_refresh(self):
+        library = PresetLibrary(self.folder)
+
+        path = write_preset(library.path("新模板"), VALUES)
+
+        self.assertEqual(library.refresh(), ["新模板"])
+        self.assertEqual(read_preset(path).values, VALUES)
+        self.assertEqual(os.listdir(self.folder), ["新模板.json"])
+
+    def test_resolves_names_and_paths(self):
+        inside = self.write("a.json", VALUES)
+        outside_folder = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, outside_folder)
+        outside = os.path.join(outside_folder, "b.json")
+        with open(outside, "w", encoding="utf-8") as f:
+            json.dump(VALUES, f)
+        self.addCleanup(os.remove, outside)
+        library = PresetLibrary(self.folder)
+
+        self.assertIs(library.resolve("a"), library.get("a"))
+        self.assertIs(library.resolve(inside), library.get("a"))
+        self.assertEqual(library.resolve(outside).values, VALUES)
+        self.assertNotIn("b", library)
+        with self.assertRaises(ValueError):
+            library.resolve("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
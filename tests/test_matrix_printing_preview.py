@@ -0,0 +1,162 @@
+import threading
+import unittest
+
+from matrix_printing_preview import (
+    PreviewScheduler,
+    RenderCancelled,
+    RenderWorker,
+)
+
+
+class FakeWidget:
+    """Minimal stand-in for Tk's ``after``/``after_cancel``."""
+
+    def __init__(self):
+        self.timers = {}
+        self.next_id = 0
+
+    def after(self, delay_ms, callback):
+        self.next_id += 1
+        self.timers[self.next_id] = callback
+        return self.next_id
+
+    def after_cancel(self, after_id):
+        self.timers.pop(after_id, None)
+
+    def run_timers(self):
+        timers, self.timers = self.timers, {}
+        for callback in timers.values():
+            callback()
+
+
+class PreviewSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.widget = FakeWidget()
+        self.renders = []
+        self.scheduler = PreviewScheduler(
+            self.widget, lambda: self.renders.append(True))
+
+    def test_coalesces_burst_into_one_render(self):
+        for _ in range(5):
+            self.scheduler.request("var", "", "write")
+
+        self.assertEqual(len(self.widget.timers), 1)
+        self.widget.run_timers()
+
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual(self.scheduler.rendered, 1)
+        self.assertEqual(self.scheduler.skipped, 4)
+        self.assertFalse(self.scheduler.pending)
+
+    def test_hold_merges_requests_into_one_timer(self):
+        with self.scheduler.hold():
+            for _ in range(10):
+                self.scheduler.request()
+            self.assertEqual(self.widget.timers, {})
+            self.assertTrue(self.scheduler.pending)
+
+        self.assertEqual(len(self.widget.timers), 1)
+        self.widget.run_timers()
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual(self.scheduler.skipped, 9)
+
+    def test_hold_without_requests_schedules_nothing(self):
+        with self.scheduler.hold():
+            pass
+
+        self.assertEqual(self.widget.timers, {})
+        self.assertFalse(self.scheduler.pending)
+
+    def test_flush_renders_immediately(self):
+        self.scheduler.request()
+        self.scheduler.flush()
+
+        self.assertEqual(len(self.renders), 1)
+        self.assertEqual(self.widget.timers, {})
+
+    def test_cancel_drops_pending_render(self):
+        self.scheduler.request()
+        self.scheduler.cancel()
+        self.widget.run_timers()
+
+        self.assertEqual(self.renders, [])
+        self.assertEqual(self.scheduler.skipped, 1)
+
+
+class RenderWorkerTests(unittest.TestCase):
+    def test_renders_job_off_thread_and_reports_result(self):
+        threads = []
+
+        def render(job, is_cancelled):
+            threads.append(threading.current_thread())
+            return job * 2
+
+        worker = RenderWorker(render)
+        self.addCleanup(worker.stop)
+        generation = worker.submit(21)
+
+        self.assertEqual(worker.results.get(timeout=5), (generation, 42, None))
+        self.assertIsNot(threads[0], threading.main_thread())
+
+    def test_newer_job_cancels_in_flight_render(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def render(job, is_cancelled):
+            if job == "slow":
+                started.set()
+                release.wait(5)
+                if is_cancelled():
+                    raise RenderCancelled()
+            return job
+
+        worker = RenderWorker(render)
+        self.addCleanup(worker.stop)
+        worker.submit("slow")
+        started.wait(5)
+        generation = worker.submit("fast")
+        release.set()
+
+        self.assertEqual(worker.results.get(timeout=5),
+                         (generation, "fast", None))
+        self.assertTrue(worker.results.empty())
+        self.assertEqual(worker.cancelled, 1)
+
+    def test_stop_does_not_wait_for_a_long_render(self):
+        started = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+        cancelled = []
+
+        def render(job, is_cancelled):
+            started.set()
+            release.wait(5)
+            cancelled.append(is_cancelled())
+            raise RenderCancelled()
+
+        worker = RenderWorker(render)
+        worker.submit("slow")
+        started.wait(5)
+        worker.stop(timeout=0.05)
+
+        self.assertTrue(worker._thread.is_alive())
+        self.assertTrue(worker._thread.daemon)
+        release.set()
+        worker._thread.join(5)
+        self.assertEqual(cancelled, [True])
+
+    def test_errors_are_returned_not_raised(self):
+        def render(job, is_cancelled):
+            raise ValueError("boom")
+
+        worker = RenderWorker(render)
+        self.addCleanup(worker.stop)
+        worker.submit(None)
+
+        _, image, error = worker.results.get(timeout=5)
+        self.assertIsNone(image)
+        self.assertIsInstance(error, ValueError)
+
+
+if __name__ == "__main__":
+    unittest.main()
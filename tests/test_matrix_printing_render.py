@@ -0,0 +1,371 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image, ImageFont
+
+from matrix_printing_logic import (
+    GridSettings,
+    IncrementalLayout,
+    diff_placements,
+    layout_text,
+)
+from matrix_printing_render import (
+    GlyphCache,
+    LazyPage,
+    PreviewLayers,
+    dirty_boxes,
+    draw_grid,
+    draw_placements,
+    fit_page,
+    fit_to_canvas,
+    glyph_overlay,
+    grid_mask,
+    iter_glyph_layers,
+    iter_text_pages,
+    page_path,
+    redraw_rows,
+    save_pages,
+    unique_name,
+)
+
+
+def default_font(size=20):
+    return ImageFont.load_default(size=size)
+
+
+class GlyphCacheTests(unittest.TestCase):
+    def test_reuses_entries_for_repeated_characters(self):
+        cache = GlyphCache()
+        font = default_font()
+
+        first = cache.glyph(font, "A")
+        second = cache.glyph(font, "A")
+
+        self.assertIs(first, second)
+        self.assertEqual(first[0], font.getbbox("A"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_evicts_least_recently_used_glyph(self):
+        cache = GlyphCache(max_entries=2)
+        font = default_font()
+
+        cache.glyph(font, "A")
+        cache.glyph(font, "B")
+        cache.glyph(font, "A")
+        cache.glyph(font, "C")
+        cache.glyph(font, "A")
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.hits, 2)
+        cache.glyph(font, "B")
+        self.assertEqual(cache.misses, 4)
+
+    def test_blank_glyphs_have_no_mask(self):
+        _, mask = GlyphCache().glyph(default_font(), " ")
+
+        self.assertIsNone(mask)
+
+
+class DrawPlacementsTests(unittest.TestCase):
+    def test_cached_masks_match_direct_text_drawing(self):
+        font = default_font()
+        settings = GridSettings(cell_width=29, cell_height=29, grid_columns=4,
+                                grid_rows=2, first_line_indent=False)
+        placements = layout_text("ABCDEFG", settings, font.getbbox)
+
+        direct = draw_placements(Image.new("L", (120, 60), 255),
+                                 placements, font, fill=0)
+        cached = draw_placements(Image.new("L", (120, 60), 255),
+                                 placements, font, fill=0,
+                                 glyph_cache=GlyphCache())
+
+        self.assertEqual(direct.getbbox(), cached.getbbox())
+        self.assertEqual(
+            sum(direct.histogram()[:128]),
+            sum(cached.histogram()[:128]),
+        )
+
+    def test_draw_grid_marks_every_line(self):
+        settings = GridSettings(cell_width=9, cell_height=9, grid_columns=2,
+                                grid_rows=2, grid_line_thickness=1)
+        image = draw_grid(Image.new("L", (30, 30), 255), settings, fill=0)
+
+        for x in (0, 10, 20):
+            self.assertEqual(image.getpixel((x, 5)), 0)
+        self.assertEqual(image.getpixel((5, 5)), 255)
+
+    def test_grid_mask_shades_sub_pixel_thickness(self):
+        settings = GridSettings(start_x=2, start_y=2, cell_width=9.5,
+                                cell_height=9.5, grid_columns=2, grid_rows=2,
+                                grid_line_thickness=0.5)
+
+        mask = grid_mask((30, 30), settings)
+
+        self.assertEqual(mask.getpixel((2, 5)), 128)
+        self.assertEqual(mask.getpixel((12, 5)), 128)
+        self.assertEqual(mask.getpixel((5, 5)), 0)
+        # 网格外不画线
+        self.assertEqual(mask.getpixel((2, 28)), 0)
+        self.assertEqual(mask.getpixel((28, 2)), 0)
+
+
+class PaginatedRenderTests(unittest.TestCase):
+    def test_long_text_continues_on_new_pages(self):
+        settings = GridSettings(cell_width=19, cell_height=19, grid_columns=2,
+                                grid_rows=2, first_line_indent=False)
+        page = Image.new("L", (40, 40), 255)
+
+        pages = list(iter_text_pages(page, settings, "ABCDEFGHI",
+                                     default_font(), fill=0))
+
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(p.size == (40, 40) for p in pages))
+        self.assertEqual(page.getextrema(), (255, 255))
+
+    def test_redraw_rows_matches_full_render(self):
+        font = default_font()
+        settings = GridSettings(cell_width=19, cell_height=19, grid_columns=3,
+                                grid_rows=4, first_line_indent=False)
+        background = Image.new("RGB", (60, 80), "white")
+        grid = grid_mask(background.size, settings)
+
+        def full(text):
+            image = background.copy()
+            image.paste("red", (0, 0), grid)
+            placements = layout_text(text, settings, font.getbbox)
+            return draw_placements(image, placements, font, fill="blue")
+
+        layout = IncrementalLayout(settings, font.getbbox)
+        layout.update("ABC\nDEF")
+        dirty_rows = layout.update("ABC\nDXF")
+
+        updated = redraw_rows(full("ABC\nDEF"), background, grid, settings,
+                              layout.page(0), dirty_rows, font, fill="blue")
+
+        self.assertEqual(dirty_rows, (1, 3))
+        self.assertEqual(updated.tobytes(), full("ABC\nDXF").tobytes())
+
+    def test_redraw_rows_matches_full_render_at_half_pixels(self):
+        # 起点在半像素上时，分带重绘与整页绘制的取整必须一致
+        font = default_font(20)
+        glyph_cache = GlyphCache()
+        settings = GridSettings(start_x=1, start_y=5.5, cell_width=25,
+                                cell_height=25, grid_columns=6, grid_rows=6,
+                                first_line_indent=False)
+        background = Image.new("RGB", (160, 170), "white")
+        grid = grid_mask(background.size, settings)
+        measure = glyph_cache.measure(font)
+
+        def full(text):
+            image = background.copy()
+            image.paste("red", (0, 0), grid)
+            placements = layout_text(text, settings, measure)
+            return draw_placements(image, placements, font, fill="blue",
+                                   glyph_cache=glyph_cache)
+
+        layout = IncrementalLayout(settings, measure)
+        layout.update("ABC\nDEF\nGHI\nJKL\nMNO")
+        dirty_rows = layout.update("ABC\nDEF\nGHI\nJXL\nMNO")
+
+        updated = redraw_rows(full("ABC\nDEF\nGHI\nJKL\nMNO"), background,
+                              grid, settings, layout.page(0), dirty_rows, font,
+                              fill="blue", glyph_cache=glyph_cache)
+
+        self.assertEqual(dirty_rows, (3, 4))
+        self.assertEqual(updated.tobytes(),
+                         full("ABC\nDEF\nGHI\nJXL\nMNO").tobytes())
+
+    def test_dirty_boxes_cover_every_changed_pixel(self):
+        font = default_font()
+        settings = GridSettings(cell_width=19, cell_height=19, grid_columns=3,
+                                grid_rows=4, first_line_indent=False)
+        old = layout_text("ABC\nDEF", settings, font.getbbox)
+        new = layout_text("ABC\nDXF", settings, font.getbbox)
+        before = draw_placements(Image.new("RGB", (60, 80), "white"), old, font)
+        after = draw_placements(Image.new("RGB", (60, 80), "white"), new, font)
+
+        boxes = dirty_boxes({6}, old, new, settings, font.getbbox, after.size)
+
+        self.assertEqual(len(boxes), 1)
+        patched = before.copy()
+        for box in boxes:
+            patched.paste(after.crop(box), box[:2])
+        self.assertEqual(patched.tobytes(), after.tobytes())
+        self.assertEqual(dirty_boxes(set(), old, new, settings, font.getbbox,
+                                     after.size), [])
+
+    def test_redrawn_band_changes_only_inside_dirty_boxes(self):
+        # 预览只把 dirty_boxes 写入 PhotoImage，框外的像素必须与上一帧相同
+        font = default_font(20)
+        glyph_cache = GlyphCache()
+        settings = GridSettings(start_x=1, start_y=5.5, cell_width=25,
+                                cell_height=25, grid_columns=6, grid_rows=6,
+                                first_line_indent=False)
+        background = Image.new("RGB", (160, 170), "white")
+        grid = grid_mask(background.size, settings)
+        measure = glyph_cache.measure(font)
+        layout = IncrementalLayout(settings, measure)
+        layout.update("ABC\nDEF\nGHI\nJKL\nMNO")
+        old = layout.page(0)
+        base = background.copy()
+        base.paste("red", (0, 0), grid)
+        draw_placements(base, old, font, fill="blue", glyph_cache=glyph_cache)
+        dirty_rows = layout.update("ABC\nDEF\nGHI\nJXL\nMNO")
+        new = layout.page(0)
+
+        updated = redraw_rows(base.copy(), background, grid, settings, new,
+                              dirty_rows, font, fill="blue",
+                              glyph_cache=glyph_cache)
+        boxes = dirty_boxes(diff_placements(old, new), old, new, settings,
+                            lambda char: glyph_cache.glyph(font, char)[0],
+                            updated.size)
+
+        patched = base.copy()
+        for box in boxes:
+            patched.paste(updated.crop(box), box[:2])
+        self.assertEqual(patched.tobytes(), updated.tobytes())
+
+    def test_glyph_layers_hold_only_the_text(self):
+        settings = GridSettings(cell_width=19, cell_height=19, grid_columns=2,
+                                grid_rows=2, first_line_indent=False)
+
+        layers = list(iter_glyph_layers((40, 40), settings, "ABCDE",
+                                        default_font()))
+
+        self.assertEqual(len(layers), 2)
+        self.assertEqual(layers[0].mode, "L")
+        self.assertEqual(layers[0].getextrema()[0], 0)
+        self.assertGreater(layers[0].getextrema()[1], 128)
+
+    def test_glyph_overlay_modes(self):
+        layer = Image.new("L", (4, 1), 0)
+        layer.putpixel((0, 0), 255)
+        layer.putpixel((1, 0), 120)
+
+        bilevel = glyph_overlay(layer)
+        palette = glyph_overlay(layer, "P", color=(0, 0, 255)).convert("RGB")
+
+        self.assertEqual(bilevel.mode, "1")
+        self.assertEqual([bilevel.getpixel((x, 0)) for x in range(3)],
+                         [0, 255, 255])
+        self.assertEqual(palette.getpixel((0, 0)), (0, 0, 255))
+        self.assertEqual(palette.getpixel((2, 0)), (255, 255, 255))
+        self.assertNotIn(palette.getpixel((1, 0)),
+                         [(0, 0, 255), (255, 255, 255)])
+        with self.assertRaises(ValueError):
+            glyph_overlay(layer, "RGB")
+
+    def test_save_pages_names_follow_up_pages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "essay.png")
+            images = (Image.new("L", (4, 4)) for _ in range(3))
+
+            paths = save_pages(images, path)
+
+            self.assertEqual(paths, [path, page_path(path, 2),
+                                     page_path(path, 3)])
+            self.assertTrue(all(os.path.exists(p) for p in paths))
+        self.assertEqual(page_path("out/a.png", 2), "out/a_2.png")
+
+    def test_shorter_export_removes_only_its_own_follow_up_pages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "essay.png")
+            save_pages((Image.new("L", (4, 4)) for _ in range(3)), path)
+            save_pages([Image.new("L", (4, 4))] * 2, path)
+            # 同名前缀的其他文件不是这次导出写的，不能删除
+            other = os.path.join(tmp, "notes.png")
+            save_pages([Image.new("L", (4, 4))], other)
+            Image.new("L", (4, 4)).save(page_path(other, 2))
+
+            paths = save_pages([Image.new("L", (4, 4))], path)
+            save_pages([Image.new("L", (4, 4))], other)
+
+            self.assertEqual(paths, [path])
+            self.assertEqual(sorted(os.listdir(tmp)),
+                             ["essay.png", "notes.png", "notes_2.png"])
+
+    def test_unique_names_do_not_collide(self):
+        names = {unique_name("output", ".png") for _ in range(1000)}
+
+        self.assertEqual(len(names), 1000)
+        self.assertTrue(all(name.startswith("output_") and name.endswith(".png")
+                            for name in names))
+
+
+class PreviewLayersTests(unittest.TestCase):
+    def test_background_is_scaled_once_per_page_and_canvas(self):
+        layers = PreviewLayers()
+        page = Image.new("P", (400, 800))
+
+        first = layers.background(page, (100, 100))
+
+        self.assertEqual(first.size, (50, 100))
+        self.assertEqual(first.mode, "RGB")
+        self.assertIs(layers.background(page, (100, 100)), first)
+        self.assertIsNot(layers.background(page, (200, 200)), first)
+
+    def test_new_page_invalidates_scaled_backgrounds(self):
+        layers = PreviewLayers()
+        first = layers.background(Image.new("RGB", (100, 100)), (50, 50))
+
+        second = layers.background(Image.new("RGB", (100, 100)), (50, 50))
+
+        self.assertIsNot(first, second)
+
+    def test_grid_mask_is_reused_for_same_geometry(self):
+        layers = PreviewLayers()
+        settings = GridSettings(cell_width=9, cell_height=9, grid_columns=2,
+                                grid_rows=2)
+
+        mask = layers.grid((30, 30), settings)
+
+        self.assertIs(layers.grid((30, 30), settings), mask)
+        self.assertIs(layers.grid((30, 30), settings.scaled(1)), mask)
+        self.assertEqual(mask.getpixel((10, 5)), 255)
+
+
+class LazyPageTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "page.png")
+        self.source = Image.new("RGB", (300, 400), "white")
+        self.source.paste((200, 30, 30), (100, 100, 200, 300))
+        self.source.save(self.path)
+
+    def test_size_is_known_without_decoding(self):
+        page = LazyPage(self.path)
+
+        self.assertEqual(page.size, (300, 400))
+        self.assertEqual(page.with_output_size((800, 600)).size, (800, 600))
+
+    def test_materialize_matches_fit_page(self):
+        for size in ("original", (800, 600)):
+            page = LazyPage(self.path, size)
+
+            self.assertEqual(page.materialize().tobytes(),
+                             fit_page(self.source, size).tobytes())
+
+    def test_preview_matches_scaled_page(self):
+        for size in ("original", (600, 600)):
+            preview = LazyPage(self.path, size).preview((150, 150))
+            expected = fit_to_canvas(fit_page(self.source, size), (150, 150))
+
+            self.assertEqual(preview.size, expected.size)
+            self.assertEqual(preview.mode, "RGB")
+            self.assertEqual(preview.getpixel((75, 75)), expected.getpixel((75, 75)))
+            self.assertEqual(preview.getpixel((2, 2)), (255, 255, 255))
+
+    def test_preview_layers_decode_lazy_pages(self):
+        layers = PreviewLayers()
+        page = LazyPage(self.path)
+
+        first = layers.background(page, (150, 150))
+
+        self.assertEqual(first.size, (112, 150))
+        self.assertIs(layers.background(page, (150, 150)), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import ExitStack
+
+from PIL import Image, ImageFont
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_server import RenderService, serve
+
+PRESET = {
+    "start_x": "10", "start_y": "10", "cell_width": "38",
+    "cell_height": "38", "font_size": "24", "offset_x": "0",
+    "offset_y": "0", "grid_columns": "5", "grid_rows": "6",
+    "grid_line_thickness": "2",
+}
+
+
+async def http(port, method, path, payload=None, length=None):
+    """Send one request and return ``(status, headers, body)``.
+
+    ``length`` overrides the Content-Length header.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = b"" if payload is None else (
+        payload if isinstance(payload, bytes)
+        else json.dumps(payload).encode("utf-8"))
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\n"
+                 f"Content-Length: {len(body) if length is None else length}"
+                 "\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    lines = head.decode("utf-8").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+class RenderServiceTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        for folder in ("config", "fonts"):
+            os.makedirs(os.path.join(self.tmp, folder))
+        with open(os.path.join(self.tmp, "config", "练习.json"), "w",
+                  encoding="utf-8") as f:
+            json.dump(PRESET, f)
+        with open(os.path.join(self.tmp, "fonts", "font.ttf"), "wb") as f:
+            f.write(ImageFont.load_default(size=10).path.getvalue())
+
+        self.service = RenderService(
+            os.path.join(self.tmp, "config"), os.path.join(self.tmp, "fonts"),
+            os.path.join(self.tmp, "output"), os.path.join(self.tmp, "uploads"),
+            workers=1, queue_size=1,
+            cache=RenderCache(os.path.join(self.tmp, "cache")))
+        self.server = await serve(self.service, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.service.close()
+
+    async def test_renders_png_on_blank_grid_paper(self):
+        request = {"preset": "练习", "text": "ABC", "size": "300x400"}
+
+        first, second = await asyncio.gather(
+            http(self.port, "POST", "/render", request),
+            http(self.port, "POST", "/render", request))
+
+        for status, headers, body in (first, second):
+            self.assertEqual(status, 200)
+            self.assertEqual(headers["Content-Type"], "image/png")
+            self.assertIn("render;dur=", headers["Server-Timing"])
+            with Image.open(io.BytesIO(body)) as page:
+                self.assertEqual(page.size, (300, 400))
+        names = {first[1]["X-Output-Name"], second[1]["X-Output-Name"]}
+        self.assertEqual(len(names), 2)
+        self.assertEqual(set(os.listdir(os.path.join(self.tmp, "output"))), names)
+
+    async def test_uploaded_background_is_stored_once_and_rendered_as_pdf(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (200, 260), "lightyellow").save(buffer, "PNG")
+        request = {"preset": "练习", "text": "A", "format": "pdf",
+                   "background": base64.b64encode(buffer.getvalue()).decode()}
+
+        for _ in range(2):
+            status, headers, body = await http(self.port, "POST", "/render",
+                                               request)
+            self.assertEqual(status, 200)
+            self.assertEqual(headers["Content-Type"], "application/pdf")
+            self.assertTrue(body.startswith(b"%PDF"))
+
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, "uploads"))), 1)
+
+    async def test_repeated_request_is_served_from_the_cache(self):
+        request = {"preset": "练习", "text": "ABC", "size": "300x400"}
+
+        _, first_headers, first = await http(self.port, "POST", "/render", request)
+        _, second_headers, second = await http(self.port, "POST", "/render",
+                                               request)
+
+        self.assertEqual(first_headers["X-Cache"], "MISS")
+        self.assertEqual(second_headers["X-Cache"], "HIT")
+        self.assertNotIn("render;dur=", second_headers["Server-Timing"])
+        self.assertEqual(first, second)
+        _, _, body = await http(self.port, "GET", "/stats")
+        self.assertEqual(json.loads(body)["cache"]["hits"], 1)
+
+    async def test_encoding_selects_format_and_cache_entry(self):
+        request = {"preset": "练习", "text": "ABC", "size": "300x400"}
+
+        _, _, png = await http(self.port, "POST", "/render", request)
+        status, headers, body = await http(self.port, "POST", "/render",
+                                           dict(request, encoding="tiff-g4"))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "image/tiff")
+        self.assertEqual(headers["X-Cache"], "MISS")
+        self.assertTrue(headers["X-Output-Name"].endswith(".tif"))
+        with Image.open(io.BytesIO(body)) as page:
+            self.assertEqual(page.mode, "1")
+        self.assertLess(len(body), len(png))
+
+    async def test_rejects_bad_requests(self):
+        cases = [
+            ("POST", "/render", {"preset": "missing", "text": "A"}, 404),
+            ("POST", "/render", b"{not json", 400),
+            ("POST", "/render", {"preset": "练习"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A", "size": "A9"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A",
+                                 "encoding": "gif"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A",
+                                 "encoding": "jpeg", "quality": "high"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A",
+                                 "background": "not base64!"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A",
+                                 "first_line_indent": "false"}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A",
+                                 "first_line_newline": 1}, 400),
+            ("POST", "/render", {"preset": "练习", "text": "A", "page": 0}, 400),
+            ("GET", "/render", None, 405),
+            ("GET", "/nowhere", None, 404),
+        ]
+        for method, path, payload, expected in cases:
+            status, _, body = await http(self.port, method, path, payload)
+            self.assertEqual(status, expected, (path, payload))
+            self.assertIn("error", json.loads(body))
+
+        for length in ("-5", "many"):
+            status, _, body = await http(self.port, "POST", "/render",
+                                         length=length)
+            self.assertEqual(status, 400, length)
+            self.assertIn("error", json.loads(body))
+        # 参数有误的请求在渲染之前就被拒绝
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "output")), [])
+
+    async def test_full_queue_answers_503_immediately(self):
+        with ExitStack() as stack:
+            for _ in range(self.service.capacity):
+                stack.enter_context(self.service.admit())
+            status, headers, _ = await http(
+                self.port, "POST", "/render", {"preset": "练习", "text": "A"})
+
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["Retry-After"], "1")
+        self.assertEqual(self.service.rejected, 1)
+        self.assertEqual(self.service.pending, 0)
+
+    async def test_stats_and_presets(self):
+        await http(self.port, "POST", "/render", {"preset": "练习", "text": "A"})
+
+        _, _, body = await http(self.port, "GET", "/presets")
+        self.assertEqual(json.loads(body)["presets"], ["练习"])
+        _, _, body = await http(self.port, "GET", "/stats")
+        stats = json.loads(body)
+        self.assertEqual(stats["stages"]["render"]["count"], 1)
+        self.assertEqual(stats["capacity"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
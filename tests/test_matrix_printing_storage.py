@@ -0,0 +1,110 @@
+import os
+import tempfile
+import time
+import unittest
+
+from matrix_printing_cache import RenderCache
+from matrix_printing_storage import DAY, Quota, StorageManager
+
+
+class StorageManagerTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.uploads = self.path("uploads")
+        self.now = time.time()
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def write(self, name, data, age_days=0):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        mtime = self.now - age_days * DAY
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_uploads_are_stored_once_by_content(self):
+        storage = StorageManager(self.uploads, {})
+        first = storage.store_upload(self.write("a/sheet.PNG", b"sheet"))
+        again = storage.store_upload(self.write("b/copy.png", b"sheet"))
+        other = storage.store_upload(self.write("c/sheet.png", b"other"))
+        in_memory = storage.store_bytes(b"sheet", ".png")
+
+        self.assertEqual(first, again)
+        self.assertEqual(first, in_memory)
+        self.assertNotEqual(first, other)
+        self.assertTrue(os.path.basename(first).startswith("upload_"))
+        self.assertTrue(first.endswith(".png"))
+        self.assertEqual(len(os.listdir(self.uploads)), 2)
+
+    def test_expired_files_are_removed_outside_excluded_folders(self):
+        old = self.write("uploads/upload_old.png", b"x", age_days=10)
+        recent = self.write("uploads/upload_new.png", b"x", age_days=1)
+        sample = self.write("uploads/Z.png", b"x", age_days=100)
+        cached = self.write("output/cache/k/1.png", b"x", age_days=100)
+        export = self.write("output/old.png", b"x", age_days=100)
+        storage = StorageManager(self.uploads, {
+            self.uploads: Quota(max_age_days=7, prefixes=("upload_",)),
+            self.path("output"): Quota(max_age_days=30, exclude=("cache",)),
+        })
+
+        self.assertEqual(storage.sweep(self.now), (2, 2))
+
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(export))
+        for path in (recent, sample, cached):
+            self.assertTrue(os.path.exists(path))
+        self.assertEqual(storage.stats()["removed"], 2)
+
+    def test_size_quota_evicts_least_recently_used_first(self):
+        paths = [self.write(f"output/{name}.png", b"x" * 100, age_days=age)
+                 for name, age in (("a", 3), ("b", 2), ("c", 1), ("d", 0))]
+        storage = StorageManager(self.uploads,
+                                 {self.path("output"): Quota(max_bytes=250)})
+        storage.protect(paths[0])
+
+        removed, freed = storage.enforce(self.path("output"),
+                                         storage.quotas[self.path("output")],
+                                         self.now)
+
+        # a 受保护，d 刚写入；依次删除 b、c 后降到上限以内
+        self.assertEqual((removed, freed), (2, 200))
+        self.assertEqual(sorted(os.listdir(self.path("output"))),
+                         ["a.png", "d.png"])
+
+    def test_reusing_an_upload_makes_it_recent(self):
+        storage = StorageManager(self.uploads, {
+            self.uploads: Quota(max_age_days=7)})
+        path = storage.store_upload(self.write("sheet.png", b"sheet"))
+        os.utime(path, (self.now - 10 * DAY,) * 2)
+
+        self.assertEqual(storage.store_upload(self.path("sheet.png")), path)
+        storage.sweep()
+
+        self.assertTrue(os.path.exists(path))
+
+    def test_background_thread_indexes_caches_and_sweeps(self):
+        cache = RenderCache(self.path("output/cache"))
+        os.makedirs(self.path("output/cache/.tmp-leftover"))
+        old = self.write("output/old.png", b"x", age_days=100)
+        storage = StorageManager(
+            self.uploads,
+            {self.path("output"): Quota(max_age_days=30, exclude=("cache",))},
+            caches=(cache,))
+
+        storage.start()
+        deadline = time.time() + 5
+        while storage.stats()["sweeps"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        storage.stop()
+
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(os.listdir(self.path("output/cache")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
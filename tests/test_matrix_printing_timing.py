@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from matrix_printing_timing import StageTimings
+
+
+class StageTimingsTests(unittest.TestCase):
+    def test_stage_adds_duration_to_totals_and_frame(self):
+        timings = StageTimings()
+        frame = {}
+
+        with timings.stage("layout", frame):
+            pass
+        with timings.stage("layout", frame):
+            pass
+        timings.record("draw", 0.5, frame)
+
+        summary = timings.summary()
+        self.assertEqual(summary["layout"]["count"], 2)
+        self.assertEqual(summary["draw"]["max_s"], 0.5)
+        self.assertEqual(set(frame), {"layout", "draw"})
+        self.assertAlmostEqual(frame["layout"], summary["layout"]["total_s"])
+
+    def test_stage_is_recorded_when_the_block_raises(self):
+        timings = StageTimings()
+
+        with self.assertRaises(ValueError):
+            with timings.stage("font"):
+                raise ValueError("bad font")
+
+        self.assertEqual(timings.summary()["font"]["count"], 1)
+
+    def test_ring_buffers_keep_only_recent_entries(self):
+        timings = StageTimings(capacity=3, max_errors=2)
+        for number in range(5):
+            timings.record("draw", number)
+            timings.finish({"draw": number})
+            timings.error("draw", RuntimeError(str(number)))
+
+        summary = timings.summary()["draw"]
+        self.assertEqual(summary["count"], 5)
+        self.assertEqual(summary["recent_median_s"], 3)
+        self.assertEqual(list(timings.frames), [{"draw": 2}, {"draw": 3},
+                                                {"draw": 4}])
+        self.assertEqual(timings.last_frame, {"draw": 4})
+        self.assertEqual([e["message"] for e in timings.errors], ["3", "4"])
+
+    def test_records_from_several_threads(self):
+        timings = StageTimings()
+
+        def work():
+            for _ in range(1000):
+                timings.record("draw", 0.001)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(timings.summary()["draw"]["count"], 4000)
+
+    def test_dump_writes_json_snapshot(self):
+        timings = StageTimings()
+        timings.record("latency", 0.02)
+        timings.error("preview", OSError("磁盘已满"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = timings.dump(os.path.join(tmp, "logs", "timings.json"))
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+
+        self.assertEqual(snapshot["stages"]["latency"]["count"], 1)
+        self.assertEqual(snapshot["errors"][0]["type"], "OSError")
+        self.assertEqual(snapshot["errors"][0]["message"], "磁盘已满")
+
+
+if __name__ == "__main__":
+    unittest.main()